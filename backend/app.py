@@ -1,159 +1,612 @@
-import asyncio
-import httpx
-from scripts.utils.rationale import PROMPT_TMPL, LLM_MODEL, LLM_URL, LLM_TEMP, LLM_MAX
-def embedding(model_id: str, text: str):
-    """
-    Returns the embedding vector for the given text using the specified model_id.
-    The output is a list of float32, suitable for pgvector, and can be cast to ::vector in SQL.
-    """
-    # For now, only one model is loaded, but model_id is kept for API compatibility
-    vec = model.encode([text], normalize_embeddings=True)[0]
-    return np.asarray(vec, dtype=np.float32).tolist()
-
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from pydantic import BaseModel
-from typing import List, Dict
-import json, os, time, pickle
+from typing import List, Dict, Literal
+import asyncio, contextlib, json, os, time
 import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
-from scipy.sparse import csr_matrix
 
-# For vector search
-from sentence_transformers import SentenceTransformer
-from pgvector.psycopg2 import register_vector
-from scripts.utils.db import get_pg_conn
+from scripts.utils.db import get_async_pg_pool, PG_EF_SEARCH
+from scripts.utils.pg_utils import get_index_version_async
+from scripts.utils.manifest import read_index_version
+from scripts.utils.index_store import read_format
+from scripts.utils.vector_index import load_vector_index, category_of
+from scripts.utils.catalog import CodeCatalog
+from scripts.utils.tfidf import TfidfIndex
+from scripts.utils.bm25 import BM25Index
+from scripts.utils.fusion import fuse, max_pool
+from scripts.utils.preprocess import PreparedNote, prepare_note, prepare_notes
+from scripts.utils.rationale import RationaleEngine
+from scripts.utils.rerank import CrossEncoderReranker, RerankTimeout, RERANK_MODEL
+from scripts.utils.embedder import load_embedder as load_embedder_backend, EMBED_BACKEND, default_onnx_dir
+from backend.batching import MicroBatcher
+from backend.components import LazyComponent, AsyncLazyComponent, ComponentUnavailable
+from backend.executor import CPU_EXECUTOR, run_cpu
+from backend.query_cache import QueryCache
+from backend.metrics import stage, start_request, observe_request, register_stats, render, SamplingProfiler, PROFILE
 
 # -----------------------------------------------------------------------------
-# Load artifacts (TF-IDF only)
+# Config
 # -----------------------------------------------------------------------------
 INDEX_DIR = os.getenv("AUTOCODER_INDEX_DIR", "data/index")
-CODES_META_PATH = os.path.join(INDEX_DIR, "codes_meta.json")
-VEC_PATH = os.path.join(INDEX_DIR, "tfidf_vectorizer.pkl")
-MAT_PATH = os.path.join(INDEX_DIR, "tfidf_matrix.pkl")
 
-with open(CODES_META_PATH, "r") as f:
-    CODES = json.load(f)
+# Written by build_index.py; compared against Postgres to catch stale artifacts
+INDEX_VERSION = read_index_version(INDEX_DIR)
+if INDEX_VERSION is None:
+    print(f"No index version in {INDEX_DIR}; artifacts predate manifest.json, rebuild to track staleness.")
 
-with open(VEC_PATH, "rb") as f:
-    VEC = pickle.load(f)
+MODEL_NAME = os.getenv("AUTOCODER_MODEL_NAME", "sentence-transformers/all-MiniLM-L6-v2")
+# torch | onnx | onnx-int8 (AUTOCODER_EMBED_BACKEND); ONNX files from build_index.py --export-onnx
+ONNX_DIR = os.getenv("AUTOCODER_ONNX_DIR", default_onnx_dir(INDEX_DIR))
+# Concurrent /suggest calls are merged into shared encode batches
+EMBED_BATCH_MAX = int(os.getenv("AUTOCODER_EMBED_BATCH_MAX", "32"))
+EMBED_BATCH_WAIT_MS = float(os.getenv("AUTOCODER_EMBED_BATCH_WAIT_MS", "5"))
+# Dummy encode right after loading, so the first request skips the warmup cost
+EMBED_WARMUP = os.getenv("AUTOCODER_EMBED_WARMUP", "1") == "1"
+# Start loading every component in the background at startup; with 0 each
+# one loads on the first request that needs it
+PRELOAD = os.getenv("AUTOCODER_PRELOAD", "1") == "1"
+# Optional cross-encoder rerank stage (needs AUTOCODER_RERANK_MODEL)
+RERANK_BUDGET_MS = float(os.getenv("AUTOCODER_RERANK_BUDGET_MS", "300"))
+# pgvector (default) | faiss | numpy | category (two-stage: category centroids, then
+# exact search inside the best categories; see scripts/utils/vector_index.py) |
+# multi (title / description / synonym vectors per code; scripts/utils/multi_vector.py)
+VECTOR_BACKEND = os.getenv("AUTOCODER_VECTOR_BACKEND", "pgvector")
+# pgvector: search icd10_vectors (build_index.py --multi-vector) instead of icd10_meta,
+# taking the best of a code's vectors among the OVERFETCH * top_k nearest
+PG_MULTI_VECTOR = os.getenv("AUTOCODER_PG_MULTI_VECTOR", "0") == "1"
+PG_MV_OVERFETCH = int(os.getenv("AUTOCODER_PG_MV_OVERFETCH", "4"))
 
-with open(MAT_PATH, "rb") as f:
-    MAT = pickle.load(f)  # sparse matrix shape (n_codes, n_features)
+# An HNSW scan returns at most hnsw.ef_search rows (at most 1000 in pgvector),
+# so deeper LIMITs raise it for the query's transaction
+HNSW_MAX_EF_SEARCH = 1000
 
-    # -----------------------------------------------------------------------------
-    # Load embedding model and PostgreSQL connection for vector search
-    # -----------------------------------------------------------------------------
-MODEL_NAME = os.getenv("AUTOCODER_MODEL_NAME", "sentence-transformers/all-MiniLM-L6-v2")
-model = None
-pg_conn = None
-try:
-    model = SentenceTransformer(MODEL_NAME)
-    pg_conn = get_pg_conn()
-    if pg_conn:
-        register_vector(pg_conn)
-        print("Loaded embedding model and connected to PostgreSQL for vector search.")
-except Exception as e:
-    print(f"Vector search setup failed: {e}")
+# kNN over a batch of query vectors; asyncpg prepares it once per pooled connection
+KNN_BATCH_QUERY = """
+SELECT q.idx, c.code, c.title, c.description,
+       1 - (m.embedding <=> q.vec) AS confidence
+FROM unnest($1::vector[]) WITH ORDINALITY AS q(vec, idx)
+CROSS JOIN LATERAL (
+    SELECT code, embedding FROM icd10_meta
+    ORDER BY embedding <=> q.vec
+    LIMIT $2
+) m
+JOIN icd10_codes c ON c.code = m.code
+ORDER BY q.idx, m.embedding <=> q.vec
+"""
+# Same over icd10_vectors: nearest $3 vectors, max similarity per code, top $2 codes
+KNN_MV_BATCH_QUERY = """
+SELECT q.idx, c.code, c.title, c.description, m.confidence
+FROM unnest($1::vector[]) WITH ORDINALITY AS q(vec, idx)
+CROSS JOIN LATERAL (
+    SELECT v.code, max(1 - (v.embedding <=> q.vec::halfvec)) AS confidence
+    FROM (
+        SELECT code, embedding FROM icd10_vectors
+        ORDER BY embedding <=> q.vec::halfvec
+        LIMIT $3
+    ) v
+    GROUP BY v.code
+    ORDER BY confidence DESC
+    LIMIT $2
+) m
+JOIN icd10_codes c ON c.code = m.code
+ORDER BY q.idx, m.confidence DESC
+"""
+
+# -----------------------------------------------------------------------------
+# Components (built lazily, once, on first use; see backend/components.py)
+# -----------------------------------------------------------------------------
+def load_catalog():
+    read_format(INDEX_DIR)  # fails fast on pre-mmap (pickle/JSON) artifacts
+    # All memory-mapped: workers share these pages instead of private copies
+    return CodeCatalog.load(INDEX_DIR)
+
+def load_embedder():
+    model = load_embedder_backend(MODEL_NAME, EMBED_BACKEND, ONNX_DIR)
+    if EMBED_WARMUP:
+        model.encode(["warmup"])
+    return model
+
+async def load_pg_pool():
+    pool = await get_async_pg_pool()
+    if pool is not None:
+        async with pool.acquire() as conn:
+            pg_version = await get_index_version_async(conn)
+        if pg_version != INDEX_VERSION:
+            print(f"WARNING: stale index: PostgreSQL has version {pg_version}, {INDEX_DIR} has {INDEX_VERSION}. Re-run scripts/build_index.py.")
+    return pool
+
+def load_local_vectors():
+    index, code_ids = load_vector_index(VECTOR_BACKEND, INDEX_DIR)
+    n = len(CATALOG.require())
+    if len(code_ids) != n or len(index) != n:
+        raise RuntimeError("vector index is not aligned with the code catalog; rebuild the index")
+    return index
+
+CATALOG = LazyComponent("catalog", load_catalog)
+TFIDF = LazyComponent("tfidf", lambda: TfidfIndex.load(INDEX_DIR), required=False)
+BM25 = LazyComponent("bm25", lambda: BM25Index.load(INDEX_DIR), required=False)
+EMBEDDER = LazyComponent("embedder", load_embedder)
+if VECTOR_BACKEND == "pgvector":
+    # asyncpg pool: created on the event loop, queried without a thread
+    VECTORS = AsyncLazyComponent("pgvector", load_pg_pool)
+else:
+    VECTORS = LazyComponent(VECTOR_BACKEND, load_local_vectors)
+RERANKER = LazyComponent("reranker", lambda: CrossEncoderReranker(RERANK_MODEL) if RERANK_MODEL else None, required=False)
+# Cheap to build (the HTTP client inside is itself created on first use)
+LLM = LazyComponent("llm", RationaleEngine, required=False)
+
+COMPONENTS = [CATALOG, TFIDF, BM25, EMBEDDER, VECTORS, RERANKER, LLM]
+
+def embed_batch(texts: List[str]) -> np.ndarray:
+    """
+    Encodes many texts in a single embedder call (torch or ONNX backend).
+    Returns a (len(texts), dim) float32 array of unit-norm vectors.
+    """
+    return EMBEDDER.require().encode(list(texts), batch_size=EMBED_BATCH_MAX)
+
+def embedding(model_id: str, text: str):
+    """
+    Returns the embedding vector for the given text using the specified model_id.
+    The output is a list of float32, suitable for pgvector, and can be cast to ::vector in SQL.
+    """
+    # For now, only one model is loaded, but model_id is kept for API compatibility
+    return embed_batch([text])[0].tolist()
+
+async def preload():
+    # Catalog first: the local vector engines check alignment against it
+    await CATALOG.aget()
+    await asyncio.gather(*(c.aget() for c in COMPONENTS if c is not CATALOG))
+
+@asynccontextmanager
+async def lifespan(app):
+    # Startup returns immediately; /readyz reports progress
+    task = asyncio.create_task(preload()) if PRELOAD else None
+    yield
+    if task is not None and not task.done():
+        task.cancel()
+    llm = LLM.peek()
+    if llm is not None:
+        await llm.aclose()
+    if VECTOR_BACKEND == "pgvector" and VECTORS.peek() is not None:
+        await VECTORS.peek().close()
 
 # -----------------------------------------------------------------------------
 # FastAPI app + schemas
 # -----------------------------------------------------------------------------
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
+# Repeated notes skip encode (embedding tier) or all of retrieval (result tier)
+QUERY_CACHE = QueryCache(INDEX_VERSION, embedder_id=f"{MODEL_NAME}|{EMBED_BACKEND}")
+embed_batcher = MicroBatcher(embed_batch, max_batch=EMBED_BATCH_MAX, max_wait_ms=EMBED_BATCH_WAIT_MS,
+                             executor=CPU_EXECUTOR)
+# Opt-in debugging: AUTOCODER_PROFILE=1 profiles the whole process during every
+# AUTOCODER_PROFILE_EVERY-th request (see SamplingProfiler; not per-request)
+if PROFILE:
+    app.middleware("http")(SamplingProfiler())
 
-class SuggestReq(BaseModel):
-    note: str
+class RetrievalParams(BaseModel):
     top_k: int = 5
+    # dense = vector kNN, lexical = BM25, hybrid = both merged by `fusion`
+    engine: Literal["dense", "lexical", "hybrid"] = "dense"
+    fusion: Literal["rrf", "weighted"] = "rrf"
+    dense_weight: float = 1.0
+    lexical_weight: float = 1.0
+    candidates: int = 50  # per-engine depth before fusion
+    rrf_k: int = 60
+    # Over-fetch rerank_candidates, rerank with the cross-encoder, keep top_k.
+    # If the budget runs out the first-stage order is returned instead.
+    rerank: bool = False
+    rerank_candidates: int = 50
+    rerank_budget_ms: float = RERANK_BUDGET_MS
+
+class SuggestReq(RetrievalParams):
+    note: str
+    debug: bool = False  # adds a per-stage latency breakdown ("stages", ms) and the preprocessed note
+    group_by_category: bool = False  # adds "categories": results grouped by 3-character category
+
+class SuggestBatchReq(RetrievalParams):
+    notes: List[str]
+    rationale: bool = False
+    debug: bool = False
+    group_by_category: bool = False
 
 # -----------------------------------------------------------------------------
 # Core retrieval (TF-IDF cosine similarity)
 # -----------------------------------------------------------------------------
 
+TFIDF_RATIONALE = "Text matches {title} with similarity {score:.2f}"
+
+def search_tfidf(notes: List[str], top_k: int = 5):
+    tfidf = TFIDF.get()
+    if tfidf is None:
+        return [[] for _ in notes]
+    scores, idx = tfidf.search_batch(notes, top_k)
+    catalog = CATALOG.require()
+    return [catalog.results(i, s, TFIDF_RATIONALE) for s, i in zip(scores, idx)]
+
 def retrieve_tfidf(note: str, top_k: int = 5):
-    query_vec = VEC.transform([note])  # 1 x d
-    sims = cosine_similarity(query_vec, MAT)  # shape (1, n_codes)
-    sims = sims[0]
-    idx = np.argsort(-sims)[:top_k]
-    results = []
-    for i in idx:
-        results.append({
-            "code": CODES[i]["code"],
-            "title": CODES[i]["title"],
-            "description": CODES[i].get("description", ""),
-            "confidence": float(sims[i]),
-            "rationale": f"Text matches {CODES[i]['title'].lower()} with similarity {sims[i]:.2f}"
-        })
-    return results
+    return search_tfidf([prepare_note(note).text], top_k)[0]
 
 # -----------------------------------------------------------------------------
 # Core retrieval (Vector DB, pgvector)
 # -----------------------------------------------------------------------------
-def retrieve_pgvector(note: str, top_k: int = 5):
-    if model is None or pg_conn is None:
-        return []
-    # Use the embedding utility for vector casting
-    q_vec = embedding(MODEL_NAME, note)
-    with pg_conn.cursor() as cur:
-        cur.execute("SET hnsw.ef_search = 100;")
-        cur.execute(
-            """
-            SELECT icd10_codes.code, icd10_codes.title, icd10_codes.description,
-                   1 - (embedding <=> %s::vector) AS confidence
-            FROM icd10_meta
-            JOIN icd10_codes ON icd10_meta.code = icd10_codes.code
-            ORDER BY embedding <=> %s::vector
-            LIMIT %s;
-            """,
-            (q_vec, q_vec, top_k)
-        )
-        rows = cur.fetchall()
-    results = []
-    for code, title, description, confidence in rows:
-        results.append({
+async def search_pgvector(q_vecs, top_k: int = 5):
+    """
+    Runs kNN for every query vector in one round trip.
+    Returns one result list per query vector, in input order.
+    """
+    out = [[] for _ in range(len(q_vecs))]
+    pg_pool = await VECTORS.aget()
+    if pg_pool is None or not len(q_vecs):
+        return out
+    vecs = [np.asarray(v, dtype=np.float32) for v in q_vecs]
+    limit = top_k * PG_MV_OVERFETCH if PG_MULTI_VECTOR else top_k
+    if limit > HNSW_MAX_EF_SEARCH:
+        print(f"kNN depth {limit} exceeds pgvector's hnsw.ef_search limit; "
+              f"the index returns at most {HNSW_MAX_EF_SEARCH} rows per query")
+    with stage("vector_search"):
+        async with pg_pool.acquire() as conn:
+            deep = limit > PG_EF_SEARCH
+            # Only deep queries pay for the transaction's BEGIN / COMMIT round trips
+            async with conn.transaction() if deep else contextlib.nullcontext():
+                if deep:
+                    await conn.execute(f"SET LOCAL hnsw.ef_search = {min(limit, HNSW_MAX_EF_SEARCH)}")
+                if PG_MULTI_VECTOR:
+                    rows = await conn.fetch(KNN_MV_BATCH_QUERY, vecs, top_k, limit)
+                else:
+                    rows = await conn.fetch(KNN_BATCH_QUERY, vecs, top_k)
+    for idx, code, title, description, confidence in rows:
+        out[idx - 1].append({
             "code": code,
             "title": title,
             "description": description,
             "confidence": float(confidence),
             "rationale": f"Vector similarity to {title.lower()} is {confidence:.2f}"
         })
-    return results
+    return out
+
+async def retrieve_pgvector(note: str, top_k: int = 5):
+    if not await vector_ready_async():
+        return []
+    chunks = prepare_note(note).chunks
+    return max_pool(await search_pgvector(await embed_queries(chunks), top_k), top_k)
+
+# -----------------------------------------------------------------------------
+# Core retrieval (in-process FAISS / NumPy)
+# -----------------------------------------------------------------------------
+def search_local(q_vecs, top_k: int = 5):
+    out = [[] for _ in range(len(q_vecs))]
+    index = VECTORS.get()
+    if index is None or not len(q_vecs):
+        return out
+    with stage("vector_search"):
+        scores, idx = index.search(np.asarray(q_vecs, dtype=np.float32), top_k)
+    catalog = CATALOG.require()
+    return [catalog.results(i, s, "Vector similarity to {title} is {score:.2f}") for s, i in zip(scores, idx)]
+
+def vector_ready() -> bool:
+    return EMBEDDER.get() is not None and VECTORS.get() is not None
+
+async def vector_ready_async() -> bool:
+    # Builds both on first use without blocking the event loop
+    return (await EMBEDDER.aget()) is not None and (await VECTORS.aget()) is not None
+
+async def search_vectors(q_vecs, top_k: int = 5):
+    """
+    Dispatches kNN to the engine selected by AUTOCODER_VECTOR_BACKEND:
+    awaited on the event loop for pgvector, on the CPU executor otherwise.
+    """
+    if VECTOR_BACKEND == "pgvector":
+        return await search_pgvector(q_vecs, top_k)
+    return await run_cpu(search_local, q_vecs, top_k)
+
+async def retrieve_vector(note: str, top_k: int = 5):
+    return (await dense_search(prepare_notes([note]), top_k))[0]
 
-    # ...existing code...
+# -----------------------------------------------------------------------------
+# Core retrieval (BM25 lexical)
+# -----------------------------------------------------------------------------
+BM25_RATIONALE = "Keywords match {title} (BM25 {score:.2f})"
+
+def search_bm25(notes: List[str], top_k: int = 5):
+    out = [[] for _ in notes]
+    bm25 = BM25.get()
+    if bm25 is None or not notes:
+        return out
+    with stage("bm25"):
+        if len(notes) == 1:
+            s, i = bm25.search(notes[0], top_k)
+            scores, idx = [s], [i]
+        else:
+            scores, idx = bm25.search_batch(notes, top_k)
+    catalog = CATALOG.require()
+    # Skip zero scores: no query term in common
+    return [catalog.results(i, s, BM25_RATIONALE, min_score=0.0) for s, i in zip(scores, idx)]
+
+def retrieve_bm25(note: str, top_k: int = 5):
+    return search_bm25([prepare_note(note).text], top_k)[0]
+
+# -----------------------------------------------------------------------------
+# Engine dispatch (dense / lexical / hybrid)
+# -----------------------------------------------------------------------------
+async def embed_queries(notes: List[str]):
+    """
+    Query vectors for notes, encoding only normalized notes that are not in
+    the embedding cache. The normalized text (aliases expanded) is what gets
+    encoded, so a cached vector is exactly what a fresh encode would give.
+    """
+    with stage("normalize"):
+        keys = [QUERY_CACHE.normalize(n) for n in notes]
+        vecs = {k: QUERY_CACHE.embeddings.get(k) for k in dict.fromkeys(keys)}
+    missing = [k for k, v in vecs.items() if v is None]
+    with stage("embed"):
+        if len(missing) == 1:
+            fresh = [await embed_batcher.submit(missing[0])]
+        elif missing:
+            # One encode call for the whole batch
+            fresh = await run_cpu(embed_batch, missing)
+    for k, v in zip(missing, fresh if missing else []):
+        vecs[k] = v
+        QUERY_CACHE.embeddings.set(k, v)
+    return [vecs[k] for k in keys]
+
+async def dense_search(prepared: List[PreparedNote], top_k: int):
+    """
+    Embeds every chunk of every note in one batch; each note's codes are
+    max-pooled over its chunks.
+    """
+    if not await vector_ready_async():
+        return [[] for _ in prepared]
+    chunks = [c for p in prepared for c in p.chunks]
+    hits = await search_vectors(await embed_queries(chunks), top_k)
+    out, i = [], 0
+    for p in prepared:
+        out.append(max_pool(hits[i:i + len(p.chunks)], top_k))
+        i += len(p.chunks)
+    return out
+
+async def first_stage(prepared: List[PreparedNote], params: RetrievalParams, top_k: int):
+    texts = [p.text for p in prepared]
+    if params.engine == "dense":
+        return await dense_search(prepared, top_k)
+    if params.engine == "lexical":
+        return await run_cpu(search_bm25, texts, top_k)
+    # Hybrid: run both engines concurrently, then fuse per note
+    depth = max(params.candidates, top_k)
+    dense, lexical = await asyncio.gather(
+        dense_search(prepared, depth),
+        run_cpu(search_bm25, texts, depth),
+    )
+    weights = [params.dense_weight, params.lexical_weight]
+    with stage("fuse"):
+        return [
+            fuse([d, l], method=params.fusion, weights=weights, top_k=top_k, rrf_k=params.rrf_k)
+            for d, l in zip(dense, lexical)
+        ]
+
+async def rerank(notes: List[str], candidates, budget_s: float):
+    """
+    Reranks all notes' candidates in one cross-encoder pass, or returns
+    `candidates` unchanged if that does not finish within budget_s.
+    Returns (results, reranked).
+
+    The worker gets the same deadline and stops between cross-encoder
+    batches once it passes, so a timed-out rerank frees its CPU_EXECUTOR
+    thread instead of finishing in the background.
+    """
+    reranker = RERANKER.peek()
+    if reranker is None or budget_s <= 0:
+        return candidates, False
+    deadline = time.monotonic() + budget_s
+    try:
+        with stage("rerank"):
+            return await asyncio.wait_for(
+                run_cpu(reranker.rerank_many, notes, candidates, CATALOG.require().search_texts_for, deadline),
+                timeout=budget_s,
+            ), True
+    except (asyncio.TimeoutError, RerankTimeout):
+        print(f"Rerank budget exceeded ({budget_s * 1000:.0f} ms); using first-stage order")
+        return candidates, False
+
+async def retrieve_uncached(prepared: List[PreparedNote], params: RetrievalParams):
+    """
+    Returns (results, complete); complete is False when an engine was
+    unavailable or the rerank budget ran out, so the results are not cached.
+    """
+    t0 = time.time()
+    await CATALOG.aget()
+    use_rerank = params.rerank and (await RERANKER.aget()) is not None
+    depth = max(params.rerank_candidates, params.top_k) if use_rerank else params.top_k
+    results = await first_stage(prepared, params, depth)
+    complete = (params.engine == "lexical" or vector_ready()) and (params.engine == "dense" or BM25.peek() is not None)
+    if use_rerank:
+        budget_s = params.rerank_budget_ms / 1000.0 - (time.time() - t0)
+        results, reranked = await rerank([p.text for p in prepared], results, budget_s)
+        complete = complete and reranked
+    return [r[:params.top_k] for r in results], complete
+
+async def retrieve(notes: List[str], params: RetrievalParams):
+    """Serves notes from the result cache and retrieves the rest together."""
+    settings = params.model_dump(include=set(RetrievalParams.model_fields))
+    with stage("preprocess"):
+        # Aliases expanded, negated findings dropped, long notes chunked
+        prepared = prepare_notes(notes)
+    with stage("result_cache"):
+        keys = [QUERY_CACHE.result_key(p.chunks, settings) for p in prepared]
+        out = [QUERY_CACHE.get_results(k) for k in keys]
+    todo = [i for i, r in enumerate(out) if r is None]
+    if todo:
+        fresh, complete = await retrieve_uncached([prepared[i] for i in todo], params)
+        for i, r in zip(todo, fresh):
+            out[i] = r
+            if complete:
+                QUERY_CACHE.set_results(keys[i], r)
+    return out
+
+def group_by_category(results):
+    """
+    Results grouped by ICD-10 category (A00 for A000), best category first.
+    The category title comes from the catalog when it lists the category code.
+    """
+    catalog = CATALOG.require()
+    groups = {}
+    for r in results:
+        cat = category_of(r["code"])
+        if cat not in groups:
+            row = catalog.row_of(cat)
+            groups[cat] = {"category": cat, "title": catalog.titles[row] if row is not None else None,
+                           "confidence": r["confidence"], "codes": []}
+        groups[cat]["codes"].append(r["code"])
+    return list(groups.values())
 
 # -----------------------------------------------------------------------------
 # Routes
 # -----------------------------------------------------------------------------
+@app.exception_handler(ComponentUnavailable)
+async def component_unavailable(request, exc):
+    return JSONResponse(status_code=503, content={"detail": str(exc)})
+
+
 @app.get("/healthz")
 def healthz():
-    return {"ok": True}
+    # Liveness only: answers as soon as the process is up
+    return {"ok": True, "index_version": INDEX_VERSION}
 
 
-def llm_rationale(note: str, code: str, title: str, timeout=6.0) -> str:
-    # try:
-    payload = {
-        "model": LLM_MODEL,
-        "prompt": PROMPT_TMPL.format(note=note, code=code, title=title),
-        "options": {"temperature": LLM_TEMP, "num_predict": LLM_MAX},
-        "stream": False
-    }
-    with httpx.Client(timeout=timeout) as client:
-        r = client.post(f"{LLM_URL}/api/generate", json=payload)
-        try:
-            response_json = r.json()
-            
-            return response_json['response']
-        except Exception as e:
-            print(f"Failed to parse response as JSON: {e}")
-            return f"Presentation is consistent with {title.lower()} based on the note text."
+@app.get("/readyz")
+def readyz():
+    """Per-component load state; 503 until every required component is ready."""
+    components = {c.name: c.status() for c in COMPONENTS}
+    ready = all(c.state == "ready" for c in COMPONENTS if c.required)
+    body = {"ready": ready, "index_version": INDEX_VERSION, "components": components}
+    return JSONResponse(status_code=200 if ready else 503, content=body)
+
+
+@app.get("/cache/stats")
+def cache_stats():
+    stats = QUERY_CACHE.stats()
+    llm = LLM.peek()
+    if llm is not None:
+        stats["rationales"] = llm.cache.stats()
+    return stats
+
+
+@app.get("/metrics")
+def metrics():
+    rendered = render()
+    if rendered is None:
+        return JSONResponse(status_code=503, content={"detail": "prometheus_client is not installed"})
+    body, content_type = rendered
+    return Response(content=body, media_type=content_type)
+
+
+def runtime_stats():
+    """Scrape-time gauges / counters for /metrics (see backend/metrics.py)."""
+    cache = QUERY_CACHE.stats()
+    for tier in ("embeddings", "results"):
+        for level, st in cache[tier].items():
+            labels = {"cache": tier, "tier": level}
+            yield "gauge", "autocoder_cache_hit_ratio", "Cache hit ratio", st["hit_ratio"], labels
+            yield "counter", "autocoder_cache_hits", "Cache hits", st["hits"], labels
+            yield "counter", "autocoder_cache_misses", "Cache misses", st["misses"], labels
+    llm = LLM.peek()
+    if llm is not None:
+        yield "gauge", "autocoder_cache_hit_ratio", "Cache hit ratio", llm.cache.stats()["hit_ratio"], {"cache": "rationales", "tier": "local"}
+        yield "counter", "autocoder_llm_timeouts", "LLM rationale calls cut off by the deadline", llm.timeouts, None
+        yield "counter", "autocoder_llm_errors", "LLM rationale calls that failed", llm.errors, None
+    pool = VECTORS.peek() if VECTOR_BACKEND == "pgvector" else None
+    if pool is not None:
+        in_use, size = pool.get_size() - pool.get_idle_size(), pool.get_max_size()
+        yield "gauge", "autocoder_db_pool_in_use", "Checked-out PostgreSQL connections", in_use, None
+        yield "gauge", "autocoder_db_pool_max", "PostgreSQL pool size", size, None
+        yield "gauge", "autocoder_db_pool_saturation", "in_use / max", in_use / max(size, 1), None
+    index = VECTORS.peek() if VECTOR_BACKEND == "category" else None
+    if index is not None:
+        yield "counter", "autocoder_category_queries", "Queries run by the two-stage category engine", index.queries, None
+        yield "counter", "autocoder_category_fallbacks", "Two-stage queries that fell back to flat search", index.fallbacks, None
+    st = embed_batcher.stats()
+    yield "counter", "autocoder_embed_batches", "Encode batches run by the micro-batcher", st["batches"], None
+    yield "gauge", "autocoder_embed_avg_batch", "Mean micro-batch size", st["avg_batch"], None
+    for c in COMPONENTS:
+        yield "gauge", "autocoder_component_ready", "1 if the component is loaded", c.state == "ready", {"component": c.name}
+
+register_stats(runtime_stats)
+
 
 @app.post("/suggest")
-def suggest(req: SuggestReq):
+async def suggest(req: SuggestReq):
     t0 = time.time()
-    results = retrieve_pgvector(req.note, req.top_k)
-    # Synchronously add rationale to each result using llm_rationale
-    for r in results:
-        r["rationale"] = llm_rationale(req.note, r["code"], r["title"])
-    return {
+    stages = start_request()
+    results = (await retrieve([req.note], req))[0]
+    # Fan out all LLM rationales at once; slow ones fall back to the template
+    llm = await LLM.aget()
+    if llm is not None:
+        with stage("rationale"):
+            await llm.annotate(req.note, results)
+    observe_request("suggest", time.time() - t0)
+    out = {
         "query": req.note,
         "results": results,
         "latency_ms": int((time.time() - t0) * 1000)
     }
+    if req.group_by_category:
+        out["categories"] = group_by_category(results)
+    if req.debug:
+        out["stages"] = stages
+        out["preprocessed"] = prepare_note(req.note)._asdict()
+    return out
+
+
+@app.post("/suggest/stream")
+async def suggest_stream(req: SuggestReq):
+    """
+    NDJSON stream: one "results" line as soon as retrieval is done (with
+    templated rationales), then one "rationale" line per result as its LLM
+    call completes, then "done".
+    """
+    t0 = time.time()
+    stages = start_request()
+    results = (await retrieve([req.note], req))[0]
+
+    async def events():
+        head = {"event": "results", "query": req.note, "results": results,
+                "latency_ms": int((time.time() - t0) * 1000)}
+        if req.group_by_category:
+            head["categories"] = group_by_category(results)
+        yield json.dumps(head) + "\n"
+        llm = await LLM.aget()
+        if llm is not None:
+            with stage("rationale"):
+                async for i, text in llm.annotate_iter(req.note, results):
+                    yield json.dumps({"event": "rationale", "index": i, "code": results[i]["code"],
+                                      "rationale": text}) + "\n"
+        observe_request("suggest_stream", time.time() - t0)
+        done = {"event": "done", "latency_ms": int((time.time() - t0) * 1000)}
+        if req.debug:
+            done["stages"] = stages
+        yield json.dumps(done) + "\n"
+
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
+
+@app.post("/suggest/batch")
+async def suggest_batch(req: SuggestBatchReq):
+    t0 = time.time()
+    stages = start_request()
+    # One encode call and one kNN round trip for the whole batch
+    results = await retrieve(req.notes, req) if req.notes else []
+    llm = await LLM.aget() if req.rationale else None
+    if llm is not None:
+        with stage("rationale"):
+            await asyncio.gather(*(llm.annotate(n, r) for n, r in zip(req.notes, results)))
+    observe_request("suggest_batch", time.time() - t0)
+    out = {
+        "results": [
+            {"query": n, "results": r, **({"categories": group_by_category(r)} if req.group_by_category else {})}
+            for n, r in zip(req.notes, results)
+        ],
+        "latency_ms": int((time.time() - t0) * 1000)
+    }
+    if req.debug:
+        out["stages"] = stages
+    return out
@@ -0,0 +1,71 @@
+"""
+Server-side micro-batching for CPU-bound model calls
+"""
+import asyncio
+
+
+class MicroBatcher:
+    """
+    Merges concurrent single-item calls into one batched call.
+
+    `fn` takes a list of items and returns a sequence of results of the same
+    length. A batch is flushed as soon as it holds `max_batch` items or the
+    oldest item has waited `max_wait_ms`, whichever comes first.
+    """
+
+    def __init__(self, fn, max_batch: int = 32, max_wait_ms: float = 5.0, executor=None):
+        self.fn = fn
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self.executor = executor
+        self.batches = 0
+        self.items = 0
+        self._pending = []
+        self._timer = None
+        # The loop only holds weak references to tasks: keep in-flight batches
+        # alive until they finish, or their waiters could hang
+        self._tasks = set()
+
+    async def submit(self, item):
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        self._pending.append((item, fut))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+        return await fut
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        while self._pending:
+            batch = self._pending[:self.max_batch]
+            self._pending = self._pending[self.max_batch:]
+            task = asyncio.ensure_future(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch):
+        loop = asyncio.get_running_loop()
+        items = [item for item, _ in batch]
+        self.batches += 1
+        self.items += len(items)
+        try:
+            out = await loop.run_in_executor(self.executor, self.fn, items)
+        except Exception as e:
+            for _, fut in batch:
+                if not fut.done():
+                    fut.set_exception(e)
+            return
+        for (_, fut), res in zip(batch, out):
+            if not fut.done():
+                fut.set_result(res)
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch": (self.items / self.batches) if self.batches else 0.0,
+        }
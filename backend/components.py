@@ -0,0 +1,116 @@
+"""
+Lazily initialized backend components (indexes, models, clients)
+
+Each component is built on first use by exactly one caller; concurrent
+callers wait for that build instead of starting their own. A factory that
+returns None marks the component "disabled" (e.g. no DB configured). A
+failed build is retried after `retry_s`, so a database that comes up after
+the backend is picked up without a restart.
+"""
+import asyncio
+import threading
+import time
+from starlette.concurrency import run_in_threadpool
+
+
+class ComponentUnavailable(RuntimeError):
+    pass
+
+
+class LazyComponent:
+    def __init__(self, name: str, factory, required: bool = True, retry_s: float = 30.0):
+        self.name = name
+        self.factory = factory
+        self.required = required
+        self.retry_s = retry_s
+        self.state = "pending"  # pending | loading | ready | disabled | failed
+        self.error = None
+        self.load_ms = None
+        self._value = None
+        self._failed_at = 0.0
+        self._lock = threading.Lock()
+
+    def get(self):
+        """The component, building it if needed; None if disabled or failed."""
+        if self.state in ("ready", "disabled"):
+            return self._value
+        with self._lock:
+            if self.state in ("ready", "disabled"):
+                return self._value
+            if self._retry_wait():
+                return None
+            self.state = "loading"
+            t0 = time.perf_counter()
+            try:
+                value = self.factory()
+            except Exception as e:
+                return self._failed(e)
+            return self._loaded(value, t0)
+
+    def _retry_wait(self) -> bool:
+        return self.state == "failed" and time.monotonic() - self._failed_at < self.retry_s
+
+    def _failed(self, e):
+        self.state, self.error = "failed", f"{type(e).__name__}: {e}"
+        self._failed_at = time.monotonic()
+        print(f"[{self.name}] load failed: {self.error}")
+        return None
+
+    def _loaded(self, value, t0):
+        self.load_ms = round((time.perf_counter() - t0) * 1000, 1)
+        self._value, self.error = value, None
+        self.state = "ready" if value is not None else "disabled"
+        print(f"[{self.name}] {self.state} in {self.load_ms:.0f} ms")
+        return value
+
+    async def aget(self):
+        """get() from async code; builds run in the threadpool, not on the event loop."""
+        if self.state in ("ready", "disabled"):
+            return self._value
+        return await run_in_threadpool(self.get)
+
+    def require(self):
+        value = self.get()
+        if value is None:
+            raise ComponentUnavailable(f"{self.name} is {self.state}")
+        return value
+
+    def peek(self):
+        """The component if already built; never triggers a build."""
+        return self._value if self.state == "ready" else None
+
+    def status(self) -> dict:
+        return {"state": self.state, "required": self.required, "load_ms": self.load_ms, "error": self.error}
+
+
+class AsyncLazyComponent(LazyComponent):
+    """
+    LazyComponent whose factory is a coroutine (e.g. an asyncpg pool, which
+    must be created on the event loop). Only aget() builds it; get() returns
+    it once ready and None before that.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._alock = None
+
+    def get(self):
+        return self._value if self.state in ("ready", "disabled") else None
+
+    async def aget(self):
+        if self.state in ("ready", "disabled"):
+            return self._value
+        if self._alock is None:
+            self._alock = asyncio.Lock()
+        async with self._alock:
+            if self.state in ("ready", "disabled"):
+                return self._value
+            if self._retry_wait():
+                return None
+            self.state = "loading"
+            t0 = time.perf_counter()
+            try:
+                value = await self.factory()
+            except Exception as e:
+                return self._failed(e)
+            return self._loaded(value, t0)
@@ -0,0 +1,22 @@
+"""
+Dedicated, bounded executor for CPU-bound request work
+
+Encode, TF-IDF / BM25 / FAISS scoring and reranking run here instead of on
+starlette's shared threadpool, so they cannot starve (or be starved by)
+blocking I/O and component loading. NumPy, onnxruntime and torch release
+the GIL in their kernels, so threads scale with cores.
+"""
+import asyncio
+import contextvars
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+CPU_WORKERS = int(os.getenv("AUTOCODER_CPU_WORKERS", "0")) or min(8, os.cpu_count() or 1)
+
+CPU_EXECUTOR = ThreadPoolExecutor(max_workers=CPU_WORKERS, thread_name_prefix="autocoder-cpu")
+
+
+async def run_cpu(fn, *args):
+    """Runs fn(*args) on CPU_EXECUTOR, keeping the caller's contextvars (stage timers)."""
+    ctx = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(CPU_EXECUTOR, ctx.run, fn, *args)
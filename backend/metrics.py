@@ -0,0 +1,141 @@
+"""
+Request instrumentation: per-stage timers, Prometheus export, sampling profiler
+
+    with stage("embed"): ...
+
+adds the elapsed time to the current request's breakdown (returned when
+the request sets debug=true) and to the autocoder_stage_seconds histogram.
+The breakdown lives in a ContextVar, so stages running in the threadpool
+(run_in_threadpool copies the context) land in the right request.
+
+Point-in-time values owned by other objects (cache hit ratios, pool usage,
+LLM timeouts) are read at scrape time through register_stats().
+"""
+import cProfile
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+try:
+    from prometheus_client import CollectorRegistry, Histogram, generate_latest, CONTENT_TYPE_LATEST
+    from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+except ImportError:  # /metrics reports 503 without prometheus_client
+    CollectorRegistry = None
+    CONTENT_TYPE_LATEST = "text/plain"
+
+# Debug only, off by default: with AUTOCODER_PROFILE=1 every Nth request turns
+# on cProfile for the whole process and dumps it to PROFILE_DIR
+PROFILE = os.getenv("AUTOCODER_PROFILE", "0") == "1"
+PROFILE_EVERY = int(os.getenv("AUTOCODER_PROFILE_EVERY", "100"))
+PROFILE_DIR = os.getenv("AUTOCODER_PROFILE_DIR", "/tmp/autocoder-profiles")
+
+_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+_stages = ContextVar("autocoder_stages", default=None)
+
+REGISTRY = None
+STAGE_SECONDS = REQUEST_SECONDS = None
+if CollectorRegistry is not None:
+    REGISTRY = CollectorRegistry()
+    STAGE_SECONDS = Histogram("autocoder_stage_seconds", "Time spent per retrieval stage",
+                              ["stage"], buckets=_BUCKETS, registry=REGISTRY)
+    REQUEST_SECONDS = Histogram("autocoder_request_seconds", "End-to-end request latency",
+                                ["endpoint"], buckets=_BUCKETS, registry=REGISTRY)
+
+
+def start_request() -> dict:
+    """Starts a fresh stage breakdown for the current request and returns it."""
+    stages = {}
+    _stages.set(stages)
+    return stages
+
+
+@contextmanager
+def stage(name: str):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        dt = time.perf_counter() - t0
+        stages = _stages.get()
+        if stages is not None:
+            stages[name] = round(stages.get(name, 0.0) + dt * 1000, 3)
+        if STAGE_SECONDS is not None:
+            STAGE_SECONDS.labels(name).observe(dt)
+
+
+def observe_request(endpoint: str, seconds: float):
+    if REQUEST_SECONDS is not None:
+        REQUEST_SECONDS.labels(endpoint).observe(seconds)
+
+
+class _StatsCollector:
+    """
+    Calls fn() at scrape time; fn yields (kind, name, doc, value, labels)
+    with kind "gauge" or "counter" and labels a dict (or None).
+    """
+
+    def __init__(self, fn):
+        self.fn = fn
+
+    def collect(self):
+        families = {}
+        for kind, name, doc, value, labels in self.fn():
+            labels = labels or {}
+            key = (kind, name)
+            if key not in families:
+                cls = GaugeMetricFamily if kind == "gauge" else CounterMetricFamily
+                families[key] = cls(name, doc, labels=sorted(labels))
+            families[key].add_metric([str(labels[k]) for k in sorted(labels)], float(value))
+        return list(families.values())
+
+
+def register_stats(fn):
+    if REGISTRY is not None:
+        REGISTRY.register(_StatsCollector(fn))
+
+
+def render():
+    """(body, content_type) for /metrics, or None without prometheus_client."""
+    if REGISTRY is None:
+        return None
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+
+
+class SamplingProfiler:
+    """
+    HTTP middleware that turns cProfile on for the duration of every
+    `every`-th request and writes <dir>/<time>_<n>_<path>.prof (open with
+    snakeviz or pstats). One profile at a time: cProfile cannot nest.
+
+    The profile is process-wide, not per-request: it records everything the
+    event loop runs meanwhile, including every concurrent request, and is
+    only named after the request that turned it on. Executor stages show
+    up as waits. Installed only with AUTOCODER_PROFILE=1.
+    """
+
+    def __init__(self, every: int = PROFILE_EVERY, out_dir: str = PROFILE_DIR):
+        self.every = every
+        self.out_dir = out_dir
+        self.count = 0
+        self._active = threading.Lock()
+
+    async def __call__(self, request, call_next):
+        self.count += 1
+        if self.every <= 0 or self.count % self.every or not self._active.acquire(blocking=False):
+            return await call_next(request)
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+            try:
+                return await call_next(request)
+            finally:
+                profiler.disable()
+                os.makedirs(self.out_dir, exist_ok=True)
+                name = request.url.path.strip("/").replace("/", "_") or "root"
+                path = os.path.join(self.out_dir, f"{time.strftime('%Y%m%dT%H%M%S')}_{self.count}_{name}.prof")
+                profiler.dump_stats(path)
+                print(f"Process-wide profile (started by {request.url.path}) written to {path}")
+        finally:
+            self._active.release()
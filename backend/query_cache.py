@@ -0,0 +1,79 @@
+"""
+Two-tier query cache: query embeddings and retrieval results
+
+Embeddings are keyed on text_utils.normalize_text(text) (lowercased, no
+punctuation, ALIASES applied), so "HTN f/u" and "htn f/u." share entries.
+Results are keyed on the note's chunks from preprocess.prepare_note
+instead: normalize_text drops the punctuation that scopes negation, so "No
+fever chest pain" and "No fever. Chest pain" normalize alike but retrieve
+different codes. Result keys also carry every retrieval parameter and the
+version of the index this process loaded (app.INDEX_VERSION, read once at
+startup). The process does not reload its indexes, so after a rebuild it
+keeps keying on the old version until it restarts: results from the old
+in-memory index are never stored under the new version, here or in the
+shared tier.
+
+Each tier is an in-process LRU, optionally backed by a shared
+Redis-compatible server (AUTOCODER_CACHE_URL) so workers share hits.
+"""
+import hashlib
+import json
+import os
+import numpy as np
+
+from scripts.utils.cache import TTLCache, RedisCache, TieredCache
+from scripts.utils.text_utils import normalize_text
+
+CACHE_URL = os.getenv("AUTOCODER_CACHE_URL", "")  # e.g. redis://redis:6379/0
+EMBED_CACHE_SIZE = int(os.getenv("AUTOCODER_EMBED_CACHE_SIZE", "4096"))
+RESULT_CACHE_SIZE = int(os.getenv("AUTOCODER_RESULT_CACHE_SIZE", "4096"))
+RESULT_CACHE_TTL_S = float(os.getenv("AUTOCODER_RESULT_CACHE_TTL_S", "3600"))
+
+
+def _digest(s: str) -> str:
+    return hashlib.sha1(s.encode("utf-8")).hexdigest()
+
+
+class QueryCache:
+    def __init__(self, index_version: str, embedder_id: str, url: str = CACHE_URL):
+        self.version = index_version
+        emb_shared = res_shared = None
+        if url:
+            try:
+                emb_shared = RedisCache(
+                    url, f"icd10:emb:{_digest(embedder_id)[:12]}:",
+                    dumps=lambda v: np.asarray(v, dtype=np.float32).tobytes(),
+                    loads=lambda b: np.frombuffer(b, dtype=np.float32))
+                res_shared = RedisCache(url, "icd10:res:", ttl=RESULT_CACHE_TTL_S,
+                                        dumps=json.dumps, loads=json.loads)
+                print(f"Shared query cache at {url}")
+            except ImportError:
+                print("AUTOCODER_CACHE_URL is set but redis is not installed; using in-process caches only.")
+        # Embeddings depend only on the model, so they never expire
+        self.embeddings = TieredCache(TTLCache(EMBED_CACHE_SIZE), emb_shared)
+        self.results = TieredCache(TTLCache(RESULT_CACHE_SIZE, ttl=RESULT_CACHE_TTL_S), res_shared)
+
+    @staticmethod
+    def normalize(note: str) -> str:
+        return normalize_text(note)
+
+    def result_key(self, chunks, params: dict) -> str:
+        # chunks: prepare_note(note).chunks, what the engines actually search;
+        # params: every retrieval setting (top_k, engine, fusion, rerank, ...)
+        key = json.dumps([self.version, list(chunks), params], sort_keys=True)
+        return _digest(key)
+
+    def get_results(self, key: str):
+        hit = self.results.get(key)
+        # Copies: callers annotate result dicts in place
+        return [dict(r) for r in hit] if hit is not None else None
+
+    def set_results(self, key: str, results):
+        self.results.set(key, [dict(r) for r in results])
+
+    def stats(self) -> dict:
+        return {
+            "index_version": self.version,
+            "embeddings": self.embeddings.stats(),
+            "results": self.results.stats(),
+        }
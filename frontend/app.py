@@ -1,16 +1,34 @@
 # frontend/app.py
-import requests, streamlit as st
+import json, os, requests, streamlit as st
+
+BACKEND_URL = os.getenv("BACKEND_URL", "http://backend:8000")
 
 st.title("ICD-10 Auto-Coder (Demo)")
 note = st.text_area("Clinical note / chief complaint", height=160, placeholder="e.g., 28F with dysuria, frequency, suprapubic pain, afebrile.")
 top_k = st.slider("Top-K", 1, 10, 5)
 
 if st.button("Suggest Codes"):
-    with st.spinner("Analyzing..."):
-        r = requests.post("http://backend:8000/suggest", json={"note": note, "top_k": top_k}).json()
-        print("results:", r)
-
-        for item in r["results"]:
-            st.write(f"**{item['code']} — {item['title']}**  \nConfidence: {item['confidence']}")
-            st.caption(item["rationale"])
-
+    # Codes render as soon as retrieval finishes; each rationale replaces its
+    # placeholder as the LLM call for that code completes
+    rationales = []
+    status = st.empty()
+    status.caption("Analyzing...")
+    with requests.post(f"{BACKEND_URL}/suggest/stream", json={"note": note, "top_k": top_k}, stream=True, timeout=60) as r:
+        r.raise_for_status()
+        for line in r.iter_lines():
+            if not line:
+                continue
+            event = json.loads(line)
+            if event["event"] == "results":
+                if not event["results"]:
+                    st.info("No matching codes.")
+                for item in event["results"]:
+                    st.write(f"**{item['code']} — {item['title']}**  \nConfidence: {item['confidence']}")
+                    slot = st.empty()
+                    slot.caption(f"_{item['rationale']}_ (generating rationale...)")
+                    rationales.append(slot)
+                status.caption(f"Retrieved in {event['latency_ms']} ms; generating rationales...")
+            elif event["event"] == "rationale":
+                rationales[event["index"]].caption(event["rationale"])
+            elif event["event"] == "done":
+                status.caption(f"Done in {event['latency_ms']} ms")
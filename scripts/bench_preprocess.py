@@ -0,0 +1,111 @@
+# ============================================================================
+# File: scripts/bench_preprocess.py
+# ============================================================================
+"""
+Throughput of the query preprocessing stage (utils/preprocess.py)
+
+Builds a large batch of synthetic clinical notes (catalog titles and
+synonyms joined into multi-sentence notes with abbreviations and negated
+findings) and times, per note:
+    normalize   text_utils.normalize_text only (what queries got before)
+    prepare     prepare_notes: aliases + negation scoping + sentence chunks
+    embed       optional: encode every chunk of the batch in one call
+
+Usage:
+    python scripts/bench_preprocess.py --notes 20000
+    python scripts/bench_preprocess.py --notes 2000 --embed --model-name /models/minilm
+
+Options:
+    --csv          Codes CSV with title / synonym columns (default: data/icd10_with_synonmym.csv)
+    --notes        Number of synthetic notes (default: 20000)
+    --sentences    Sentences per note, min-max (default: 2-8)
+    --embed        Also time chunk embedding (needs the model)
+    --embed-notes  Notes used for the embed timing (default: 1000)
+    --model-name   Embedding model (default: AUTOCODER_MODEL_NAME or all-MiniLM-L6-v2)
+    --backend      torch | onnx | onnx-int8 (default: AUTOCODER_EMBED_BACKEND or torch)
+    --onnx-dir     ONNX export directory (for onnx backends)
+"""
+import argparse
+import os
+import random
+import sys
+import time
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(__file__), 'utils'))
+from utils.text_utils import normalize_text
+from utils.preprocess import prepare_notes, CHUNK_CHARS
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+OPENERS = ["Pt c/o {}.", "{}yo presents with {}.", "Seen for {} x3 days.", "h/o {}, stable.", "Reports {} since last visit."]
+NEGATED = ["Denies {}.", "No {}.", "Neg for {}.", "{} was ruled out.", "No evidence of {}."]
+FILLERS = ["Vitals WNL.", "F/u in 2 wks.", "BP 132/84, HR 78.", "s/p MVC last yr.", "Abd soft, NTTP."]
+
+
+def phrases(csv_path):
+    df = pd.read_csv(csv_path)
+    syn_col = "synonyms" if "synonyms" in df else "synonym"
+    out = df["title"].dropna().astype(str).tolist()
+    if syn_col in df:
+        for s in df[syn_col].dropna().astype(str):
+            out.extend(p.strip() for p in s.split(";") if 2 < len(p.strip()) < 60)
+    return out
+
+
+def synthetic_notes(pool, n, sentences, seed=0):
+    rng = random.Random(seed)
+    lo, hi = sentences
+    notes = []
+    for _ in range(n):
+        parts = []
+        for _ in range(rng.randint(lo, hi)):
+            kind = rng.random()
+            if kind < 0.5:
+                t = rng.choice(OPENERS)
+                parts.append(t.format(rng.randint(20, 90), rng.choice(pool)) if t.count("{}") == 2 else t.format(rng.choice(pool)))
+            elif kind < 0.8:
+                parts.append(rng.choice(NEGATED).format(rng.choice(pool)))
+            else:
+                parts.append(rng.choice(FILLERS))
+        notes.append(" ".join(parts))
+    return notes
+
+
+def timed(label, n, fn):
+    t0 = time.perf_counter()
+    out = fn()
+    dt = time.perf_counter() - t0
+    print(f"[bench] {label:<10} {n / dt:10.0f} notes/s  ({dt * 1000 / n:.3f} ms/note)")
+    return out
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--csv", default=os.path.join(ROOT, "data", "icd10_with_synonmym.csv"))
+    ap.add_argument("--notes", default=20000, type=int)
+    ap.add_argument("--sentences", default="2-8")
+    ap.add_argument("--embed", action="store_true")
+    ap.add_argument("--embed-notes", default=1000, type=int)
+    ap.add_argument("--model-name", default=os.getenv("AUTOCODER_MODEL_NAME", "sentence-transformers/all-MiniLM-L6-v2"))
+    ap.add_argument("--backend", default=None)
+    ap.add_argument("--onnx-dir", default=None)
+    args = ap.parse_args()
+
+    lo, hi = (int(x) for x in args.sentences.split("-"))
+    notes = synthetic_notes(phrases(args.csv), args.notes, (lo, hi))
+    chars = sum(len(n) for n in notes)
+    print(f"[bench] {len(notes)} notes, {chars / len(notes):.0f} chars/note on average, chunk size {CHUNK_CHARS}")
+
+    timed("normalize", len(notes), lambda: [normalize_text(n) for n in notes])
+    prepared = timed("prepare", len(notes), lambda: prepare_notes(notes))
+    n_chunks = sum(len(p.chunks) for p in prepared)
+    negated = sum(len(p.negated) for p in prepared)
+    print(f"[bench] {n_chunks / len(notes):.2f} chunks/note, {negated / len(notes):.2f} negated spans/note")
+
+    if args.embed:
+        from utils.embedder import load_embedder
+        model = load_embedder(args.model_name, args.backend, args.onnx_dir)
+        sample = prepared[:args.embed_notes]
+        chunks = [c for p in sample for c in p.chunks]
+        model.encode(chunks[:8])  # warmup
+        timed("embed", len(sample), lambda: model.encode(chunks, batch_size=64))
@@ -0,0 +1,331 @@
+# ============================================================================
+# File: scripts/benchmark.py
+# ============================================================================
+"""
+Retrieval benchmark: quality and latency per engine
+
+Runs the backend's own retrieval functions (backend/app.py) over
+evals/seeds.jsonl plus a synthetic set built from the synonym column of
+data/icd10_with_synonmym.csv, and writes one JSON report so runs can be
+diffed between commits.
+
+With --url the same queries are POSTed to a running backend's /suggest
+instead (an HTTP load test: latency and QPS include the server's
+event loop, pools and executors).
+
+Usage:
+    python scripts/benchmark.py --out bench.json
+    python scripts/benchmark.py --engines tfidf,bm25 --concurrency 8 --synthetic 500
+    AUTOCODER_VECTOR_BACKEND=pgvector python scripts/benchmark.py --out bench_pg.json
+    python scripts/benchmark.py --vector-backend faiss --out bench_faiss.json
+    python scripts/benchmark.py --url http://localhost:8000 --engines bm25,dense --concurrency 32
+    python scripts/benchmark.py --vector-backend pgvector --pg-standin 2 --engines dense,hybrid --concurrency 32
+
+Options:
+    --engines         Comma list of tfidf, bm25, dense, hybrid (default: all)
+    --vector-backend  Engine behind "dense" / "hybrid": pgvector | faiss | numpy | category | multi
+                      (default: AUTOCODER_VECTOR_BACKEND, else pgvector)
+    --skip-pg         Skip dense / hybrid when they would need PostgreSQL
+    --pg-standin MS   In-process only: replace the asyncpg pool with StandinPgPool, which
+                      answers the kNN query from the local index after MS ms of simulated
+                      round trip (load-tests the async pgvector path without PostgreSQL)
+    --seeds           Eval JSONL with "note" and "gold" (default: evals/seeds.jsonl)
+    --csv             Codes CSV with a synonym column (default: data/icd10_with_synonmym.csv)
+    --synthetic       Synthetic queries generated from synonyms (default: 200)
+    --k               Depth for recall@k / MRR (default: 10)
+    --concurrency     Parallel queries during the timed run (default: 1)
+    --url             Load-test a running backend over HTTP (tfidf is in-process only)
+    --out             Write the JSON report here (default: print only)
+
+Metrics per engine:
+    recall@1/3/5/k         share of queries with a gold code in the top n
+    category_recall@k      same, on the 3-character category (M54 for M545)
+    mrr                    mean reciprocal rank of the first gold code within k
+    latency p50/p95/p99    per-query milliseconds under --concurrency
+    qps                    queries / wall-clock second under --concurrency
+
+Gold codes are compared without dots ("M54.5" == "M545"), the form used in
+the codes CSV. Engines that cannot run (PostgreSQL down, index missing) are
+reported as skipped with the reason instead of failing the run.
+"""
+import argparse
+import contextlib
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+import asyncio
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ENGINES = ["tfidf", "bm25", "dense", "hybrid"]
+RECALL_AT = (1, 3, 5)
+
+
+def clean_code(code: str) -> str:
+    return str(code).replace(".", "").strip().upper()
+
+
+def load_seeds(path):
+    queries = []
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                row = json.loads(line)
+                queries.append({"note": row["note"], "gold": [clean_code(c) for c in row["gold"]], "source": "seeds"})
+    return queries
+
+
+def synthetic_queries(csv_path, n, seed=0):
+    """Notes made of 2-4 of a code's synonyms; the code itself is gold."""
+    from scripts.utils.text_utils import split_synonyms
+    rng = random.Random(seed)
+    df = pd.read_csv(csv_path, usecols=["code", "synonym"])
+    pool = [(clean_code(c), syns) for c, s in zip(df["code"], df["synonym"]) if len(syns := split_synonyms(s)) >= 2]
+    out = []
+    for code, syns in rng.sample(pool, min(n, len(pool))):
+        picked = rng.sample(syns, min(len(syns), rng.randint(2, 4)))
+        out.append({"note": ", ".join(picked), "gold": [code], "source": "synthetic"})
+    return out
+
+
+def quality(ranked, gold, k):
+    ranked = [clean_code(c) for c in ranked[:k]]
+    gold_cats = {g[:3] for g in gold}
+    first = next((i for i, c in enumerate(ranked) if c in gold), None)
+    row = {f"recall@{n}": float(first is not None and first < n) for n in RECALL_AT if n < k}
+    row[f"recall@{k}"] = float(first is not None)
+    row[f"category_recall@{k}"] = float(any(c[:3] in gold_cats for c in ranked))
+    row["mrr"] = 1.0 / (first + 1) if first is not None else 0.0
+    return row
+
+
+async def run_engine(fn, queries, k, concurrency):
+    """fn is an async (note, k) -> results; at most `concurrency` run at once."""
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one(q):
+        async with sem:
+            t0 = time.perf_counter()
+            results = await fn(q["note"], k)
+            return (time.perf_counter() - t0) * 1000, [r["code"] for r in results]
+
+    for q in queries[:3]:  # warm caches / lazy loads outside the timed run
+        await fn(q["note"], k)
+    t0 = time.perf_counter()
+    timed = await asyncio.gather(*(one(q) for q in queries))
+    wall = time.perf_counter() - t0
+    lat = np.array([t for t, _ in timed])
+    rows = [quality(codes, q["gold"], k) for (_, codes), q in zip(timed, queries)]
+    report = {name: round(float(np.mean([r[name] for r in rows])), 4) for name in rows[0]}
+    report.update({
+        "latency_ms": {p: round(float(np.percentile(lat, int(p[1:]))), 2) for p in ("p50", "p95", "p99")},
+        "qps": round(len(queries) / wall, 1),
+    })
+    by_source = {}
+    for q, r in zip(queries, rows):
+        by_source.setdefault(q["source"], []).append(r[f"recall@{k}"])
+    report[f"recall@{k}_by_source"] = {s: round(float(np.mean(v)), 4) for s, v in by_source.items()}
+    return report
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def skipped(report, name, reason):
+    report["engines"][name] = {"skipped": reason}
+    print(f"[bench] {name}: skipped ({reason})")
+
+
+class StandinPgPool:
+    """
+    Stand-in for the backend's asyncpg pool (--pg-standin). Same acquire() /
+    transaction() / execute() / fetch() calls and pool-size limit; execute()
+    and fetch() each cost `latency_ms` of simulated round trip. Answers
+    KNN_BATCH_QUERY by exact search over the index's embeddings.npy. The
+    search runs in a thread, like work done by a separate database server,
+    so only the client side of the path is the backend's.
+    """
+
+    def __init__(self, index_dir, query, latency_ms, max_size):
+        from scripts.utils.catalog import CodeCatalog
+        from scripts.utils.vector_index import NumpyIndex
+        self.index = NumpyIndex.load(index_dir)
+        self.catalog = CodeCatalog.load(index_dir)
+        self.query = query
+        self.latency_s = latency_ms / 1000.0
+        self.max_size = max_size
+        self.in_use = 0
+        self.queries = 0
+        self._sem = asyncio.Semaphore(max_size)
+
+    @contextlib.asynccontextmanager
+    async def acquire(self):
+        async with self._sem:
+            self.in_use += 1
+            try:
+                yield self
+            finally:
+                self.in_use -= 1
+
+    @contextlib.asynccontextmanager
+    async def transaction(self):
+        yield
+
+    async def execute(self, query, *params):
+        await asyncio.sleep(self.latency_s)
+
+    async def fetch(self, query, vecs, top_k, *params):
+        if query != self.query:
+            raise ValueError("the PostgreSQL stand-in only answers KNN_BATCH_QUERY (AUTOCODER_PG_MULTI_VECTOR=0)")
+        self.queries += 1
+        await asyncio.sleep(self.latency_s)
+        scores, idx = await asyncio.to_thread(self.index.search, np.asarray(vecs, dtype=np.float32), top_k)
+        c = self.catalog
+        return [(q + 1, str(c.codes[i]), c.titles[i], c.descriptions[i], float(score))
+                for q, (row_scores, row_idx) in enumerate(zip(scores, idx))
+                for score, i in zip(row_scores, row_idx)]
+
+    def get_size(self):
+        return self.max_size
+
+    def get_idle_size(self):
+        return self.max_size - self.in_use
+
+    def get_max_size(self):
+        return self.max_size
+
+    async def close(self):
+        pass
+
+
+async def bench_inprocess(args, queries, names, report):
+    from backend import app as backend
+    from backend.executor import run_cpu
+
+    def engine(name):
+        params = backend.RetrievalParams(engine={"bm25": "lexical"}.get(name, name), candidates=50)
+
+        async def fn(note, k):
+            return (await backend.retrieve([note], params.model_copy(update={"top_k": k})))[0]
+        return fn
+
+    async def tfidf(note, k):
+        return await run_cpu(backend.retrieve_tfidf, note, k)
+
+    fns = {"tfidf": tfidf, "bm25": engine("bm25"), "dense": engine("dense"), "hybrid": engine("hybrid")}
+    needs_pg = backend.VECTOR_BACKEND == "pgvector"
+    if args.pg_standin is not None:
+        if not needs_pg:
+            raise SystemExit("--pg-standin needs --vector-backend pgvector")
+        from scripts.utils.db import PG_POOL_MAX
+
+        async def load_standin():
+            return StandinPgPool(backend.INDEX_DIR, backend.KNN_BATCH_QUERY, args.pg_standin, PG_POOL_MAX)
+        backend.VECTORS.factory = load_standin
+        report["pg_standin_ms"] = args.pg_standin
+    report.update({
+        "index_version": backend.INDEX_VERSION,
+        "model": backend.MODEL_NAME,
+        "embed_backend": backend.EMBED_BACKEND,
+        "vector_backend": backend.VECTOR_BACKEND,
+    })
+    print(f"[bench] vector backend={backend.VECTOR_BACKEND}")
+    await backend.CATALOG.aget()
+    for name in names:
+        if name in ("dense", "hybrid") and needs_pg and args.skip_pg:
+            skipped(report, name, "--skip-pg")
+            continue
+        needed = {"tfidf": [backend.TFIDF], "bm25": [backend.BM25]}.get(name, [backend.EMBEDDER, backend.VECTORS])
+        if name == "hybrid":
+            needed.append(backend.BM25)
+        down = [c for c in needed if (await c.aget()) is None]
+        if down:
+            skipped(report, name, "; ".join(f"{c.name} is {c.state}" + (f" ({c.error})" if c.error else "") for c in down))
+            continue
+        yield name, await run_engine(fns[name], queries, args.k, args.concurrency)
+
+
+async def bench_http(args, queries, names, report):
+    import httpx
+
+    report["url"] = args.url
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.url, timeout=60, limits=limits) as client:
+        ready = await client.get("/readyz")
+        report["server"] = ready.json()
+        for name in names:
+            if name == "tfidf":
+                skipped(report, name, "not served over HTTP")
+                continue
+            engine = {"bm25": "lexical"}.get(name, name)
+
+            async def fn(note, k, engine=engine):
+                r = await client.post("/suggest", json={"note": note, "top_k": k, "engine": engine})
+                r.raise_for_status()
+                return r.json()["results"]
+            yield name, await run_engine(fn, queries, args.k, args.concurrency)
+
+
+async def main(args):
+    if args.vector_backend:
+        os.environ["AUTOCODER_VECTOR_BACKEND"] = args.vector_backend
+    # Result caching would turn repeated notes into cache benchmarks
+    os.environ.setdefault("AUTOCODER_RESULT_CACHE_SIZE", "0")
+    os.environ.setdefault("AUTOCODER_EMBED_CACHE_SIZE", "0")
+    sys.path.insert(0, ROOT)
+
+    queries = load_seeds(args.seeds) + synthetic_queries(args.csv, args.synthetic)
+    print(f"[bench] {len(queries)} queries, k={args.k}, concurrency={args.concurrency}")
+    names = [e.strip() for e in args.engines.split(",") if e.strip()]
+    for name in names:
+        if name not in ENGINES:
+            raise SystemExit(f"Unknown engine {name!r}; choose from {', '.join(ENGINES)}")
+    report = {
+        "commit": git_commit(),
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "queries": {"total": len(queries), "seeds": sum(q["source"] == "seeds" for q in queries)},
+        "k": args.k,
+        "concurrency": args.concurrency,
+        "engines": {},
+    }
+    if args.url and args.pg_standin is not None:
+        raise SystemExit("--pg-standin replaces the pool in-process; it cannot be combined with --url")
+    runs = bench_http if args.url else bench_inprocess
+    async for name, result in runs(args, queries, names, report):
+        report["engines"][name] = result
+        print(f"[bench] {name}: recall@{args.k}={result[f'recall@{args.k}']:.3f} mrr={result['mrr']:.3f} "
+              f"p50={result['latency_ms']['p50']}ms p95={result['latency_ms']['p95']}ms qps={result['qps']}")
+    return report
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--engines", default=",".join(ENGINES))
+    ap.add_argument("--vector-backend", default=None, choices=["pgvector", "faiss", "numpy", "category", "multi"])
+    ap.add_argument("--skip-pg", action="store_true")
+    ap.add_argument("--pg-standin", default=None, type=float, metavar="MS")
+    ap.add_argument("--seeds", default=os.path.join(ROOT, "evals", "seeds.jsonl"))
+    ap.add_argument("--csv", default=os.path.join(ROOT, "data", "icd10_with_synonmym.csv"))
+    ap.add_argument("--synthetic", default=200, type=int)
+    ap.add_argument("--k", default=10, type=int)
+    ap.add_argument("--concurrency", default=1, type=int)
+    ap.add_argument("--url", default=None)
+    ap.add_argument("--out", default=None)
+    args = ap.parse_args()
+
+    report = asyncio.run(main(args))
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+        print(f"[bench] report written to {args.out}")
+    else:
+        print(text)
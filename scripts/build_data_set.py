@@ -16,51 +16,323 @@ Options:
     --output, -o     Path to output CSV file (will contain columns: title, description, or synonym)
     --extract-synonyms  Extract symptoms from description and add as 'synonym' column
     --model          Model name for synonym extraction (default: llama3.2:1b)
+    --api-url        MediaWiki API endpoint (default: en.wikipedia.org; point at a local stub for testing)
+    --cache          SQLite checkpoint of fetched extracts / LLM responses
+                     (default: OUTPUT.wiki_cache.sqlite or OUTPUT.llm_cache.sqlite)
+    --concurrency    Max Wikipedia batches in flight (default: 2)
+    --rate           Max Wikipedia requests per second, shared by all batches (default: 3)
+    --workers        Concurrent Ollama requests for --extract-synonyms (default: 4)
 
 Output:
     - For --extract-synonyms, adds a 'synonym' column (lowercase) to output file
     - Rows with empty description are skipped and written to 'icd_10_code_without_any_description.csv'
+    - Description fetches are checkpointed per batch; rerunning after a crash or a
+      failed batch only fetches the titles that are still missing
+    - Synonym rows are appended to OUTPUT as they complete; a rerun drops a partial last
+      row left by a crash, skips codes already in OUTPUT, and LLM responses are cached
+      by hash of (model, prompt)
 
 Example:
     python build_data_set.py -i icd10_sample.csv -o icd10_descriptions.csv
     python build_data_set.py -i icd10_sample.csv -o icd10_synonyms.csv --extract-synonyms
     python build_data_set.py -i icd10_sample.csv -o icd10_synonyms.csv --extract-synonyms --model llama3.2:1b
 """
-import time, requests
+import time
 import argparse
+import asyncio
 import csv
+import hashlib
+import os
 import sys
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+import httpx
+from utils.checkpoint import SqliteKV
 
 UA = "ICD10-DescFetcher/0.1 (+https://github.com/abdullah2891/icd10-auto-encoder)"
-S = requests.Session()
-S.headers.update({"User-Agent": UA})
+WIKI_API = "https://en.wikipedia.org/w/api.php"
 
-def wiki_summary_batch(titles):
+
+class TokenBucket:
+    """
+    Global request rate limiter shared by all in-flight batches. pause()
+    stops every worker until the server's Retry-After / maxlag delay passes.
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds: float):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+def retry_after(r, default: float = 5.0, cap: float = 60.0) -> float:
+    """
+    Seconds to wait from a Retry-After header, which is either
+    delta-seconds ("120") or an HTTP date; `default` if missing or unparsable.
+    """
+    value = (r.headers.get("Retry-After") or "").strip()
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            when = parsedate_to_datetime(value)
+            if when.tzinfo is None:
+                when = when.replace(tzinfo=timezone.utc)
+            seconds = (when - datetime.now(timezone.utc)).total_seconds()
+        except (TypeError, ValueError):
+            seconds = default
+    return min(max(seconds, 0.0), cap)
+
+
+async def wiki_summary_batch(client, bucket, titles, api_url=WIKI_API, max_retries=5):
     params = {
         "action": "query", "prop": "extracts",
         "exintro": 1, "explaintext": 1, "redirects": 1,
         "format": "json", "maxlag": 5,
         "titles": "|".join(titles)
     }
-    for attempt in range(5):
-        r = S.get("https://en.wikipedia.org/w/api.php", params=params, timeout=30)
-        # polite backoff
+    for attempt in range(max_retries):
+        await bucket.acquire()
+        try:
+            r = await client.get(api_url, params=params)
+        except httpx.TransportError as e:
+            print(f"Warning: network error ({e}); retrying", file=sys.stderr)
+            bucket.pause(min(2 ** attempt, 60))
+            continue
+        # polite backoff, shared by every worker
         if r.status_code in (429, 503):
-            delay = int(r.headers.get("Retry-After", "5"))
-            time.sleep(min(delay, 60))
+            bucket.pause(retry_after(r))
+            continue
+        if r.status_code >= 500:
+            bucket.pause(min(2 ** attempt, 60))
+            continue
+        try:
+            data = r.json()
+        except ValueError:
+            # A proxy / error page served with 200: retry like a 5xx
+            print(f"Warning: undecodable response ({r.headers.get('Content-Type')}); retrying", file=sys.stderr)
+            bucket.pause(min(2 ** attempt, 60))
             continue
-        data = r.json()
         # Handle maxlag error
         if "error" in data and data["error"].get("code") == "maxlag":
-            time.sleep(5)
+            bucket.pause(retry_after(r))
             continue
         # Log other API errors as warnings and continue
-        if "error" in data and data["error"].get("code") != "maxlag":
+        if "error" in data:
             print(f"Warning: API error for batch: {data['error']}", file=sys.stderr)
             return {"query": {"pages": {}}}  # Return empty result for this batch
         return data
     raise RuntimeError("Too many retries/backoffs")
-def extract_synonyms(input_file, output_file, model_name="llama3.2:1b"):
+
+
+def extracts_by_requested_title(data, titles):
+    """
+    Maps each requested title to its extract, following the API's
+    normalization and redirect hops. Titles without a page map to "".
+    """
+    query = data.get("query", {})
+    hops = {}
+    for key in ("normalized", "redirects"):
+        for item in query.get(key, []):
+            hops[item["from"]] = item["to"]
+    by_page = {p.get("title", ""): p.get("extract", "") for p in query.get("pages", {}).values()}
+    out = {}
+    for title in titles:
+        final, seen = title, set()
+        while final in hops and final not in seen:
+            seen.add(final)
+            final = hops[final]
+        out[title] = by_page.get(final, "")
+    return out
+
+
+async def fetch_descriptions(titles, cache, api_url=WIKI_API, batch_size=50,
+                             concurrency=2, rate=3.0):
+    """
+    Fetches intro extracts for every title not already in `cache`, with at
+    most `concurrency` batches in flight under one shared rate limit. Each
+    finished batch is checkpointed; failed batches are reported and left for
+    the next run. Returns the number of titles that failed.
+    """
+    done = cache.get_many(titles)
+    todo = [t for t in dict.fromkeys(titles) if t not in done]
+    print(f"[INFO] {len(done)} titles cached, {len(todo)} to fetch")
+    batches = [todo[i:i + batch_size] for i in range(0, len(todo), batch_size)]
+    bucket = TokenBucket(rate, burst=concurrency)
+    sem = asyncio.Semaphore(concurrency)
+    failed = []
+    t0 = time.time()
+    progress = {"titles": 0}
+
+    async with httpx.AsyncClient(headers={"User-Agent": UA}, timeout=30) as client:
+        async def run(n, batch):
+            async with sem:
+                try:
+                    data = await wiki_summary_batch(client, bucket, batch, api_url=api_url)
+                except Exception as e:
+                    print(f"Error fetching batch {n + 1}: {e}", file=sys.stderr)
+                    failed.extend(batch)
+                    return
+            descs = extracts_by_requested_title(data, batch)
+            for title, desc in descs.items():
+                if not desc:
+                    print(f"Warning: No description found for title '{title}'", file=sys.stderr)
+            cache.put_many(descs)
+            progress["titles"] += len(batch)
+            rate_now = progress["titles"] / max(time.time() - t0, 1e-9)
+            print(f"[INFO] batch {n + 1}/{len(batches)} done ({progress['titles']}/{len(todo)} titles, {rate_now:.1f} titles/s)")
+
+        await asyncio.gather(*(run(n, b) for n, b in enumerate(batches)))
+    return len(failed)
+
+
+OLLAMA_URL = os.getenv("LLM_BASE_URL", "http://localhost:11434")
+SYNONYM_PROMPT = "Extract symptoms separated by semicolon from the following description: {desc} only list symtoms, no other text."
+
+
+def _prompt_key(model_name, prompt):
+    return hashlib.sha1(f"{model_name}\0{prompt}".encode("utf-8")).hexdigest()
+
+
+def _read_done_codes(output_file):
+    """
+    Codes already in output_file. A crash can leave a half-written last row;
+    the file is truncated to its last complete row first, so that row's code
+    is extracted again and new rows are not appended to the fragment.
+    """
+    if not os.path.exists(output_file):
+        return set()
+    with open(output_file, "rb") as f:
+        # surrogateescape: one char per undecodable byte, so offsets map back to bytes
+        text = f.read().decode("utf-8", "surrogateescape")
+    pos = 0
+
+    def lines():
+        # Split on \n only: csv treats the end of every line it is given as a row end
+        nonlocal pos
+        while pos < len(text):
+            nl = text.find("\n", pos)
+            start, pos = pos, len(text) if nl < 0 else nl + 1
+            yield text[start:pos]
+
+    rows, complete = [], 0
+    try:
+        # strict: a row cut off inside a field raises at EOF instead of being returned
+        for row in csv.reader(lines(), strict=True):
+            if text[pos - 1] != "\n" or (rows and len(row) != len(rows[0])):
+                break
+            rows.append(row)
+            complete = pos
+    except csv.Error:
+        pass
+    if complete < len(text):
+        print(f"[INFO] Dropping a partial last row from {output_file}")
+        with open(output_file, "r+b") as f:
+            f.truncate(len(text[:complete].encode("utf-8", "surrogateescape")))
+    if not rows or "code" not in rows[0]:
+        return set()
+    col = rows[0].index("code")
+    return {row[col] for row in rows[1:] if row[col]}
+
+
+async def _extract_synonyms(input_rows, fieldnames, output_file, model_name, workers, cache):
+    done_codes = _read_done_codes(output_file)
+    todo = [r for r in input_rows if r['code'] not in done_codes]
+    total = len(todo)
+    print(f"[INFO] {len(done_codes)} codes already in {output_file}, {total} to extract with {workers} workers")
+
+    new_file = not os.path.exists(output_file) or os.path.getsize(output_file) == 0
+    outfile = open(output_file, "a", newline='', encoding='utf-8')
+    writer = csv.DictWriter(outfile, fieldnames=fieldnames)
+    if new_file:
+        writer.writeheader()
+
+    queue = asyncio.Queue()
+    for row in todo:
+        queue.put_nowait(row)
+    stats = {"done": 0, "cached": 0, "failed": 0, "t0": time.time(), "last_report": 0.0}
+
+    def report(force=False):
+        now = time.time()
+        if not force and now - stats["last_report"] < 10:
+            return
+        stats["last_report"] = now
+        elapsed = max(now - stats["t0"], 1e-9)
+        rate = stats["done"] / elapsed
+        eta = (total - stats["done"] - stats["failed"]) / rate if rate else float("inf")
+        print(f"[INFO] {stats['done']}/{total} codes ({stats['cached']} cached, {stats['failed']} failed), "
+              f"{rate:.2f} codes/s, ETA {eta:.0f}s")
+
+    async with httpx.AsyncClient(base_url=OLLAMA_URL, timeout=120,
+                                 limits=httpx.Limits(max_connections=workers)) as client:
+        async def worker():
+            while True:
+                try:
+                    row = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                prompt = SYNONYM_PROMPT.format(desc=row['description'].strip())
+                key = _prompt_key(model_name, prompt)
+                symptoms = cache.get(key)
+                if symptoms is not None:
+                    stats["cached"] += 1
+                else:
+                    try:
+                        r = await client.post("/api/generate", json={"model": model_name, "prompt": prompt, "stream": False})
+                        r.raise_for_status()
+                        symptoms = r.json().get('response', '').strip().lower()
+                    except Exception as e:
+                        print(f"[ERROR] Extracting synonyms for code {row.get('code')}: {e}", file=sys.stderr)
+                        stats["failed"] += 1
+                        continue
+                    cache.put(key, symptoms)
+                # Stream each finished row so a crash loses at most in-flight work
+                writer.writerow({**row, 'synonym': symptoms})
+                outfile.flush()
+                stats["done"] += 1
+                report()
+
+        await asyncio.gather(*(worker() for _ in range(workers)))
+    outfile.close()
+    report(force=True)
+    return stats["failed"]
+
+
+def _sort_output(output_file, input_rows, fieldnames):
+    """Rewrites the streamed (completion-order) output in input order."""
+    with open(output_file, newline='', encoding='utf-8') as f:
+        by_code = {row["code"]: row for row in csv.DictReader(f)}
+    tmp = output_file + ".tmp"
+    with open(tmp, "w", newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames)
+        writer.writeheader()
+        for row in input_rows:
+            if row["code"] in by_code:
+                writer.writerow(by_code[row["code"]])
+    os.replace(tmp, output_file)
+
+
+def extract_synonyms(input_file, output_file, model_name="llama3.2:1b", workers=4, cache_path=None):
     # Read input file
     print(f"[INFO] Reading input file: {input_file}")
     input_rows = []
@@ -71,45 +343,12 @@ def extract_synonyms(input_file, output_file, model_name="llama3.2:1b"):
             sys.exit(1)
         for row in reader:
             input_rows.append(row)
+    if not input_rows:
+        print("No rows found in input file.", file=sys.stderr)
+        sys.exit(1)
 
-    print(f"[INFO] Extracting synonyms using model: {model_name}")
-    output_rows = []
-    no_desc_rows = []
-    total = len(input_rows)
-    for idx, row in enumerate(input_rows, 1):
-        desc = row.get('description', '').strip()
-        if not desc:
-            print(f"[WARN] Skipping code {row.get('code')} (no description)")
-            no_desc_rows.append(row)
-            continue
-        print(f"[INFO] ({idx}/{total}) Extracting for code: {row.get('code')}, title: {row.get('title')}")
-        try:
-            payload = {
-                "model": model_name,
-                "prompt": f"Extract symptoms separated by semicolon from the following description: {desc} only list symtoms, no other text.",
-                "stream": False
-            }
-            print(f"[DEBUG] API request payload: {payload}")
-            r = requests.post("http://localhost:11434/api/generate", json=payload, timeout=30)
-            r.raise_for_status()
-            result = r.json()
-            print(f"[DEBUG] API response: {result}")
-            symptoms = result.get('response', '').strip().lower()
-            print(f"[INFO] Extracted synonyms: {symptoms}")
-        except Exception as e:
-            print(f"[ERROR] Extracting synonyms for code {row.get('code')}: {e}", file=sys.stderr)
-            symptoms = ''
-        row['synonym'] = symptoms
-        output_rows.append(row)
-
-    print(f"[INFO] Writing output file: {output_file} (rows: {len(output_rows)})")
-    fieldnames = list(input_rows[0].keys()) + ['synonym'] if 'synonym' not in input_rows[0] else list(input_rows[0].keys())
-    with open(output_file, "w", newline='', encoding='utf-8') as outfile:
-        writer = csv.DictWriter(outfile, fieldnames=fieldnames)
-        writer.writeheader()
-        for row in output_rows:
-            writer.writerow(row)
-
+    with_desc = [r for r in input_rows if r.get('description', '').strip()]
+    no_desc_rows = [r for r in input_rows if not r.get('description', '').strip()]
     if no_desc_rows:
         print(f"[INFO] Writing codes without description to icd_10_code_without_any_description.csv (rows: {len(no_desc_rows)})")
         with open("icd_10_code_without_any_description.csv", "w", newline='', encoding='utf-8') as f:
@@ -117,35 +356,39 @@ def extract_synonyms(input_file, output_file, model_name="llama3.2:1b"):
             writer.writeheader()
             for row in no_desc_rows:
                 writer.writerow(row)
-    print(f"[INFO] Synonym extraction complete. Total processed: {total}, with description: {len(output_rows)}, without description: {len(no_desc_rows)}")
 
-    # Write output file with synonym column
-    fieldnames = list(input_rows[0].keys()) + ['synonym'] if 'synonym' not in input_rows[0] else list(input_rows[0].keys())
-    with open(output_file, "w", newline='', encoding='utf-8') as outfile:
-        writer = csv.DictWriter(outfile, fieldnames=fieldnames)
-        writer.writeheader()
-        for row in output_rows:
-            writer.writerow(row)
+    print(f"[INFO] Extracting synonyms using model: {model_name}")
+    fieldnames = list(reader.fieldnames) + (['synonym'] if 'synonym' not in reader.fieldnames else [])
+    cache = SqliteKV(cache_path or output_file + ".llm_cache.sqlite", table="llm_responses")
+    try:
+        failed = asyncio.run(_extract_synonyms(with_desc, fieldnames, output_file, model_name, workers, cache))
+    finally:
+        cache.close()
+
+    print(f"[INFO] Synonym extraction complete. Total: {len(input_rows)}, with description: {len(with_desc)}, "
+          f"without description: {len(no_desc_rows)}, failed: {failed}")
+    if failed:
+        print(f"{failed} codes failed; rerun the same command to resume.", file=sys.stderr)
+        sys.exit(1)
+    _sort_output(output_file, with_desc, fieldnames)
 
-    # Write codes without description to separate file
-    if no_desc_rows:
-        with open("icd_10_code_without_any_description.csv", "w", newline='', encoding='utf-8') as f:
-            writer = csv.DictWriter(f, fieldnames=reader.fieldnames)
-            writer.writeheader()
-            for row in no_desc_rows:
-                writer.writerow(row)
 
-    
 def main():
     parser = argparse.ArgumentParser(description="Fetch Wikipedia descriptions for ICD10 codes or extract synonyms.")
     parser.add_argument("--input", "-i", required=True, help="Input CSV file with titles (one per line or column)")
     parser.add_argument("--output", "-o", required=True, help="Output CSV file")
     parser.add_argument("--extract-synonyms", action="store_true", help="Extract synonyms from description using local API")
     parser.add_argument("--model", type=str, default="llama3.2:1b", help="Model name for synonym extraction (default: llama3.2:1b)")
+    parser.add_argument("--api-url", default=WIKI_API, help="MediaWiki API endpoint (default: en.wikipedia.org)")
+    parser.add_argument("--cache", default=None, help="SQLite checkpoint/cache file (default: OUTPUT.wiki_cache.sqlite, or OUTPUT.llm_cache.sqlite with --extract-synonyms)")
+    parser.add_argument("--workers", type=int, default=4, help="Concurrent Ollama requests for --extract-synonyms (default: 4)")
+    parser.add_argument("--concurrency", type=int, default=2, help="Max batches in flight (default: 2)")
+    parser.add_argument("--rate", type=float, default=3.0, help="Max API requests per second across all batches (default: 3)")
     args = parser.parse_args()
 
     if args.extract_synonyms:
-        extract_synonyms(args.input, args.output, model_name=args.model)
+        extract_synonyms(args.input, args.output, model_name=args.model,
+                         workers=args.workers, cache_path=args.cache)
         return
 
     # Read and validate input file for 'code' and 'title' columns
@@ -162,24 +405,16 @@ def main():
         print("No valid rows found in input file.", file=sys.stderr)
         sys.exit(1)
 
-    # Fetch descriptions in batches (Wikipedia API limit: ~50 titles per request)
-    batch_size = 50
-    title_to_desc = {}
+    # Fetch descriptions in batches (Wikipedia API limit: ~50 titles per request),
+    # checkpointing each finished batch so reruns resume where they stopped
+    cache = SqliteKV(args.cache or args.output + ".wiki_cache.sqlite", table="wiki_extracts")
     titles = [row['title'] for row in input_rows]
-    for i in range(0, len(titles), batch_size):
-        batch = titles[i:i+batch_size]
-        try:
-            data = wiki_summary_batch(batch)
-        except Exception as e:
-            print(f"Error fetching batch {i//batch_size+1}: {e}", file=sys.stderr)
-            sys.exit(1)
-        pages = data.get("query", {}).get("pages", {})
-        for page in pages.values():
-            title = page.get("title", "")
-            desc = page.get("extract", "")
-            if not desc:
-                print(f"Warning: No description found for title '{title}'", file=sys.stderr)
-            title_to_desc[title] = desc
+    failed = asyncio.run(fetch_descriptions(
+        titles, cache, api_url=args.api_url, batch_size=50,
+        concurrency=args.concurrency, rate=args.rate,
+    ))
+    title_to_desc = cache.get_many(titles)
+    cache.close()
 
     # Write results to output file with code, title, description columns
     with open(args.output, "w", newline='', encoding='utf-8') as outfile:
@@ -191,6 +426,9 @@ def main():
                 "title": row["title"],
                 "description": title_to_desc.get(row["title"], "")
             })
+    if failed:
+        print(f"{failed} titles failed; rerun the same command to resume.", file=sys.stderr)
+        sys.exit(1)
 
 if __name__ == "__main__":
     main()
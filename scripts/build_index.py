@@ -3,63 +3,310 @@
 # ============================================================================
 # Usage: python scripts/build_index.py --csv data/icd10_sample.csv --out data/index
 import sys
-import argparse, os, json, pickle, pandas as pd
-from sklearn.feature_extraction.text import TfidfVectorizer
+import argparse, os, json, time, pandas as pd
+from contextlib import contextmanager
+import numpy as np
 sys.path.append(os.path.join(os.path.dirname(__file__), 'utils'))
-from utils.text_utils import build_search_text
-from utils.pg_utils import ensure_icd10_table, upsert_icd10_codes
+from utils.text_utils import build_search_text_series
+from utils.pg_utils import (ensure_icd10_table, bulk_load_icd10, bulk_load_vectors, delete_icd10_codes,
+                            get_index_version, set_index_version, has_vectors)
 from utils.db import get_pg_conn
+from utils.vector_index import (write_vector_index, write_faiss_index, faiss_config, EMBEDDINGS_FILE, CODE_IDS_FILE,
+                                CATEGORY_CENTROIDS_FILE, FAISS_FILE)
+from utils.manifest import content_hashes, index_version, diff_hashes, load_manifest, write_manifest
+from utils.bm25 import BM25Index
+from utils.tfidf import TfidfIndex
+from utils.catalog import CodeCatalog
+from utils.index_store import FORMAT_FILE, read_format, write_format
+from utils.multi_vector import (code_vector_texts, write_multi_vectors, load_multi_vectors,
+                                read_config as read_mv_config, config_matches, DTYPES, MV_FILES)
+from utils.embedder import export_onnx, default_onnx_dir, ONNX_CONFIG_FILE
 from sentence_transformers import SentenceTransformer
 
-if __name__ == "__main__":
-    sys.path.append(os.path.join(os.path.dirname(__file__), 'utils'))
-    from utils.text_utils import build_search_text
+TIMINGS = {}
+
+# Local artifacts that must exist for a build to count as up to date
+ARTIFACTS = [
+    FORMAT_FILE, EMBEDDINGS_FILE, CODE_IDS_FILE, CATEGORY_CENTROIDS_FILE,
+    "title.bin", "description.bin", "search_text.bin",
+    "tfidf_data.npy", "tfidf_terms.npy", "tfidf_idf.npy",
+    "bm25_data.npy", "bm25_terms.npy",
+]
+# Artifacts from before the mmap format; removed on rebuild
+LEGACY_ARTIFACTS = ["codes_meta.json", "tfidf_vectorizer.pkl", "tfidf_matrix.pkl", "bm25_postings.npz", "bm25_vocab.json"]
+# Above this share of changed codes, drop + rebuild the HNSW index instead of
+# maintaining it row by row
+HNSW_REBUILD_FRACTION = 0.2
+
+
+@contextmanager
+def stage(name):
+    """Times one build stage and prints it as it finishes."""
+    t0 = time.perf_counter()
+    yield
+    TIMINGS[name] = time.perf_counter() - t0
+    print(f"[build] {name}: {TIMINGS[name]:.2f}s")
+
+
+def format_current(out_dir):
+    try:
+        read_format(out_dir)
+        return True
+    except RuntimeError:
+        return False
+
+
+def load_previous_embeddings(out_dir, manifest, model_name):
+    """
+    Embeddings from the last build as {code: row vector}, or None when they
+    cannot be reused (no manifest, other model, missing files).
+    """
+    if manifest is None or manifest.get("model") != model_name:
+        return None
+    try:
+        emb = np.load(os.path.join(out_dir, EMBEDDINGS_FILE), mmap_mode="r")
+        ids = np.load(os.path.join(out_dir, CODE_IDS_FILE))
+    except (OSError, ValueError):
+        return None
+    if len(ids) != len(emb):
+        return None
+    return {str(c): i for i, c in enumerate(ids)}, emb
+
+
+def reuse_multi_vectors(prev_mv, previous, codes, to_embed, rows):
+    """
+    (embeddings, have): vectors of unchanged codes copied from the previous
+    multi-vector build; have[i] is False where vector i still needs encoding.
+    """
+    dim = previous[1].shape[1] if previous is not None else None
+    if prev_mv is None or previous is None:
+        return (np.empty((len(rows), dim), dtype=np.float32) if dim else None), np.zeros(len(rows), dtype=bool)
+    _, prev_emb, prev_rows, _ = prev_mv
+    prev_row = previous[0]
+    prev_starts = np.searchsorted(prev_rows, np.arange(len(prev_row) + 1))
+    starts = np.searchsorted(rows, np.arange(len(codes) + 1))
+    out = np.empty((len(rows), prev_emb.shape[1]), dtype=np.float32)
+    have = np.zeros(len(rows), dtype=bool)
+    for i, c in enumerate(codes):
+        r = prev_row.get(c)
+        if r is None or c in to_embed:
+            continue
+        a, b, lo, hi = prev_starts[r], prev_starts[r + 1], starts[i], starts[i + 1]
+        if b - a == hi - lo:  # same search_text hash, so same vector texts
+            out[lo:hi] = prev_emb[a:b]
+            have[lo:hi] = True
+    return out, have
+
 
+def encode_texts(model, texts, batch_size=256, workers=1):
+    """
+    Encodes all texts in large batches; workers > 1 spreads the batches over
+    a pool of CPU processes. Returns a contiguous (n, dim) float32 array.
+    """
+    if workers > 1:
+        pool = model.start_multi_process_pool(["cpu"] * workers)
+        try:
+            emb = model.encode_multi_process(texts, pool, batch_size=batch_size,
+                                             normalize_embeddings=True)
+        finally:
+            model.stop_multi_process_pool(pool)
+    else:
+        emb = model.encode(texts, batch_size=batch_size, normalize_embeddings=True,
+                           convert_to_numpy=True, show_progress_bar=False)
+    return np.ascontiguousarray(emb, dtype=np.float32)
+
+
+if __name__ == "__main__":
     ap = argparse.ArgumentParser()
     ap.add_argument("--csv", required=True)
     ap.add_argument("--out", required=True)
     # Model name argument
     ap.add_argument("--model-name", default="sentence-transformers/all-MiniLM-L6-v2", help="Model name to use (default: sentence-transformers/all-MiniLM-L6-v2)")
+    # Embedding throughput
+    ap.add_argument("--batch-size", default=256, type=int, help="Texts per encode batch (default: 256)")
+    ap.add_argument("--workers", default=1, type=int, help="CPU encode processes; >1 uses a process pool (default: 1)")
     # PostgreSQL connection arguments
     ap.add_argument("--pg-host", default=None, help="PostgreSQL host")
     ap.add_argument("--pg-port", default=5432, type=int, help="PostgreSQL port")
     ap.add_argument("--pg-user", default=None, help="PostgreSQL user")
     ap.add_argument("--pg-password", default=None, help="PostgreSQL password")
     ap.add_argument("--pg-dbname", default=None, help="PostgreSQL database name")
+    ap.add_argument("--pg-keep-index", action="store_true", help="Keep the HNSW index during the load instead of dropping and rebuilding it")
+    ap.add_argument("--pg-maintenance-work-mem", default="1GB", help="maintenance_work_mem for the HNSW rebuild (default: 1GB)")
+    ap.add_argument("--pg-parallel-workers", default=4, type=int, help="max_parallel_maintenance_workers for the HNSW rebuild (default: 4)")
+    # In-process ANN index
+    ap.add_argument("--faiss-index", default="hnsw", choices=["hnsw", "ivfpq", "none"], help="FAISS index type to write next to embeddings.npy (default: hnsw)")
+    # ONNX / int8 query embedders for the backend (AUTOCODER_EMBED_BACKEND=onnx|onnx-int8)
+    ap.add_argument("--export-onnx", action="store_true", help="Export the model to <out>/onnx (fp32 + int8) if not already exported")
+    # Multi-vector representations (title, description chunks, synonyms)
+    ap.add_argument("--multi-vector", action="store_true", help="Also embed title, description chunks and synonyms separately (AUTOCODER_VECTOR_BACKEND=multi, icd10_vectors)")
+    ap.add_argument("--vector-dtype", default="float16", choices=DTYPES, help="Storage type of the multi-vector embeddings (default: float16)")
+    # Incremental builds
+    ap.add_argument("--full", action="store_true", help="Ignore manifest.json and re-embed / reload every code")
     args = ap.parse_args()
+    t_start = time.perf_counter()
 
     # Connect to PostgreSQL using centralized db util
     pg_conn = get_pg_conn()
 
     os.makedirs(args.out, exist_ok=True)
-    df = pd.read_csv(args.csv)
+    with stage("read_csv"):
+        df = pd.read_csv(args.csv)
+
+    if args.export_onnx:
+        onnx_dir = default_onnx_dir(args.out)
+        try:
+            with open(os.path.join(onnx_dir, ONNX_CONFIG_FILE)) as f:
+                exported = json.load(f).get("model_name")
+        except (OSError, ValueError):
+            exported = None
+        if exported != args.model_name:
+            with stage("onnx_export"):
+                export_onnx(SentenceTransformer(args.model_name), args.model_name, onnx_dir)
+
+    with stage("search_text"):
+        df["search_text"] = build_search_text_series(df)
+    codes = df["code"].astype(str).tolist()
+
+    # --- Diff against the previous build ---
+    hashes = content_hashes(codes, df["search_text"], args.model_name)
+    version = index_version(hashes, args.model_name)
+    prev = None if args.full else load_manifest(args.out)
+    previous = None if args.full else load_previous_embeddings(args.out, prev, args.model_name)
+    prev_hashes = prev["codes"] if (prev and previous) else {}
+    prev_mv = load_multi_vectors(args.out) if args.multi_vector and previous is not None else None
+    if prev_mv is not None and not config_matches(prev_mv[0], args.vector_dtype):
+        prev_mv = None
+    added, changed, removed = diff_hashes(prev_hashes, hashes)
+    print(f"[build] index version {version}: {len(added)} new, {len(changed)} changed, {len(removed)} removed codes")
 
     # Create table in PostgreSQL if connected
+    pg_version = None
     if pg_conn is not None:
-        ensure_icd10_table(pg_conn)
+        ensure_icd10_table(pg_conn, multi_vector=args.multi_vector)
+        pg_version = get_index_version(pg_conn)
+        if args.multi_vector and pg_version is not None and not has_vectors(pg_conn):
+            pg_version = None  # first --multi-vector build against this database: full load
 
+    artifacts_current = (
+        prev is not None and prev.get("index_version") == version
+        and all(os.path.exists(os.path.join(args.out, f)) for f in ARTIFACTS)
+        and format_current(args.out)
+        and (not args.multi_vector or config_matches(read_mv_config(args.out), args.vector_dtype))
+    )
+    # The FAISS index is checked on its own: a changed --faiss-index (or a
+    # deleted faiss.index) only needs that stage rebuilt
+    faiss_cfg = faiss_config(args.faiss_index)
+    faiss_current = (
+        prev is not None and prev.get("faiss") == faiss_cfg
+        and (faiss_cfg is None or os.path.exists(os.path.join(args.out, FAISS_FILE)))
+    )
+    if artifacts_current and not faiss_current:
+        with stage("faiss_index"):
+            write_faiss_index(args.out, np.load(os.path.join(args.out, EMBEDDINGS_FILE), mmap_mode="r"), args.faiss_index)
+        write_manifest(args.out, hashes, args.model_name, faiss=faiss_cfg)
+    if artifacts_current and (pg_conn is None or pg_version == version):
+        print(f"Index at {args.out} is up to date (version {version}); nothing to do.")
+        sys.exit(0)
 
-    # --- Load embedding model ---
-    model = SentenceTransformer(args.model_name)
-    dim = model.get_sentence_embedding_dimension()
-    print(f"Loaded model: {args.model_name} (dim={dim})")
+    # --- Embed only new / changed codes ---
+    to_embed = set(added) | set(changed)
+    emb = model = None
+    if to_embed:
+        with stage("load_model"):
+            model = SentenceTransformer(args.model_name)
+        dim = model.get_sentence_embedding_dimension()
+        print(f"Loaded model: {args.model_name} (dim={dim})")
+        rows = [i for i, c in enumerate(codes) if c in to_embed]
+        with stage("embed"):
+            new_emb = encode_texts(model, df["search_text"].iloc[rows].tolist(), batch_size=args.batch_size, workers=args.workers)
+        print(f"[build] embedded {len(rows)} codes at {len(rows) / max(TIMINGS['embed'], 1e-9):.1f} codes/s")
+        emb = np.empty((len(codes), new_emb.shape[1]), dtype=np.float32)
+        emb[rows] = new_emb
+    if previous is not None:
+        prev_row, prev_emb = previous
+        keep = [(i, prev_row[c]) for i, c in enumerate(codes) if c not in to_embed]
+        if emb is None:
+            emb = np.empty((len(codes), prev_emb.shape[1]), dtype=np.float32)
+        if keep:
+            new_rows, old_rows = map(list, zip(*keep))
+            emb[new_rows] = prev_emb[old_rows]
 
-    df["search_text"] = df.apply(build_search_text, axis=1)
-    df["embedding"] = df["search_text"].apply(lambda x: model.encode(x, normalize_embeddings=True).tolist())
+    # --- Multi-vector: embed the vector texts of new / changed codes ---
+    if args.multi_vector:
+        with stage("multi_vector_texts"):
+            mv_rows, mv_kinds, mv_texts = code_vector_texts(df)
+        mv_emb, have = reuse_multi_vectors(prev_mv, previous, codes, to_embed, mv_rows)
+        todo = np.flatnonzero(~have)
+        if len(todo):
+            if model is None:
+                with stage("load_model"):
+                    model = SentenceTransformer(args.model_name)
+            with stage("embed_multi_vector"):
+                new_mv = encode_texts(model, [mv_texts[i] for i in todo], batch_size=args.batch_size, workers=args.workers)
+            if mv_emb is None:
+                mv_emb = np.empty((len(mv_rows), new_mv.shape[1]), dtype=np.float32)
+            mv_emb[todo] = new_mv
+        print(f"[build] multi-vector: {len(mv_rows)} vectors ({len(mv_rows) / len(codes):.1f}/code), "
+              f"{len(todo)} embedded, {len(mv_rows) - len(todo)} reused")
 
+    # --- Sync icd10_codes / icd10_meta if PostgreSQL connection is available ---
+    if pg_conn is not None and pg_version != version:
+        delta = prev is not None and previous is not None and pg_version == prev.get("index_version")
+        load_rows = [i for i, c in enumerate(codes) if c in to_embed] if delta else list(range(len(codes)))
+        with stage("pg_load"):
+            if load_rows:
+                rebuild = not args.pg_keep_index and len(load_rows) > HNSW_REBUILD_FRACTION * len(codes)
+                bulk_load_icd10(pg_conn, df.iloc[load_rows], emb[load_rows], rebuild_index=rebuild,
+                                maintenance_work_mem=args.pg_maintenance_work_mem,
+                                parallel_workers=args.pg_parallel_workers)
+                if args.multi_vector:
+                    sel = np.isin(mv_rows, load_rows)
+                    bulk_load_vectors(pg_conn, [codes[i] for i in load_rows], [codes[r] for r in mv_rows[sel]],
+                                      mv_kinds[sel], mv_emb[sel], rebuild_index=rebuild)
+            if delta:
+                delete_icd10_codes(pg_conn, removed)
+            else:
+                # Full sync: drop anything the CSV no longer has
+                with pg_conn.cursor() as cur:
+                    cur.execute("SELECT code FROM icd10_codes WHERE NOT (code = ANY(%s));", (codes,))
+                    stale = [r[0] for r in cur.fetchall()]
+                delete_icd10_codes(pg_conn, stale)
+            set_index_version(pg_conn, version)
 
-    # Insert rows into icd10_codes table if PostgreSQL connection is available
-    if pg_conn is not None:
-        upsert_icd10_codes(pg_conn, df)
+    if not artifacts_current:
+        with stage("tfidf"):
+            TfidfIndex.build(df["search_text"].tolist()).save(args.out)
+
+        # BM25 inverted index for the lexical / hybrid engines
+        with stage("bm25"):
+            BM25Index.build(df["search_text"].tolist()).save(args.out)
+
+        # Embeddings + aligned code ids for the FAISS / NumPy engines
+        with stage("vector_index"):
+            write_vector_index(args.out, emb, codes, faiss_kind=args.faiss_index)
+
+        with stage("multi_vector"):
+            if args.multi_vector:
+                write_multi_vectors(args.out, mv_rows, mv_kinds, mv_emb, dtype=args.vector_dtype)
+            else:
+                # Rows would no longer line up with this build's catalog
+                for name in MV_FILES:
+                    path = os.path.join(args.out, name)
+                    if os.path.exists(path):
+                        os.remove(path)
 
-    vec = TfidfVectorizer(ngram_range=(1,2), min_df=1)
-    X = vec.fit_transform(df["search_text"].tolist())
+        with stage("write_meta"):
+            CodeCatalog.save(args.out, df)
+            write_format(args.out, len(codes), dim=int(emb.shape[1]))
+            for name in LEGACY_ARTIFACTS:
+                path = os.path.join(args.out, name)
+                if os.path.exists(path):
+                    os.remove(path)
 
-    with open(os.path.join(args.out, "codes_meta.json"), "w") as f:
-        json.dump(df[["code","title","description"]].to_dict(orient="records"), f)
-    with open(os.path.join(args.out, "tfidf_vectorizer.pkl"), "wb") as f:
-        pickle.dump(vec, f)
-    with open(os.path.join(args.out, "tfidf_matrix.pkl"), "wb") as f:
-        pickle.dump(X, f)
+    # Written last, so an interrupted build is never recorded as current
+    write_manifest(args.out, hashes, args.model_name, faiss=faiss_cfg)
 
-    print(f"Index built at {args.out}")
\ No newline at end of file
+    total = time.perf_counter() - t_start
+    print("[build] stage timings: " + ", ".join(f"{k}={v:.2f}s" for k, v in TIMINGS.items()) + f", total={total:.2f}s")
+    print(f"Index built at {args.out} (version {version})")
@@ -0,0 +1,389 @@
+# ============================================================================
+# File: scripts/bulk_code.py
+# ============================================================================
+"""
+Offline bulk coding of a large note file against a built index
+
+Streams a CSV / JSONL of notes in chunks of --chunk-size rows, codes each
+chunk in a pool of worker processes and appends the top-k codes with their
+confidences to the output as chunks finish, in input order. Workers open
+the index the way the backend does (code_ids / embeddings / BM25 postings /
+string columns are memory-mapped), so N workers share one copy of the
+index pages. At most 2 x --workers chunks are in flight, which bounds
+memory regardless of the size of the input.
+
+Usage:
+    python scripts/bulk_code.py --input notes.csv --out codes.jsonl --index data/index
+    python scripts/bulk_code.py --input notes.jsonl --out codes_parquet --format parquet --workers 4
+    python scripts/bulk_code.py --input notes.csv --out codes.jsonl --resume
+    python scripts/bulk_code.py --input notes.csv --out codes.jsonl --rationale --top-k 3
+
+Options:
+    --input            CSV or JSONL (one object per line) of notes; .gz is fine for CSV
+    --input-format     csv | jsonl (default: from the file extension)
+    --note-column      Column / key holding the note text (default: note)
+    --id-column        Column / key copied to the output as "id" (default: none)
+    --out              Output .jsonl file, or a directory of Parquet parts with --format parquet
+    --format           jsonl | parquet (default: jsonl; parquet needs pyarrow)
+    --index            Index directory from build_index.py (default: AUTOCODER_INDEX_DIR or data/index)
+    --engine           dense | lexical | hybrid (default: hybrid)
+    --vector-backend   numpy | faiss | category | multi (default: AUTOCODER_VECTOR_BACKEND if local, else numpy)
+    --model-name       Embedding model (default: AUTOCODER_MODEL_NAME or all-MiniLM-L6-v2)
+    --backend          torch | onnx | onnx-int8 (default: AUTOCODER_EMBED_BACKEND or torch)
+    --onnx-dir         ONNX export directory (default: INDEX/onnx)
+    --top-k            Codes per note (default: 5)
+    --candidates       Per-engine depth before hybrid fusion (default: 50)
+    --fusion           rrf | weighted (default: rrf)
+    --chunk-size       Notes per chunk handed to a worker (default: 512)
+    --batch-size       Embedding batch size inside a worker (default: 64)
+    --workers          Worker processes; 0 codes in this process (default: CPU count)
+    --threads          Torch / onnxruntime threads per worker (default: CPU count / workers)
+    --rationale        Also ask the LLM (rationale.py, LLM_*) for a rationale per code
+    --llm-concurrency  LLM calls in flight with --rationale (default: LLM_BULK_CONCURRENCY or 16)
+    --offset           Skip the first N input rows
+    --resume           Continue after the last row already in --out (ignores --offset)
+
+Output:
+    One record per input row, in input order:
+        {"row": 1234, "id": "...", "codes": [{"code": "M545", "title": "...", "confidence": 0.71}, ...]}
+    "row" is the 0-based row of the note in the input, so a run can be resumed
+    from any output. JSONL is flushed after every chunk; a partial last line
+    left by a crash is dropped on --resume. Parquet output is one part file
+    per chunk (part-<first row>.parquet), each written to a temp file and
+    renamed, so a crash never leaves a truncated part.
+    Confidences are the engine's scores: cosine for dense, BM25 for lexical,
+    the fused score for hybrid (see utils/fusion.py).
+"""
+import argparse
+import asyncio
+import collections
+import glob
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing as mp
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(__file__), 'utils'))
+from utils.catalog import CodeCatalog
+from utils.bm25 import BM25Index
+from utils.fusion import fuse, max_pool
+from utils.index_store import read_format
+from utils.preprocess import prepare_notes
+from utils.vector_index import load_vector_index
+
+LOG_EVERY_S = 10.0
+# The backend's LLM_CONCURRENCY is sized for one request; a bulk run has a whole chunk to annotate
+LLM_BULK_CONCURRENCY = int(os.getenv("LLM_BULK_CONCURRENCY", "16"))
+VECTOR_RATIONALE = "Vector similarity to {title} is {score:.2f}"
+BM25_RATIONALE = "Keywords match {title} (BM25 {score:.2f})"
+
+# -----------------------------------------------------------------------------
+# Input
+# -----------------------------------------------------------------------------
+def input_format(path, fmt=None):
+    if fmt:
+        return fmt
+    name = path.lower().removesuffix(".gz")
+    return "jsonl" if name.endswith((".jsonl", ".ndjson", ".json")) else "csv"
+
+
+def read_chunks(path, fmt, note_col, id_col, chunk_size, offset=0):
+    """Yields (first row, ids, notes) per chunk, starting at row `offset`."""
+    if fmt == "csv":
+        cols = [note_col] + ([id_col] if id_col else [])
+        reader = pd.read_csv(path, usecols=cols, chunksize=chunk_size, dtype=str, keep_default_na=False,
+                             skiprows=(lambda i: 0 < i <= offset) if offset else None)
+        row = offset
+        for df in reader:
+            if df.empty:  # offset at or past the end of the file
+                break
+            ids = df[id_col].tolist() if id_col else [None] * len(df)
+            yield row, ids, df[note_col].tolist()
+            row += len(df)
+        return
+    row, ids, notes = 0, [], []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            if row >= offset:
+                obj = json.loads(line)
+                ids.append(None if not id_col or obj.get(id_col) is None else str(obj[id_col]))
+                notes.append(obj.get(note_col) or "")
+                if len(notes) == chunk_size:
+                    yield row - len(notes) + 1, ids, notes
+                    ids, notes = [], []
+            row += 1
+    if notes:
+        yield row - len(notes), ids, notes
+
+# -----------------------------------------------------------------------------
+# Output
+# -----------------------------------------------------------------------------
+class JsonlWriter:
+    def __init__(self, path):
+        self.path = path
+        self.f = open(path, "a", encoding="utf-8")
+
+    def write(self, first_row, records):
+        self.f.write("".join(json.dumps(r, ensure_ascii=False) + "\n" for r in records))
+        self.f.flush()
+
+    def close(self):
+        self.f.close()
+
+    @staticmethod
+    def resume_offset(path):
+        """Row after the last complete record; truncates a partial last line."""
+        if not os.path.exists(path):
+            return 0
+        with open(path, "rb+") as f:
+            size = f.seek(0, os.SEEK_END)
+            tail, pos = b"", size
+            # Read backwards until the tail holds one complete line plus its start
+            while pos > 0 and tail.count(b"\n") < 2:
+                step = min(pos, 1 << 16)
+                pos -= step
+                f.seek(pos)
+                tail = f.read(step) + tail
+            end = tail.rfind(b"\n") + 1
+            if end < len(tail):
+                print(f"[bulk] dropping partial last line of {path}")
+                f.truncate(pos + end)
+            lines = tail[:end].splitlines()
+        return json.loads(lines[-1])["row"] + 1 if lines else 0
+
+
+class ParquetWriter:
+    def __init__(self, path, rationale=False):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise SystemExit("--format parquet needs pyarrow (pip install pyarrow)")
+        self.pa, self.pq = pa, pq
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        fields = [("code", pa.string()), ("title", pa.string()), ("confidence", pa.float32())]
+        if rationale:
+            fields.append(("rationale", pa.string()))
+        self.schema = pa.schema([("row", pa.int64()), ("id", pa.string()),
+                                 ("codes", pa.list_(pa.struct(fields)))])
+
+    def write(self, first_row, records):
+        table = self.pa.Table.from_pylist(records, schema=self.schema)
+        part = os.path.join(self.path, f"part-{first_row:012d}.parquet")
+        self.pq.write_table(table, part + ".tmp")
+        os.replace(part + ".tmp", part)
+
+    def close(self):
+        pass
+
+    @staticmethod
+    def resume_offset(path):
+        import pyarrow.parquet as pq
+        for tmp in glob.glob(os.path.join(path, "*.parquet.tmp")):
+            os.remove(tmp)
+        offset = 0
+        for part in glob.glob(os.path.join(path, "part-*.parquet")):
+            first = int(os.path.basename(part)[5:-8])
+            offset = max(offset, first + pq.read_metadata(part).num_rows)
+        return offset
+
+# -----------------------------------------------------------------------------
+# Workers (one index + embedder per process, index pages shared via mmap)
+# -----------------------------------------------------------------------------
+_W = {}
+
+
+def init_worker(opts):
+    if opts["engine"] != "lexical" and opts["backend"] == "torch":
+        import torch
+        torch.set_num_threads(opts["threads"])
+    read_format(opts["index"])
+    _W.update(opts)
+    _W["catalog"] = CodeCatalog.load(opts["index"])
+    if opts["engine"] != "dense":
+        _W["bm25"] = BM25Index.load(opts["index"])
+    if opts["engine"] != "lexical":
+        from utils.embedder import load_embedder
+        index, code_ids = load_vector_index(opts["vector_backend"], opts["index"])
+        if len(code_ids) != len(_W["catalog"]) or len(index) != len(code_ids):
+            raise RuntimeError("vector index is not aligned with the code catalog; rebuild the index")
+        _W["vectors"] = index
+        _W["embedder"] = load_embedder(opts["model_name"], opts["backend"], opts["onnx_dir"])
+
+
+def dense_search(prepared, top_k):
+    """Every chunk of every note embedded in batches; codes max-pooled per note."""
+    chunks = [c for p in prepared for c in p.chunks]
+    vecs = _W["embedder"].encode(chunks, batch_size=_W["batch_size"])
+    scores, idx = _W["vectors"].search(vecs, top_k)
+    hits = [_W["catalog"].results(i, s, VECTOR_RATIONALE) for s, i in zip(scores, idx)]
+    out, i = [], 0
+    for p in prepared:
+        out.append(max_pool(hits[i:i + len(p.chunks)], top_k))
+        i += len(p.chunks)
+    return out
+
+
+def bm25_search(texts, top_k):
+    scores, idx = _W["bm25"].search_batch(texts, top_k)
+    return [_W["catalog"].results(i, s, BM25_RATIONALE, min_score=0.0) for s, i in zip(scores, idx)]
+
+
+def code_chunk(first_row, ids, notes):
+    """Same first stage as backend/app.py, without the caches and the micro-batcher."""
+    prepared = prepare_notes(notes)
+    top_k, engine = _W["top_k"], _W["engine"]
+    if engine == "dense":
+        results = dense_search(prepared, top_k)
+    elif engine == "lexical":
+        results = bm25_search([p.text for p in prepared], top_k)
+    else:
+        depth = max(_W["candidates"], top_k)
+        dense = dense_search(prepared, depth)
+        lexical = bm25_search([p.text for p in prepared], depth)
+        results = [fuse([d, l], method=_W["fusion"], top_k=top_k) for d, l in zip(dense, lexical)]
+    return [
+        {"row": first_row + n, "id": i,
+         "codes": [{"code": r["code"], "title": r["title"], "confidence": round(r["confidence"], 4)} for r in res]}
+        for n, (i, res) in enumerate(zip(ids, results))
+    ]
+
+# -----------------------------------------------------------------------------
+# Driver
+# -----------------------------------------------------------------------------
+async def add_rationales(engine, notes, records):
+    """
+    LLM rationale for every code of the chunk. annotate()'s deadline is per
+    note, so only as many notes run at once as the engine has call slots for
+    all of their codes; a note queued behind the whole chunk would spend its
+    deadline waiting and fall back to the template.
+    """
+    per_note = max((len(r["codes"]) for r in records), default=1)
+    gate = asyncio.Semaphore(max(1, engine.concurrency // max(per_note, 1)))
+
+    async def one(note, record):
+        async with gate:
+            await engine.annotate(note, record["codes"])
+
+    await asyncio.gather(*(one(n, r) for n, r in zip(notes, records)))
+
+
+def run(args):
+    fmt = input_format(args.input, args.input_format)
+    writer_cls = ParquetWriter if args.format == "parquet" else JsonlWriter
+    offset = args.offset
+    if args.resume:
+        offset = writer_cls.resume_offset(args.out) if os.path.exists(args.out) else 0
+        print(f"[bulk] resuming at row {offset}")
+    elif os.path.exists(args.out) and offset == 0 and (args.format == "jsonl" or os.listdir(args.out)):
+        raise SystemExit(f"{args.out} already exists; pass --resume to continue it or remove it")
+    writer = JsonlWriter(args.out) if args.format == "jsonl" else ParquetWriter(args.out, args.rationale)
+
+    workers = os.cpu_count() if args.workers is None else args.workers
+    threads = args.threads or max(1, (os.cpu_count() or 1) // max(workers, 1))
+    # Inherited by spawned workers before they import torch / onnxruntime
+    os.environ.setdefault("OMP_NUM_THREADS", str(threads))
+    os.environ.setdefault("AUTOCODER_ONNX_THREADS", str(threads))
+    opts = {
+        "index": args.index, "engine": args.engine, "vector_backend": args.vector_backend,
+        "model_name": args.model_name, "backend": args.backend or os.getenv("AUTOCODER_EMBED_BACKEND", "torch"),
+        "onnx_dir": args.onnx_dir or os.path.join(args.index, "onnx"), "top_k": args.top_k,
+        "candidates": args.candidates, "fusion": args.fusion, "batch_size": args.batch_size, "threads": threads,
+    }
+    print(f"[bulk] {args.input} ({fmt}) -> {args.out} ({args.format}), engine {args.engine}, "
+          f"{workers} worker(s) x {threads} thread(s), chunks of {args.chunk_size}")
+
+    llm, loop = None, None
+    if args.rationale:
+        from utils.rationale import RationaleEngine
+        llm = RationaleEngine(concurrency=max(args.llm_concurrency, args.top_k))
+        loop = asyncio.new_event_loop()
+
+    pool = None
+    if workers > 0:
+        pool = ProcessPoolExecutor(workers, mp_context=mp.get_context("spawn"),
+                                   initializer=init_worker, initargs=(opts,))
+    else:
+        init_worker(opts)
+
+    done, t0 = 0, time.perf_counter()
+    last_log, last_done = t0, 0
+    pending = collections.deque()
+    chunks = read_chunks(args.input, fmt, args.note_column, args.id_column, args.chunk_size, offset)
+
+    def flush_one():
+        nonlocal done
+        first_row, notes, fut = pending.popleft()
+        records = fut.result() if pool else fut
+        if llm is not None:
+            loop.run_until_complete(add_rationales(llm, notes, records))
+        writer.write(first_row, records)
+        done += len(records)
+
+    try:
+        for first_row, ids, notes in chunks:
+            if pool:
+                pending.append((first_row, notes, pool.submit(code_chunk, first_row, ids, notes)))
+                # Bounded window: the reader never gets more than 2 chunks per worker ahead
+                if len(pending) < 2 * workers:
+                    continue
+            else:
+                pending.append((first_row, notes, code_chunk(first_row, ids, notes)))
+            flush_one()
+            now = time.perf_counter()
+            if now - last_log >= LOG_EVERY_S:
+                print(f"[bulk] {offset + done} rows, {(done - last_done) / (now - last_log):.0f} notes/s")
+                last_log, last_done = now, done
+        while pending:
+            flush_one()
+    finally:
+        writer.close()
+        if pool:
+            pool.shutdown(cancel_futures=True)
+        if llm is not None:
+            loop.run_until_complete(llm.aclose())
+            loop.close()
+
+    dt = time.perf_counter() - t0
+    if not done:
+        print(f"[bulk] nothing to code after row {offset}")
+        return
+    print(f"[bulk] coded {done} notes (rows {offset}..{offset + done - 1}) in {dt:.1f}s: {done / dt:.1f} notes/s")
+    if llm is not None and (llm.timeouts or llm.errors):
+        print(f"[bulk] LLM: {llm.timeouts} timed out, {llm.errors} failed (templated fallback used)")
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--input", required=True)
+    ap.add_argument("--input-format", choices=["csv", "jsonl"], default=None)
+    ap.add_argument("--note-column", default="note")
+    ap.add_argument("--id-column", default=None)
+    ap.add_argument("--out", required=True)
+    ap.add_argument("--format", choices=["jsonl", "parquet"], default="jsonl")
+    ap.add_argument("--index", default=os.getenv("AUTOCODER_INDEX_DIR", "data/index"))
+    ap.add_argument("--engine", choices=["dense", "lexical", "hybrid"], default="hybrid")
+    local = os.getenv("AUTOCODER_VECTOR_BACKEND", "numpy")
+    ap.add_argument("--vector-backend", choices=["numpy", "faiss", "category", "multi"],
+                    default=local if local != "pgvector" else "numpy")
+    ap.add_argument("--model-name", default=os.getenv("AUTOCODER_MODEL_NAME", "sentence-transformers/all-MiniLM-L6-v2"))
+    ap.add_argument("--backend", default=None)
+    ap.add_argument("--onnx-dir", default=None)
+    ap.add_argument("--top-k", default=5, type=int)
+    ap.add_argument("--candidates", default=50, type=int)
+    ap.add_argument("--fusion", choices=["rrf", "weighted"], default="rrf")
+    ap.add_argument("--chunk-size", default=512, type=int)
+    ap.add_argument("--batch-size", default=64, type=int)
+    ap.add_argument("--workers", default=None, type=int)
+    ap.add_argument("--threads", default=None, type=int)
+    ap.add_argument("--rationale", action="store_true")
+    ap.add_argument("--llm-concurrency", default=LLM_BULK_CONCURRENCY, type=int)
+    ap.add_argument("--offset", default=0, type=int)
+    ap.add_argument("--resume", action="store_true")
+    run(ap.parse_args())
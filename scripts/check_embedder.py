@@ -0,0 +1,103 @@
+# ============================================================================
+# File: scripts/check_embedder.py
+# ============================================================================
+"""
+Recall guard for the ONNX / int8 query embedders
+
+Encodes the evaluation notes with the fp32 torch baseline and with the
+candidate backend, searches both against the index's embeddings.npy, and
+compares the top-k code sets. Exits non-zero when the mean overlap falls
+below --min-overlap, so a faster backend can't silently cost recall.
+tests/test_check_embedder.py runs the same check under pytest.
+
+Usage:
+    python scripts/check_embedder.py --index data/index --backend onnx-int8
+    python scripts/check_embedder.py --index data/index --backend onnx --k 5 --min-overlap 0.95
+
+Options:
+    --index        Index directory (embeddings.npy, onnx/ from build_index.py --export-onnx)
+    --backend      Candidate backend: onnx | onnx-int8 (default: onnx-int8)
+    --model-name   Model the index was built with (default: AUTOCODER_MODEL_NAME or all-MiniLM-L6-v2)
+    --seeds        JSONL with a "note" field per line (default: evals/seeds.jsonl)
+    --sample       Also use this many catalog search texts as queries (default: 200)
+    --k            Top-k to compare (default: 10)
+    --min-overlap  Minimum mean |top-k ∩ top-k| / k (default: 0.9)
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(__file__), 'utils'))
+from utils.embedder import load_embedder, default_onnx_dir
+from utils.vector_index import NumpyIndex
+from utils.catalog import CodeCatalog
+
+
+def read_notes(path):
+    with open(path) as f:
+        return [json.loads(line)["note"] for line in f if line.strip()]
+
+
+def timed_encode(embedder, notes):
+    t0 = time.perf_counter()
+    # One note per call, like /suggest
+    vecs = np.vstack([embedder.encode([n]) for n in notes])
+    return vecs, (time.perf_counter() - t0) / max(len(notes), 1) * 1000
+
+
+def query_notes(index_dir, seeds, sample, seed=0):
+    """The seed notes plus `sample` random catalog search texts."""
+    notes = read_notes(seeds)
+    if sample:
+        texts = CodeCatalog.load(index_dir).search_texts
+        rows = np.random.default_rng(seed).choice(len(texts), size=min(sample, len(texts)), replace=False)
+        notes += [texts[int(i)] for i in rows]
+    return notes
+
+
+def topk_overlap(index, baseline, candidate, notes, k):
+    """Report comparing candidate's top-k codes (and vectors) with the baseline's."""
+    base_vecs, base_ms = timed_encode(baseline, notes)
+    cand_vecs, cand_ms = timed_encode(candidate, notes)
+    _, base_idx = index.search(base_vecs, k)
+    _, cand_idx = index.search(cand_vecs, k)
+    overlap = np.array([len(set(a) & set(b)) / k for a, b in zip(base_idx, cand_idx)])
+    cosine = (base_vecs * cand_vecs).sum(axis=1)
+    return {
+        "backend": candidate.name,
+        "queries": len(notes),
+        "k": k,
+        "mean_overlap": round(float(overlap.mean()), 4),
+        "min_overlap": round(float(overlap.min()), 4),
+        "min_cosine_to_fp32": round(float(cosine.min()), 4),
+        "fp32_ms_per_query": round(base_ms, 2),
+        f"{candidate.name}_ms_per_query": round(cand_ms, 2),
+    }
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--index", default=os.getenv("AUTOCODER_INDEX_DIR", "data/index"))
+    ap.add_argument("--backend", default="onnx-int8", choices=["onnx", "onnx-int8"])
+    ap.add_argument("--model-name", default=os.getenv("AUTOCODER_MODEL_NAME", "sentence-transformers/all-MiniLM-L6-v2"))
+    ap.add_argument("--seeds", default="evals/seeds.jsonl")
+    ap.add_argument("--sample", default=200, type=int)
+    ap.add_argument("--k", default=10, type=int)
+    ap.add_argument("--min-overlap", default=0.9, type=float)
+    args = ap.parse_args()
+
+    notes = query_notes(args.index, args.seeds, args.sample)
+    index = NumpyIndex.load(args.index)
+    baseline = load_embedder(args.model_name, "torch")
+    candidate = load_embedder(args.model_name, args.backend, default_onnx_dir(args.index))
+
+    report = topk_overlap(index, baseline, candidate, notes, args.k)
+    print(json.dumps(report, indent=2))
+    mean = report["mean_overlap"]
+    if mean < args.min_overlap:
+        print(f"FAIL: mean top-{args.k} overlap {mean:.3f} < {args.min_overlap}")
+        sys.exit(1)
+    print(f"OK: mean top-{args.k} overlap {mean:.3f} >= {args.min_overlap}")
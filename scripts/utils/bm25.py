@@ -0,0 +1,80 @@
+# utils/bm25.py
+"""
+BM25 lexical index over build_search_text output
+
+The index is a precomputed term x doc CSR matrix of BM25 weights (an
+inverted index: row t holds the posting list of term t). Scoring a query
+only touches the postings of its terms, and a batch of queries is scored
+with one sparse matrix product. Postings and the sorted vocabulary are
+stored as flat arrays (see index_store) and memory-mapped at load.
+"""
+import numpy as np
+from scipy import sparse
+from sklearn.feature_extraction.text import CountVectorizer
+
+from .index_store import load_csr, save_csr, TermIndex
+from .text_utils import normalize_text
+from .vector_index import top_k
+
+
+def _tokenize(text: str):
+    return normalize_text(text).split()
+
+
+class BM25Index:
+    def __init__(self, postings: sparse.csr_matrix, terms: TermIndex):
+        self.postings = postings  # (n_terms, n_docs)
+        self.terms = terms
+
+    @classmethod
+    def build(cls, docs, k1: float = 1.5, b: float = 0.75):
+        cv = CountVectorizer(tokenizer=_tokenize, lowercase=False, token_pattern=None)
+        tf = cv.fit_transform(docs).tocsr().astype(np.float32)  # (n_docs, n_terms)
+        n_docs = tf.shape[0]
+        dl = np.asarray(tf.sum(axis=1)).ravel()
+        avgdl = dl.mean() if n_docs else 0.0
+        df = np.bincount(tf.indices, minlength=tf.shape[1])
+        idf = np.log((n_docs - df + 0.5) / (df + 0.5) + 1.0).astype(np.float32)
+        # BM25 saturation per nonzero, with the length norm of its doc row
+        row_norm = k1 * (1 - b + b * dl / avgdl) if avgdl else np.full(n_docs, k1)
+        rows = np.repeat(np.arange(n_docs), np.diff(tf.indptr))
+        f = tf.data
+        tf.data = idf[tf.indices] * f * (k1 + 1) / (f + row_norm[rows])
+        return cls(tf.T.tocsr(), TermIndex.from_terms(cv.get_feature_names_out()))
+
+    def save(self, out_dir: str):
+        save_csr(out_dir, "bm25", self.postings)
+        self.terms.save(out_dir, "bm25")
+
+    @classmethod
+    def load(cls, index_dir: str):
+        return cls(load_csr(index_dir, "bm25"), TermIndex.load(index_dir, "bm25"))
+
+    def __len__(self):
+        return self.postings.shape[1]
+
+    def query_matrix(self, queries) -> sparse.csr_matrix:
+        indptr, indices = [0], []
+        for q in queries:
+            indices.extend(self.terms.lookup(_tokenize(q)).tolist())
+            indptr.append(len(indices))
+        data = np.ones(len(indices), dtype=np.float32)
+        return sparse.csr_matrix((data, indices, indptr), shape=(len(queries), self.postings.shape[0]))
+
+    def search_batch(self, queries, k: int):
+        """
+        Scores every query against all docs with one sparse product.
+        Returns (scores, indices), both (n_queries, k), best-first.
+        """
+        scores = (self.query_matrix(queries) @ self.postings).toarray()
+        return top_k(scores, k)
+
+    def search(self, query: str, k: int):
+        q = self.query_matrix([query])
+        if not q.nnz:
+            return np.empty(0, dtype=np.float32), np.empty(0, dtype=np.int64)
+        # Sum the posting lists of the query terms into a dense score vector
+        hits = self.postings[q.indices]
+        scores = np.bincount(hits.indices, weights=hits.data, minlength=len(self))
+        s, i = top_k(scores[None, :], k)
+        return s[0], i[0]
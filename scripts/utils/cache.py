@@ -0,0 +1,150 @@
+# utils/cache.py
+"""
+Small in-process caches shared by the backend and the build scripts
+"""
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """
+    Bounded LRU cache whose entries also expire after `ttl` seconds.
+    ttl <= 0 disables expiry. Safe to share between threads.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 0.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return default
+            value, expires = item
+            if expires and expires < time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        if self.maxsize <= 0:
+            return
+        expires = time.monotonic() + self.ttl if self.ttl > 0 else 0.0
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": (self.hits / total) if total else 0.0,
+        }
+
+
+class RedisCache:
+    """
+    Shared cache on any Redis-compatible server (Redis, Valkey, KeyDB, ...),
+    so every worker sees the others' entries. `dumps` / `loads` convert
+    values to and from bytes. Server errors count as misses and pause the
+    shared tier for `retry_s`; the caller keeps working off its local tier.
+    """
+
+    def __init__(self, url: str, prefix: str, ttl: float = 0.0, dumps=None, loads=None, retry_s: float = 5.0):
+        import redis  # optional dependency, only needed with AUTOCODER_CACHE_URL
+        self.client = redis.Redis.from_url(url, socket_timeout=0.05, socket_connect_timeout=0.2)
+        self.prefix = prefix
+        self.ttl = ttl
+        self.dumps = dumps or (lambda v: v)
+        self.loads = loads or (lambda b: b)
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self.retry_s = retry_s
+        self._down_until = 0.0
+
+    def _failed(self):
+        self.errors += 1
+        self._down_until = time.monotonic() + self.retry_s
+
+    def get(self, key, default=None):
+        raw = None
+        if time.monotonic() >= self._down_until:
+            try:
+                raw = self.client.get(self.prefix + key)
+            except Exception:
+                self._failed()
+        if raw is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        return self.loads(raw)
+
+    def set(self, key, value):
+        if time.monotonic() < self._down_until:
+            return
+        try:
+            self.client.set(self.prefix + key, self.dumps(value), ex=int(self.ttl) if self.ttl > 0 else None)
+        except Exception:
+            self._failed()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "errors": self.errors,
+            "hit_ratio": (self.hits / total) if total else 0.0,
+        }
+
+
+class TieredCache:
+    """In-process TTLCache in front of an optional shared cache (e.g. RedisCache)."""
+
+    def __init__(self, local: TTLCache, shared=None):
+        self.local = local
+        self.shared = shared
+
+    def get(self, key, default=None):
+        value = self.local.get(key)
+        if value is None and self.shared is not None:
+            value = self.shared.get(key)
+            if value is not None:
+                self.local.set(key, value)
+        return default if value is None else value
+
+    def set(self, key, value):
+        self.local.set(key, value)
+        if self.shared is not None:
+            self.shared.set(key, value)
+
+    def clear(self):
+        self.local.clear()
+
+    def stats(self):
+        out = {"local": self.local.stats()}
+        if self.shared is not None:
+            out["shared"] = self.shared.stats()
+        return out
@@ -0,0 +1,84 @@
+# utils/catalog.py
+"""
+Columnar ICD-10 code metadata shared by the in-process engines
+
+Row i of every engine (TF-IDF, BM25, FAISS/NumPy) is row i of the catalog,
+so engines return row ids and the catalog turns them into result dicts.
+Loaded from the index_store columns: codes are a memory-mapped array and
+titles / descriptions / search texts are decoded per row on access.
+"""
+import os
+import numpy as np
+
+from .index_store import StringColumn, save_strings
+from .vector_index import CODE_IDS_FILE
+
+STRING_COLUMNS = ("title", "description", "search_text")
+
+
+class CodeCatalog:
+    def __init__(self, codes, titles, descriptions, search_texts=None):
+        # Plain sequences or StringColumns; only __getitem__ / len are used
+        self.codes = codes
+        self.titles = titles
+        self.descriptions = descriptions
+        # Kept with the index so rerankers never go back to icd10_codes for it
+        self.search_texts = search_texts if search_texts is not None else titles
+        self._row_of = None
+
+    @classmethod
+    def from_records(cls, records):
+        return cls(
+            [r["code"] for r in records],
+            [r["title"] for r in records],
+            [r.get("description") or "" for r in records],
+            [r.get("search_text") or r["title"] for r in records],
+        )
+
+    @classmethod
+    def load(cls, index_dir: str):
+        codes = np.load(os.path.join(index_dir, CODE_IDS_FILE), mmap_mode="r")
+        return cls(codes, *(StringColumn(index_dir, name) for name in STRING_COLUMNS))
+
+    @staticmethod
+    def save(out_dir: str, df):
+        """Writes the string columns of df (code_ids.npy comes from write_vector_index)."""
+        for name in STRING_COLUMNS:
+            save_strings(out_dir, name, df[name].fillna("").astype(str).tolist())
+
+    def __len__(self):
+        return len(self.codes)
+
+    def row_of(self, code: str):
+        if self._row_of is None:
+            self._row_of = {str(c): i for i, c in enumerate(self.codes)}
+        return self._row_of.get(code)
+
+    def search_texts_for(self, results) -> list:
+        texts = []
+        for r in results:
+            i = self.row_of(r["code"])
+            texts.append(self.search_texts[i] if i is not None else r["title"])
+        return texts
+
+    def result(self, i: int, score: float, rationale: str) -> dict:
+        title = self.titles[i]
+        return {
+            "code": str(self.codes[i]),
+            "title": title,
+            "description": self.descriptions[i],
+            "confidence": float(score),
+            "rationale": rationale.format(title=title.lower(), score=score),
+        }
+
+    def results(self, idx, scores, rationale: str, min_score=None) -> list:
+        """
+        Result dicts for one query's (idx, scores) row. Negative ids (FAISS
+        padding) and scores <= min_score are skipped.
+        """
+        out = []
+        for i, score in zip(idx, scores):
+            if i < 0 or (min_score is not None and score <= min_score):
+                continue
+            out.append(self.result(i, score, rationale))
+        return out
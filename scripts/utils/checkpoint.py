@@ -0,0 +1,62 @@
+# utils/checkpoint.py
+"""
+SQLite-backed key/value store for resumable data-set builds
+
+Each put() is committed immediately, so a crashed run keeps everything it
+finished; the next run reads the keys back and skips them.
+"""
+import json
+import sqlite3
+import threading
+
+
+class SqliteKV:
+    def __init__(self, path: str, table: str = "kv"):
+        self.path = path
+        self.table = table
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL;")
+        self._conn.execute("PRAGMA synchronous=NORMAL;")
+        self._conn.execute(f"CREATE TABLE IF NOT EXISTS {table} (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self._conn.commit()
+
+    def get(self, key: str, default=None):
+        with self._lock:
+            row = self._conn.execute(f"SELECT value FROM {self.table} WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def get_many(self, keys) -> dict:
+        keys = list(keys)
+        out = {}
+        with self._lock:
+            for i in range(0, len(keys), 500):
+                chunk = keys[i:i + 500]
+                marks = ",".join("?" * len(chunk))
+                for k, v in self._conn.execute(
+                        f"SELECT key, value FROM {self.table} WHERE key IN ({marks})", chunk):
+                    out[k] = json.loads(v)
+        return out
+
+    def put(self, key: str, value):
+        self.put_many({key: value})
+
+    def put_many(self, items: dict):
+        rows = [(k, json.dumps(v)) for k, v in items.items()]
+        with self._lock:
+            self._conn.executemany(
+                f"INSERT OR REPLACE INTO {self.table} (key, value) VALUES (?, ?)", rows)
+            self._conn.commit()
+
+    def __contains__(self, key: str):
+        with self._lock:
+            return self._conn.execute(
+                f"SELECT 1 FROM {self.table} WHERE key = ?", (key,)).fetchone() is not None
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,173 @@
+# utils/clinical_aliases.py
+"""
+Clinical abbreviation / alias table used by text_utils.normalize_text
+
+Keys are in normalized form (lowercase, punctuation replaced by spaces),
+so "s/p" is written "s p" and "T2DM" is "t2dm". Multi-token keys are
+matched as whole token sequences, longest first. Expansions must not
+themselves contain a key: normalization has to be idempotent, because
+index texts are normalized at build time and again when tokenized.
+
+Abbreviations with more than one common meaning (pt, pe, ms, ra, or, ca) are
+left out on purpose, and so are ones whose expansion starts with a negation
+trigger (nad, "no acute distress"): preprocess.py would negate whatever
+follows them.
+"""
+
+CLINICAL_ALIASES = {
+    # History / encounter shorthand
+    "c o": "complains of",
+    "h o": "history of",
+    "hx": "history",
+    "pmh": "past medical history",
+    "fhx": "family history",
+    "s p": "status post",
+    "f u": "follow up",
+    "fu": "follow up",
+    "r o": "rule out",
+    "w u": "workup",
+    "dx": "diagnosis",
+    "ddx": "differential diagnosis",
+    "tx": "treatment",
+    "sx": "symptoms",
+    "yo": "year old",
+    "y o": "year old",
+    "yr": "year",
+    "yrs": "years",
+    "wk": "week",
+    "wks": "weeks",
+    "mo": "month",
+    "mos": "months",
+    "hrs": "hours",
+    "b l": "bilateral",
+    "bilat": "bilateral",
+    "neg": "negative",
+    "pos": "positive",
+    "abnl": "abnormal",
+    "nl": "normal",
+    "wnl": "within normal limits",
+    "prn": "as needed",
+    # Symptoms / findings
+    "sob": "shortness of breath",
+    "doe": "dyspnea on exertion",
+    "cp": "chest pain",
+    "ha": "headache",
+    "n v": "nausea vomiting",
+    "n v d": "nausea vomiting diarrhea",
+    "abd": "abdominal",
+    "lbp": "low back pain",
+    "loc": "loss of consciousness",
+    "ams": "altered mental status",
+    "brbpr": "bright red blood per rectum",
+    "le": "lower extremity",
+    "ue": "upper extremity",
+    "lle": "left lower extremity",
+    "rle": "right lower extremity",
+    "lue": "left upper extremity",
+    "rue": "right upper extremity",
+    "rlq": "right lower quadrant",
+    "llq": "left lower quadrant",
+    "ruq": "right upper quadrant",
+    "luq": "left upper quadrant",
+    "ttp": "tender to palpation",
+    "rom": "range of motion",
+    "jvd": "jugular venous distension",
+    "bm": "bowel movement",
+    "wt": "weight",
+    "ht": "height",
+    "temp": "temperature",
+    "bp": "blood pressure",
+    "hr": "heart rate",
+    "rr": "respiratory rate",
+    "spo2": "oxygen saturation",
+    "o2": "oxygen",
+    # Cardiovascular
+    "htn": "hypertension",
+    "hld": "hyperlipidemia",
+    "cad": "coronary artery disease",
+    "chf": "congestive heart failure",
+    "hf": "heart failure",
+    "hfref": "heart failure with reduced ejection fraction",
+    "hfpef": "heart failure with preserved ejection fraction",
+    "afib": "atrial fibrillation",
+    "a fib": "atrial fibrillation",
+    "af": "atrial fibrillation",
+    "mi": "myocardial infarction",
+    "ami": "acute myocardial infarction",
+    "nstemi": "non st elevation myocardial infarction",
+    "stemi": "st elevation myocardial infarction",
+    "acs": "acute coronary syndrome",
+    "dvt": "deep vein thrombosis",
+    "pvd": "peripheral vascular disease",
+    "svt": "supraventricular tachycardia",
+    "cabg": "coronary artery bypass graft",
+    "tia": "transient ischemic attack",
+    "cva": "cerebrovascular accident stroke",
+    # Endocrine / metabolic
+    "dm": "diabetes mellitus",
+    "dm1": "type 1 diabetes mellitus",
+    "dm2": "type 2 diabetes mellitus",
+    "t1dm": "type 1 diabetes mellitus",
+    "t2dm": "type 2 diabetes mellitus",
+    "iddm": "insulin dependent diabetes mellitus",
+    "niddm": "non insulin dependent diabetes mellitus",
+    "dka": "diabetic ketoacidosis",
+    "hba1c": "hemoglobin a1c",
+    # Respiratory
+    "copd": "chronic obstructive pulmonary disease",
+    "uri": "upper respiratory infection",
+    "urti": "upper respiratory tract infection",
+    "lrti": "lower respiratory tract infection",
+    "pna": "pneumonia",
+    "osa": "obstructive sleep apnea",
+    "ards": "acute respiratory distress syndrome",
+    "tb": "tuberculosis",
+    # Renal / urologic
+    "uti": "urinary tract infection",
+    "ckd": "chronic kidney disease",
+    "esrd": "end stage renal disease",
+    "aki": "acute kidney injury",
+    "arf": "acute renal failure",
+    "bph": "benign prostatic hyperplasia",
+    # Gastrointestinal
+    "gerd": "gastroesophageal reflux disease",
+    "gi": "gastrointestinal",
+    "ibs": "irritable bowel syndrome",
+    "ibd": "inflammatory bowel disease",
+    "pud": "peptic ulcer disease",
+    "sbo": "small bowel obstruction",
+    "gib": "gastrointestinal bleed",
+    "ugib": "upper gastrointestinal bleed",
+    "lgib": "lower gastrointestinal bleed",
+    # Neuro / psych
+    "mdd": "major depressive disorder",
+    "gad": "generalized anxiety disorder",
+    "ptsd": "post traumatic stress disorder",
+    "adhd": "attention deficit hyperactivity disorder",
+    "ocd": "obsessive compulsive disorder",
+    "etoh": "alcohol",
+    "sz": "seizure",
+    "tbi": "traumatic brain injury",
+    "sah": "subarachnoid hemorrhage",
+    # Musculoskeletal / injury
+    "oa": "osteoarthritis",
+    "fx": "fracture",
+    "fxs": "fractures",
+    "djd": "degenerative joint disease",
+    "ddd": "degenerative disc disease",
+    "acl": "anterior cruciate ligament",
+    "mva": "motor vehicle accident",
+    "mvc": "motor vehicle collision",
+    "gsw": "gunshot wound",
+    # Infectious / other
+    "hiv": "human immunodeficiency virus",
+    "std": "sexually transmitted disease",
+    "sti": "sexually transmitted infection",
+    "mrsa": "methicillin resistant staphylococcus aureus",
+    "ssti": "skin and soft tissue infection",
+    "ivdu": "intravenous drug use",
+    "bmi": "body mass index",
+    "ob": "obstetric",
+    "iud": "intrauterine device",
+    "lmp": "last menstrual period",
+}
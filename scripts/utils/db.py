@@ -13,16 +13,25 @@ PG_USER = os.getenv("PG_USER")
 PG_PASSWORD = os.getenv("PG_PASSWORD")
 PG_DBNAME = os.getenv("PG_DBNAME")
 
+# Connection pool settings (backend)
+PG_POOL_MIN = int(os.getenv("PG_POOL_MIN", "1"))
+PG_POOL_MAX = int(os.getenv("PG_POOL_MAX", "8"))
+PG_EF_SEARCH = int(os.getenv("PG_EF_SEARCH", "100"))
+PG_COMMAND_TIMEOUT_S = float(os.getenv("PG_COMMAND_TIMEOUT_S", "10"))
+
+
+def _conn_params():
+    return dict(host=PG_HOST, port=PG_PORT, user=PG_USER, password=PG_PASSWORD, dbname=PG_DBNAME)
+
+
+def _have_conn_params():
+    return bool(PG_HOST and PG_USER and PG_PASSWORD and PG_DBNAME)
+
+
 def get_pg_conn():
-    if PG_HOST and PG_USER and PG_PASSWORD and PG_DBNAME:
+    if _have_conn_params():
         try:
-            conn = psycopg2.connect(
-                host=PG_HOST,
-                port=PG_PORT,
-                user=PG_USER,
-                password=PG_PASSWORD,
-                dbname=PG_DBNAME
-            )
+            conn = psycopg2.connect(**_conn_params())
             register_vector(conn)
             print("Connected to PostgreSQL (db.py)")
             return conn
@@ -32,3 +41,34 @@ def get_pg_conn():
     else:
         print("PostgreSQL connection parameters not fully provided.")
         return None
+
+
+async def get_async_pg_pool(init_sql=(), minconn: int = PG_POOL_MIN, maxconn: int = PG_POOL_MAX):
+    """
+    asyncpg pool for the backend's request path. Each new connection gets the
+    pgvector codec and `init_sql`. hnsw.ef_search goes in the startup
+    parameters rather than a SET: asyncpg runs RESET ALL whenever a
+    connection returns to the pool, which would drop a session SET after the
+    first checkout but restores startup parameters. asyncpg prepares and
+    caches statements per connection on its own, and reconnects connections
+    that were closed. Returns None when PostgreSQL is not configured; raises
+    when it is configured but unreachable.
+    """
+    if not _have_conn_params():
+        print("PostgreSQL connection parameters not fully provided.")
+        return None
+    import asyncpg  # backend-only dependency; the build scripts stay on psycopg2
+    from pgvector.asyncpg import register_vector as register_vector_async
+
+    async def _init(conn):
+        await register_vector_async(conn)
+        for sql in init_sql:
+            await conn.execute(sql)
+
+    pool = await asyncpg.create_pool(
+        host=PG_HOST, port=PG_PORT, user=PG_USER, password=PG_PASSWORD, database=PG_DBNAME,
+        min_size=minconn, max_size=maxconn, init=_init, command_timeout=PG_COMMAND_TIMEOUT_S,
+        server_settings={"hnsw.ef_search": str(PG_EF_SEARCH)},
+    )
+    print(f"Connected to PostgreSQL (asyncpg, pool size {minconn}-{maxconn})")
+    return pool
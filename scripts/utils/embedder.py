@@ -0,0 +1,149 @@
+# utils/embedder.py
+"""
+Pluggable sentence embedders for query / catalog encoding
+
+    torch      SentenceTransformer in fp32 (default)
+    onnx       the same transformer exported to ONNX, run with onnxruntime
+    onnx-int8  the ONNX export with dynamic int8 quantization of the weights
+
+All backends return unit-norm float32 vectors, so they are interchangeable
+against embeddings.npy / pgvector. build_index.py --export-onnx writes the
+ONNX files; scripts/check_embedder.py checks the top-k overlap of an ONNX
+backend against the fp32 baseline before it is rolled out.
+"""
+import json
+import os
+import numpy as np
+
+EMBED_BACKEND = os.getenv("AUTOCODER_EMBED_BACKEND", "torch")
+ONNX_THREADS = int(os.getenv("AUTOCODER_ONNX_THREADS", "0"))  # 0 = onnxruntime default
+
+ONNX_FILE = "model.onnx"
+ONNX_INT8_FILE = "model_int8.onnx"
+ONNX_CONFIG_FILE = "embedder.json"
+BACKENDS = ("torch", "onnx", "onnx-int8")
+
+
+def default_onnx_dir(index_dir: str) -> str:
+    return os.path.join(index_dir, "onnx")
+
+
+class TorchEmbedder:
+    name = "torch"
+
+    def __init__(self, model_name: str):
+        from sentence_transformers import SentenceTransformer
+        self.model = SentenceTransformer(model_name)
+        self.dim = self.model.get_sentence_embedding_dimension()
+
+    def encode(self, texts, batch_size: int = 32) -> np.ndarray:
+        vecs = self.model.encode(list(texts), batch_size=batch_size, normalize_embeddings=True,
+                                 convert_to_numpy=True, show_progress_bar=False)
+        return np.asarray(vecs, dtype=np.float32)
+
+
+class OnnxEmbedder:
+    """
+    Tokenizer + ONNX transformer + the SentenceTransformer pooling, done in
+    NumPy. Reads what export_onnx() wrote to onnx_dir.
+    """
+
+    def __init__(self, onnx_dir: str, quantized: bool = False):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+        with open(os.path.join(onnx_dir, ONNX_CONFIG_FILE)) as f:
+            self.config = json.load(f)
+        self.name = "onnx-int8" if quantized else "onnx"
+        self.dim = self.config["dim"]
+        self.pooling = self.config["pooling"]
+        self.max_length = self.config["max_seq_length"]
+        self.tokenizer = AutoTokenizer.from_pretrained(onnx_dir)
+        opts = ort.SessionOptions()
+        if ONNX_THREADS:
+            opts.intra_op_num_threads = ONNX_THREADS
+        path = os.path.join(onnx_dir, ONNX_INT8_FILE if quantized else ONNX_FILE)
+        self.session = ort.InferenceSession(path, opts, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+
+    def _encode_batch(self, texts) -> np.ndarray:
+        enc = self.tokenizer(texts, padding=True, truncation=True, max_length=self.max_length, return_tensors="np")
+        feeds = {k: v.astype(np.int64) for k, v in enc.items() if k in self.input_names}
+        hidden = self.session.run(None, feeds)[0]  # (batch, seq, dim)
+        mask = enc["attention_mask"][..., None].astype(np.float32)
+        if self.pooling == "cls":
+            vecs = hidden[:, 0]
+        else:
+            vecs = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        norms = np.linalg.norm(vecs, axis=1, keepdims=True)
+        return (vecs / np.clip(norms, 1e-12, None)).astype(np.float32)
+
+    def encode(self, texts, batch_size: int = 32) -> np.ndarray:
+        texts = list(texts)
+        if not texts:
+            return np.empty((0, self.dim), dtype=np.float32)
+        return np.vstack([self._encode_batch(texts[i:i + batch_size]) for i in range(0, len(texts), batch_size)])
+
+
+def load_embedder(model_name: str, backend: str = None, onnx_dir: str = None):
+    backend = backend or EMBED_BACKEND
+    if backend == "torch":
+        return TorchEmbedder(model_name)
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown embed backend {backend!r}; expected one of {', '.join(BACKENDS)}")
+    with open(os.path.join(onnx_dir, ONNX_CONFIG_FILE)) as f:
+        exported = json.load(f)["model_name"]
+    if exported != model_name:
+        raise RuntimeError(f"ONNX export in {onnx_dir} is for {exported}, not {model_name}; "
+                           "re-run build_index.py --export-onnx")
+    return OnnxEmbedder(onnx_dir, quantized=backend == "onnx-int8")
+
+
+def export_onnx(model, model_name: str, out_dir: str, quantize: bool = True):
+    """
+    Exports the transformer of a loaded SentenceTransformer to out_dir
+    (model.onnx, tokenizer files, embedder.json) and, with quantize, a
+    dynamic int8 copy (model_int8.onnx).
+    """
+    import torch
+    os.makedirs(out_dir, exist_ok=True)
+    transformer = model[0]
+    pooling = "mean"
+    for module in model:
+        if type(module).__name__ == "Pooling":
+            cfg = module.get_config_dict()
+            # sentence-transformers 3.x has per-mode flags, newer versions one string
+            if cfg.get("pooling_mode_cls_token") or cfg.get("pooling_mode") == "cls":
+                pooling = "cls"
+    tokenizer = transformer.tokenizer
+    dummy = tokenizer(["export sample"], return_tensors="pt")
+    names = [k for k in ("input_ids", "attention_mask", "token_type_ids") if k in dummy]
+    hf_model = transformer.auto_model.eval()
+
+    class _Wrapper(torch.nn.Module):
+        # Only the last hidden state; pooling runs in NumPy
+        def __init__(self, m):
+            super().__init__()
+            self.m = m
+
+        def forward(self, *args):
+            return self.m(**dict(zip(names, args))).last_hidden_state
+
+    path = os.path.join(out_dir, ONNX_FILE)
+    axes = {n: {0: "batch", 1: "seq"} for n in names}
+    axes["last_hidden_state"] = {0: "batch", 1: "seq"}
+    with torch.no_grad():
+        torch.onnx.export(_Wrapper(hf_model), tuple(dummy[n] for n in names), path,
+                          input_names=names, output_names=["last_hidden_state"],
+                          dynamic_axes=axes, opset_version=17, dynamo=False)
+    tokenizer.save_pretrained(out_dir)
+    with open(os.path.join(out_dir, ONNX_CONFIG_FILE), "w") as f:
+        json.dump({
+            "model_name": model_name,
+            "dim": model.get_sentence_embedding_dimension(),
+            "pooling": pooling,
+            "max_seq_length": model.max_seq_length,
+        }, f)
+    if quantize:
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+        quantize_dynamic(path, os.path.join(out_dir, ONNX_INT8_FILE), weight_type=QuantType.QInt8)
+    print(f"ONNX embedder exported to {out_dir}" + (" (+ int8)" if quantize else ""))
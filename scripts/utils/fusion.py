@@ -0,0 +1,72 @@
+# utils/fusion.py
+"""
+Rank fusion for hybrid (dense + lexical) retrieval
+
+Inputs are ranked result lists (dicts with "code" and "confidence", best
+first) from different engines; outputs are one merged list keyed by code.
+"""
+
+
+def rrf_fuse(result_lists, weights=None, k: int = 60, top_k: int = 5):
+    """
+    Weighted reciprocal-rank fusion: score(code) = sum_i w_i / (k + rank_i).
+    """
+    weights = weights or [1.0] * len(result_lists)
+    scores, first_seen = {}, {}
+    for results, w in zip(result_lists, weights):
+        for rank, r in enumerate(results, 1):
+            scores[r["code"]] = scores.get(r["code"], 0.0) + w / (k + rank)
+            first_seen.setdefault(r["code"], r)
+    return _merge(scores, first_seen, top_k)
+
+
+def weighted_fuse(result_lists, weights=None, top_k: int = 5):
+    """
+    Weighted sum of per-engine scores, each min-max normalized to [0, 1].
+    """
+    weights = weights or [1.0] * len(result_lists)
+    scores, first_seen = {}, {}
+    for results, w in zip(result_lists, weights):
+        if not results:
+            continue
+        conf = [r["confidence"] for r in results]
+        lo, hi = min(conf), max(conf)
+        span = (hi - lo) or 1.0
+        for r in results:
+            norm = (r["confidence"] - lo) / span if hi > lo else 1.0
+            scores[r["code"]] = scores.get(r["code"], 0.0) + w * norm
+            first_seen.setdefault(r["code"], r)
+    return _merge(scores, first_seen, top_k)
+
+
+def _merge(scores, first_seen, top_k):
+    ranked = sorted(scores.items(), key=lambda kv: -kv[1])[:top_k]
+    out = []
+    for code, score in ranked:
+        r = dict(first_seen[code])
+        r["confidence"] = float(score)
+        out.append(r)
+    return out
+
+
+def max_pool(result_lists, top_k: int = 5):
+    """
+    One list from several lists of the same engine (e.g. one per note chunk):
+    each code keeps its best-scoring result.
+    """
+    if len(result_lists) == 1:
+        return result_lists[0][:top_k]
+    best = {}
+    for results in result_lists:
+        for r in results:
+            if r["code"] not in best or r["confidence"] > best[r["code"]]["confidence"]:
+                best[r["code"]] = r
+    return sorted(best.values(), key=lambda r: -r["confidence"])[:top_k]
+
+
+def fuse(result_lists, method: str = "rrf", weights=None, top_k: int = 5, rrf_k: int = 60):
+    if method == "rrf":
+        return rrf_fuse(result_lists, weights=weights, k=rrf_k, top_k=top_k)
+    if method == "weighted":
+        return weighted_fuse(result_lists, weights=weights, top_k=top_k)
+    raise ValueError(f"Unknown fusion method: {method}")
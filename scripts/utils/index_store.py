@@ -0,0 +1,151 @@
+# utils/index_store.py
+"""
+Versioned on-disk index format (flat .npy / .bin files, no pickles)
+
+Every array is written as a plain .npy file and opened with
+np.load(mmap_mode="r"), so uvicorn workers share the pages through the OS
+page cache instead of each unpickling a private copy. Layout of INDEX_DIR:
+
+    format.json                 format version, row count, file list
+    code_ids.npy                (n,) codes, row-aligned with every engine
+    <col>.bin + <col>_offsets.npy
+                                string columns (title, description,
+                                search_text): utf-8 bytes concatenated, with
+                                n+1 byte offsets; rows decode lazily
+    <name>_data/_indices/_indptr.npy
+                                CSR matrices (TF-IDF and BM25 postings)
+    <name>_terms.npy            sorted utf-8 vocabulary, row i = term i
+    embeddings.npy              (n, dim) float32
+"""
+import json
+import os
+import numpy as np
+from scipy import sparse
+
+FORMAT_FILE = "format.json"
+FORMAT_VERSION = 1
+
+
+def save_npy(path: str, arr):
+    # Write-then-rename so readers that mmap the old file never see a torn one
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        np.save(f, np.asarray(arr))
+    os.replace(tmp, path)
+
+
+def load_npy(path: str):
+    return np.load(path, mmap_mode="r")
+
+
+# -----------------------------------------------------------------------------
+# String columns
+# -----------------------------------------------------------------------------
+def save_strings(index_dir: str, name: str, values):
+    encoded = [("" if v is None else str(v)).encode("utf-8") for v in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    tmp = os.path.join(index_dir, name + ".bin.tmp")
+    with open(tmp, "wb") as f:
+        for b in encoded:
+            f.write(b)
+    os.replace(tmp, os.path.join(index_dir, name + ".bin"))
+    save_npy(os.path.join(index_dir, name + "_offsets.npy"), offsets)
+
+
+class StringColumn:
+    """Read-only string column; row i is decoded from the mmap on access."""
+
+    def __init__(self, index_dir: str, name: str):
+        self.offsets = load_npy(os.path.join(index_dir, name + "_offsets.npy"))
+        path = os.path.join(index_dir, name + ".bin")
+        # np.memmap cannot map an empty file
+        self.blob = np.memmap(path, dtype=np.uint8, mode="r") if os.path.getsize(path) else np.empty(0, np.uint8)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i) -> str:
+        start, end = self.offsets[i], self.offsets[i + 1]
+        return self.blob[start:end].tobytes().decode("utf-8")
+
+
+# -----------------------------------------------------------------------------
+# CSR matrices and vocabularies
+# -----------------------------------------------------------------------------
+def save_csr(index_dir: str, name: str, m):
+    m = m.tocsr()
+    m.sort_indices()
+    save_npy(os.path.join(index_dir, f"{name}_data.npy"), m.data.astype(np.float32))
+    save_npy(os.path.join(index_dir, f"{name}_indices.npy"), m.indices.astype(np.int32))
+    # scipy downcasts int64 indptr to int32 (a private copy) when nnz allows
+    idx_dtype = np.int32 if m.nnz < 2**31 else np.int64
+    save_npy(os.path.join(index_dir, f"{name}_indptr.npy"), m.indptr.astype(idx_dtype))
+    save_npy(os.path.join(index_dir, f"{name}_shape.npy"), np.asarray(m.shape, dtype=np.int64))
+
+
+def load_csr(index_dir: str, name: str) -> sparse.csr_matrix:
+    data = load_npy(os.path.join(index_dir, f"{name}_data.npy"))
+    indices = load_npy(os.path.join(index_dir, f"{name}_indices.npy"))
+    indptr = load_npy(os.path.join(index_dir, f"{name}_indptr.npy"))
+    shape = tuple(int(x) for x in np.load(os.path.join(index_dir, f"{name}_shape.npy")))
+    return sparse.csr_matrix((data, indices, indptr), shape=shape, copy=False)
+
+
+class TermIndex:
+    """
+    Term -> column lookup by binary search over a sorted, memory-mapped
+    vocabulary array (no per-worker dict of every term). Terms are stored as
+    utf-8 bytes ("S" dtype, 1 byte per char); byte order matches the code
+    point order the vectorizers sort by.
+    """
+
+    def __init__(self, terms: np.ndarray):
+        self.terms = terms
+
+    @classmethod
+    def load(cls, index_dir: str, name: str):
+        return cls(load_npy(os.path.join(index_dir, f"{name}_terms.npy")))
+
+    @classmethod
+    def from_terms(cls, sorted_terms):
+        return cls(np.asarray([str(t).encode("utf-8") for t in sorted_terms], dtype=bytes))
+
+    def save(self, index_dir: str, name: str):
+        save_npy(os.path.join(index_dir, f"{name}_terms.npy"), self.terms)
+
+    def __len__(self):
+        return len(self.terms)
+
+    def lookup(self, tokens) -> np.ndarray:
+        """Column ids of the tokens that are in the vocabulary."""
+        if not tokens or not len(self.terms):
+            return np.empty(0, dtype=np.int64)
+        q = np.asarray([t.encode("utf-8") for t in tokens], dtype=bytes)
+        pos = np.searchsorted(self.terms, q)
+        pos[pos >= len(self.terms)] = 0
+        return pos[self.terms[pos] == q]
+
+
+# -----------------------------------------------------------------------------
+# Format header
+# -----------------------------------------------------------------------------
+def write_format(index_dir: str, n_codes: int, **extra):
+    info = {"format_version": FORMAT_VERSION, "n_codes": int(n_codes), **extra}
+    tmp = os.path.join(index_dir, FORMAT_FILE + ".tmp")
+    with open(tmp, "w") as f:
+        json.dump(info, f)
+    os.replace(tmp, os.path.join(index_dir, FORMAT_FILE))
+
+
+def read_format(index_dir: str) -> dict:
+    path = os.path.join(index_dir, FORMAT_FILE)
+    if not os.path.exists(path):
+        raise RuntimeError(f"{index_dir} has no {FORMAT_FILE}; rebuild it with scripts/build_index.py")
+    with open(path) as f:
+        info = json.load(f)
+    if info.get("format_version") != FORMAT_VERSION:
+        raise RuntimeError(
+            f"{index_dir} uses index format {info.get('format_version')}, expected {FORMAT_VERSION}; "
+            "rebuild it with scripts/build_index.py")
+    return info
@@ -0,0 +1,78 @@
+# utils/manifest.py
+"""
+Index manifest: per-code content hashes and the overall index version
+
+A code's hash covers its search_text and the embedding model name, so a
+code only needs re-embedding when either changes. The index version is a
+hash over all code hashes; the build stores it in manifest.json and in
+PostgreSQL, and the backend compares the two at startup.
+"""
+import hashlib
+import json
+import os
+import time
+
+MANIFEST_FILE = "manifest.json"
+VERSION_FILE = "index_version"  # just the version, cheap to read at startup
+MANIFEST_FORMAT = 1
+
+
+def content_hashes(codes, search_texts, model_name: str) -> dict:
+    prefix = (model_name + "\0").encode("utf-8")
+    return {
+        str(code): hashlib.sha1(prefix + str(text).encode("utf-8")).hexdigest()
+        for code, text in zip(codes, search_texts)
+    }
+
+
+def index_version(hashes: dict, model_name: str) -> str:
+    h = hashlib.sha1(model_name.encode("utf-8"))
+    for code in sorted(hashes):
+        h.update(f"{code}\0{hashes[code]}\n".encode("utf-8"))
+    return h.hexdigest()[:16]
+
+
+def diff_hashes(old: dict, new: dict):
+    """Returns (added, changed, removed) code lists."""
+    added = [c for c in new if c not in old]
+    changed = [c for c in new if c in old and old[c] != new[c]]
+    removed = [c for c in old if c not in new]
+    return added, changed, removed
+
+
+def load_manifest(index_dir: str):
+    path = os.path.join(index_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        manifest = json.load(f)
+    if manifest.get("format") != MANIFEST_FORMAT:
+        return None
+    return manifest
+
+
+def write_manifest(index_dir: str, hashes: dict, model_name: str, faiss=None) -> dict:
+    manifest = {
+        "format": MANIFEST_FORMAT,
+        "model": model_name,
+        "index_version": index_version(hashes, model_name),
+        "faiss": faiss,  # FAISS type + build params (vector_index.faiss_config), None if not built
+        "built_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "n_codes": len(hashes),
+        "codes": hashes,
+    }
+    tmp = os.path.join(index_dir, MANIFEST_FILE + ".tmp")
+    with open(tmp, "w") as f:
+        json.dump(manifest, f)
+    os.replace(tmp, os.path.join(index_dir, MANIFEST_FILE))
+    with open(os.path.join(index_dir, VERSION_FILE), "w") as f:
+        f.write(manifest["index_version"] + "\n")
+    return manifest
+
+
+def read_index_version(index_dir: str):
+    path = os.path.join(index_dir, VERSION_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return f.read().strip() or None
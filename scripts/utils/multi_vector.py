@@ -0,0 +1,216 @@
+# utils/multi_vector.py
+"""
+Multi-vector code representations: title, description chunks, synonyms
+
+search_text (title + full description + synonyms) is longer than the
+embedding model's token limit, so the single per-code vector never sees
+most synonyms. Here every code gets several vectors instead, one per
+    title          the code title
+    description    ~DESC_CHUNK_WORDS-word chunks of the description
+    synonym        each synonym / symptom phrase
+and a query's score for a code aggregates over that code's vectors:
+    max        best single vector (default)
+    weighted   weighted mean of the best vector per kind (AUTOCODER_MV_WEIGHTS)
+
+Artifacts written by build_index.py --multi-vector:
+    mv_embeddings.npy   (n_vectors, dim) float16 | int8 | float32, grouped by code row
+    mv_rows.npy         (n_vectors,) catalog row of each vector
+    mv_kinds.npy        (n_vectors,) index into KINDS
+    mv_scales.npy       (n_vectors,) int8 only: per-vector dequantization scale
+    multi_vector.json   dtype and the text settings used
+int8 stores round(x * 127 / max|x|) per vector; scores are rescaled per vector.
+"""
+import json
+import os
+import numpy as np
+
+from .index_store import save_npy
+from .text_utils import normalize_text, split_synonyms
+from .vector_index import top_k
+
+KINDS = ("title", "description", "synonym")
+MV_EMBEDDINGS_FILE = "mv_embeddings.npy"
+MV_ROWS_FILE = "mv_rows.npy"
+MV_KINDS_FILE = "mv_kinds.npy"
+MV_CONFIG_FILE = "multi_vector.json"
+MV_SCALES_FILE = "mv_scales.npy"
+MV_FILES = [MV_EMBEDDINGS_FILE, MV_ROWS_FILE, MV_KINDS_FILE, MV_SCALES_FILE, MV_CONFIG_FILE]
+DTYPES = ("float16", "int8", "float32")
+
+DESC_CHUNK_WORDS = 96
+MAX_DESC_CHUNKS = 4
+MAX_SYNONYMS = 16
+
+MV_AGG = os.getenv("AUTOCODER_MV_AGG", "max")  # max | weighted
+MV_WEIGHTS = os.getenv("AUTOCODER_MV_WEIGHTS", "title=1.0,description=0.6,synonym=0.8")
+# Rows dequantized per matmul, bounds the float32 scratch memory per query batch
+MV_BLOCK_ROWS = int(os.getenv("AUTOCODER_MV_BLOCK_ROWS", "65536"))
+
+def code_vector_texts(df):
+    """
+    (rows, kinds, texts) for every vector of every code in df, grouped by
+    row and in KINDS order within a row. Texts are normalize_text output,
+    the same normalization as search_text.
+    """
+    syn_col = "synonyms" if "synonyms" in df else ("synonym" if "synonym" in df else None)
+    titles = df["title"].fillna("").astype(str).tolist()
+    descs = df["description"].fillna("").astype(str).tolist() if "description" in df else [""] * len(df)
+    syns = df[syn_col].tolist() if syn_col else [None] * len(df)
+    rows, kinds, texts = [], [], []
+    for i, (title, desc, syn) in enumerate(zip(titles, descs, syns)):
+        title = normalize_text(title)
+        entries = [(0, title)] if title else []
+        words = normalize_text(desc).split()
+        for c in range(0, min(len(words), DESC_CHUNK_WORDS * MAX_DESC_CHUNKS), DESC_CHUNK_WORDS):
+            entries.append((1, " ".join(words[c:c + DESC_CHUNK_WORDS])))
+        synonyms = []  # distinct, not the title, at most MAX_SYNONYMS
+        for s in split_synonyms(syn):
+            s = normalize_text(s)
+            if s and s != title and s not in synonyms and len(synonyms) < MAX_SYNONYMS:
+                synonyms.append(s)
+        entries.extend((2, s) for s in synonyms)
+        if not entries:  # keep every code searchable
+            entries.append((0, str(df["code"].iloc[i])))
+        for kind, text in entries:
+            rows.append(i)
+            kinds.append(kind)
+            texts.append(text)
+    return np.asarray(rows, dtype=np.int32), np.asarray(kinds, dtype=np.int8), texts
+
+
+def quantize(emb: np.ndarray, dtype: str):
+    """(stored, scales): scales is None unless int8, where x ~= stored * scales[:, None]."""
+    if dtype == "int8":
+        scales = np.abs(emb).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        return np.rint(emb / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+    if dtype in DTYPES:
+        return np.ascontiguousarray(emb, dtype=dtype), None
+    raise ValueError(f"Unknown vector dtype {dtype!r}; expected one of {', '.join(DTYPES)}")
+
+
+def config(dtype: str) -> dict:
+    return {"dtype": dtype, "desc_chunk_words": DESC_CHUNK_WORDS,
+            "max_desc_chunks": MAX_DESC_CHUNKS, "max_synonyms": MAX_SYNONYMS}
+
+
+def config_matches(cfg, dtype: str) -> bool:
+    return cfg is not None and all(cfg.get(k) == v for k, v in config(dtype).items())
+
+
+def read_config(index_dir: str):
+    try:
+        with open(os.path.join(index_dir, MV_CONFIG_FILE)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_multi_vectors(out_dir: str, rows, kinds, embeddings, dtype: str = "float16"):
+    stored, scales = quantize(np.asarray(embeddings, dtype=np.float32), dtype)
+    save_npy(os.path.join(out_dir, MV_EMBEDDINGS_FILE), stored)
+    save_npy(os.path.join(out_dir, MV_ROWS_FILE), np.asarray(rows, dtype=np.int32))
+    save_npy(os.path.join(out_dir, MV_KINDS_FILE), np.asarray(kinds, dtype=np.int8))
+    scales_path = os.path.join(out_dir, MV_SCALES_FILE)
+    if scales is not None:
+        save_npy(scales_path, scales)
+    elif os.path.exists(scales_path):
+        os.remove(scales_path)
+    with open(os.path.join(out_dir, MV_CONFIG_FILE), "w") as f:
+        json.dump({**config(dtype), "n_vectors": int(len(stored))}, f)
+    print(f"Multi-vector index written ({len(stored)} vectors, {dtype}, {stored.nbytes / 2**20:.1f} MiB).")
+
+
+def load_multi_vectors(index_dir: str):
+    """(config, embeddings as float32, rows, kinds) of a previous build, or None."""
+    cfg = read_config(index_dir)
+    if cfg is None:
+        return None
+    try:
+        emb = np.asarray(np.load(os.path.join(index_dir, MV_EMBEDDINGS_FILE), mmap_mode="r"), dtype=np.float32)
+        rows = np.load(os.path.join(index_dir, MV_ROWS_FILE))
+        kinds = np.load(os.path.join(index_dir, MV_KINDS_FILE))
+        if cfg["dtype"] == "int8":
+            emb *= np.load(os.path.join(index_dir, MV_SCALES_FILE))[:, None]
+    except (OSError, ValueError, KeyError):
+        return None
+    return cfg, emb, rows, kinds
+
+
+def parse_weights(spec: str) -> np.ndarray:
+    weights = dict.fromkeys(KINDS, 1.0)
+    for part in filter(None, (p.strip() for p in spec.split(","))):
+        name, _, value = part.partition("=")
+        if name.strip() not in weights:
+            raise ValueError(f"Unknown vector kind {name!r} in AUTOCODER_MV_WEIGHTS")
+        weights[name.strip()] = float(value)
+    return np.array([weights[k] for k in KINDS], dtype=np.float32)
+
+
+class MultiVectorIndex:
+    """
+    Exact search over all vectors (dequantized block by block), aggregated
+    per code row with one reduceat. Returns code rows like the other engines.
+    """
+
+    name = "multi"
+
+    def __init__(self, embeddings: np.ndarray, rows: np.ndarray, kinds: np.ndarray, n_codes: int,
+                 scales: np.ndarray = None, agg: str = MV_AGG, weights: np.ndarray = None):
+        if agg not in ("max", "weighted"):
+            raise ValueError(f"Unknown multi-vector aggregation {agg!r}")
+        self.embeddings = embeddings
+        self.scales = scales
+        self.n_codes = n_codes
+        self.agg = agg
+        weights = parse_weights(MV_WEIGHTS) if weights is None else weights
+        # Vectors are grouped by row, then kind: segment boundaries for both levels
+        rows, kinds = np.asarray(rows), np.asarray(kinds)
+        new_row = np.r_[True, rows[1:] != rows[:-1]]
+        new_seg = new_row | np.r_[True, kinds[1:] != kinds[:-1]]
+        self.code_starts = np.flatnonzero(new_row)
+        self.code_rows = rows[self.code_starts]
+        self.seg_starts = np.flatnonzero(new_seg)
+        self.seg_weights = weights[kinds[self.seg_starts]]
+        # First segment of each code, and each code's weight total (kinds it has)
+        self.code_segs = np.searchsorted(self.seg_starts, self.code_starts)
+        self.code_weights = np.add.reduceat(self.seg_weights, self.code_segs)
+
+    @classmethod
+    def load(cls, index_dir: str, n_codes: int):
+        cfg = read_config(index_dir)
+        if cfg is None:
+            raise RuntimeError(f"No multi-vector index in {index_dir}; rebuild with build_index.py --multi-vector")
+        emb = np.load(os.path.join(index_dir, MV_EMBEDDINGS_FILE), mmap_mode="r")
+        rows = np.load(os.path.join(index_dir, MV_ROWS_FILE), mmap_mode="r")
+        kinds = np.load(os.path.join(index_dir, MV_KINDS_FILE), mmap_mode="r")
+        scales = np.load(os.path.join(index_dir, MV_SCALES_FILE)) if cfg.get("dtype") == "int8" else None
+        return cls(emb, rows, kinds, n_codes, scales=scales)
+
+    def __len__(self):
+        return self.n_codes
+
+    def vector_scores(self, q: np.ndarray) -> np.ndarray:
+        """(n_queries, n_vectors) cosine scores."""
+        out = np.empty((len(q), len(self.embeddings)), dtype=np.float32)
+        for lo in range(0, len(self.embeddings), MV_BLOCK_ROWS):
+            block = np.asarray(self.embeddings[lo:lo + MV_BLOCK_ROWS], dtype=np.float32)
+            out[:, lo:lo + len(block)] = q @ block.T
+        if self.scales is not None:
+            out *= self.scales
+        return out
+
+    def code_scores(self, q: np.ndarray) -> np.ndarray:
+        """(n_queries, n_codes) aggregated scores; codes without vectors get -inf."""
+        s = self.vector_scores(q)
+        out = np.full((len(q), self.n_codes), -np.inf, dtype=np.float32)
+        if self.agg == "max":
+            out[:, self.code_rows] = np.maximum.reduceat(s, self.code_starts, axis=1)
+            return out
+        seg = np.maximum.reduceat(s, self.seg_starts, axis=1) * self.seg_weights
+        out[:, self.code_rows] = np.add.reduceat(seg, self.code_segs, axis=1) / self.code_weights
+        return out
+
+    def search(self, q_vecs: np.ndarray, k: int):
+        q = np.atleast_2d(np.asarray(q_vecs, dtype=np.float32))
+        return top_k(self.code_scores(q), k)
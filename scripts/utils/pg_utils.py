@@ -3,8 +3,25 @@
 PostgreSQL utility functions for ICD10 indexer
 """
 
+import csv
+import io
+import struct
+import time
+import numpy as np
 from pgvector.psycopg2 import register_vector
 
+HNSW_INDEX_NAME = "idx_icd10_meta_embedding_hnsw"
+HNSW_INDEX_SQL = f"""
+CREATE INDEX IF NOT EXISTS {HNSW_INDEX_NAME}
+ON icd10_meta USING hnsw (embedding vector_cosine_ops);
+"""
+# Multi-vector table (utils/multi_vector.py): several half-precision vectors per code
+MV_HNSW_INDEX_NAME = "idx_icd10_vectors_embedding_hnsw"
+MV_HNSW_INDEX_SQL = f"""
+CREATE INDEX IF NOT EXISTS {MV_HNSW_INDEX_NAME}
+ON icd10_vectors USING hnsw (embedding halfvec_cosine_ops);
+"""
+
 def register_vector_type(conn):
     """
     Register the pgvector extension with the PostgreSQL connection.
@@ -13,7 +30,7 @@ def register_vector_type(conn):
     print("pgvector type registered.")
 
 
-def ensure_icd10_table(conn):
+def ensure_icd10_table(conn, multi_vector: bool = False):
     # 1. Create extension if not exists and commit
     with conn.cursor() as cur:
         cur.execute("CREATE EXTENSION IF NOT EXISTS vector;")
@@ -33,57 +50,231 @@ def ensure_icd10_table(conn):
         search_text TEXT NOT NULL
     );
 
+    CREATE TABLE IF NOT EXISTS icd10_index_info (
+        key TEXT PRIMARY KEY,
+        value TEXT NOT NULL
+    );
+
     CREATE TABLE IF NOT EXISTS icd10_meta (
         code TEXT PRIMARY KEY,
         embedding VECTOR(384) NOT NULL,
         CONSTRAINT fk_code FOREIGN KEY(code) REFERENCES icd10_codes(code) ON DELETE CASCADE
     );
 
-    CREATE INDEX IF NOT EXISTS idx_icd10_meta_embedding_hnsw
-    ON icd10_meta USING hnsw (embedding vector_cosine_ops);
-    """
+    """ + HNSW_INDEX_SQL
+    if multi_vector:
+        # halfvec needs pgvector >= 0.7
+        create_table_sql += """
+        CREATE TABLE IF NOT EXISTS icd10_vectors (
+            id BIGSERIAL PRIMARY KEY,
+            code TEXT NOT NULL REFERENCES icd10_codes(code) ON DELETE CASCADE,
+            kind SMALLINT NOT NULL,
+            embedding HALFVEC(384) NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_icd10_vectors_code ON icd10_vectors (code);
+        """ + MV_HNSW_INDEX_SQL
     with conn.cursor() as cur:
         cur.execute(create_table_sql)
         conn.commit()
-    print("Tables 'icd10_codes' and 'icd10_meta' ensured in PostgreSQL.")
-
-
-def upsert_icd10_codes(conn, df):
-    insert_sql = """
-    INSERT INTO icd10_codes (code, title, description, synonyms, search_text)
-    VALUES (%s, %s, %s, %s, %s)
-    ON CONFLICT (code) DO UPDATE SET
-        title=EXCLUDED.title,
-        description=EXCLUDED.description,
-        synonyms=EXCLUDED.synonyms,
-        search_text=EXCLUDED.search_text;
+    print("Tables 'icd10_codes' and 'icd10_meta'" + (" and 'icd10_vectors'" if multi_vector else "")
+          + " ensured in PostgreSQL.")
+
+
+def delete_icd10_codes(conn, codes):
+    """Deletes codes from icd10_codes; icd10_meta rows go with them (CASCADE)."""
+    if not codes:
+        return
+    with conn.cursor() as cur:
+        cur.execute("DELETE FROM icd10_codes WHERE code = ANY(%s);", (list(codes),))
+        conn.commit()
+    print(f"Deleted {len(codes)} codes from icd10_codes and icd10_meta tables.")
+
+
+INDEX_VERSION_SQL = "SELECT value FROM icd10_index_info WHERE key = 'index_version';"
+
+
+def get_index_version(conn):
+    with conn.cursor() as cur:
+        cur.execute(INDEX_VERSION_SQL)
+        row = cur.fetchone()
+    return row[0] if row else None
+
+
+async def get_index_version_async(conn):
+    """get_index_version for an asyncpg connection."""
+    return await conn.fetchval(INDEX_VERSION_SQL)
+
+
+def set_index_version(conn, version: str):
+    with conn.cursor() as cur:
+        cur.execute("""
+            INSERT INTO icd10_index_info (key, value) VALUES ('index_version', %s)
+            ON CONFLICT (key) DO UPDATE SET value = EXCLUDED.value;
+        """, (version,))
+        conn.commit()
+
+
+# -----------------------------------------------------------------------------
+# Bulk loading (COPY into staging tables + one merge)
+# -----------------------------------------------------------------------------
+class _IterStream(io.RawIOBase):
+    """File-like object over a generator of bytes chunks, for copy_expert."""
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._buf = b""
+
+    def readable(self):
+        return True
+
+    def read(self, size=-1):
+        while size < 0 or len(self._buf) < size:
+            try:
+                self._buf += next(self._chunks)
+            except StopIteration:
+                break
+        if size < 0:
+            out, self._buf = self._buf, b""
+        else:
+            out, self._buf = self._buf[:size], self._buf[size:]
+        return out
+
+
+def _csv_chunks(rows, chunk_rows=2000):
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    for n, row in enumerate(rows, 1):
+        writer.writerow(row)
+        if n % chunk_rows == 0:
+            yield buf.getvalue().encode("utf-8")
+            buf.seek(0)
+            buf.truncate()
+    yield buf.getvalue().encode("utf-8")
+
+
+def _vector_copy_chunks(codes, embeddings, chunk_rows=2000):
+    """
+    Rows (code TEXT, embedding VECTOR) in PostgreSQL binary COPY format.
+    pgvector's binary form is int16 dim, int16 unused, then float4 big-endian.
+    """
+    emb = np.ascontiguousarray(embeddings, dtype=">f4")
+    dim = emb.shape[1]
+    vec_head = struct.pack("!ihh", 4 + 4 * dim, dim, 0)
+    yield b"PGCOPY\n\xff\r\n\x00" + struct.pack("!ii", 0, 0)
+    parts = []
+    for i, code in enumerate(codes):
+        code_b = str(code).encode("utf-8")
+        parts.append(struct.pack("!hi", 2, len(code_b)) + code_b + vec_head + emb[i].tobytes())
+        if len(parts) >= chunk_rows:
+            yield b"".join(parts)
+            parts = []
+    parts.append(struct.pack("!h", -1))
+    yield b"".join(parts)
+
+
+def _halfvec_copy_chunks(codes, kinds, embeddings, chunk_rows=2000):
+    """
+    Rows (code TEXT, kind SMALLINT, embedding HALFVEC) in binary COPY format.
+    halfvec's binary form is int16 dim, int16 unused, then float2 big-endian.
+    """
+    emb = np.ascontiguousarray(embeddings, dtype=">f2")
+    dim = emb.shape[1]
+    vec_head = struct.pack("!ihh", 4 + 2 * dim, dim, 0)
+    yield b"PGCOPY\n\xff\r\n\x00" + struct.pack("!ii", 0, 0)
+    parts = []
+    for i, (code, kind) in enumerate(zip(codes, kinds)):
+        code_b = str(code).encode("utf-8")
+        parts.append(struct.pack("!hi", 3, len(code_b)) + code_b + struct.pack("!ih", 2, int(kind))
+                     + vec_head + emb[i].tobytes())
+        if len(parts) >= chunk_rows:
+            yield b"".join(parts)
+            parts = []
+    parts.append(struct.pack("!h", -1))
+    yield b"".join(parts)
+
+
+def bulk_load_vectors(conn, codes, vec_codes, kinds, embeddings, rebuild_index=True):
+    """
+    Replaces the icd10_vectors rows of `codes` with (vec_codes[i], kinds[i],
+    embeddings[i]) in one transaction. The codes must already be in icd10_codes.
+    """
+    t0 = time.perf_counter()
+    with conn.cursor() as cur:
+        if rebuild_index:
+            cur.execute(f"DROP INDEX IF EXISTS {MV_HNSW_INDEX_NAME};")
+        cur.execute("DELETE FROM icd10_vectors WHERE code = ANY(%s);", (list(codes),))
+        cur.copy_expert(
+            "COPY icd10_vectors (code, kind, embedding) FROM STDIN WITH (FORMAT binary)",
+            _IterStream(_halfvec_copy_chunks(vec_codes, kinds, embeddings)),
+        )
+        if rebuild_index:
+            cur.execute(MV_HNSW_INDEX_SQL)
+        conn.commit()
+    print(f"Bulk loaded {len(vec_codes)} vectors for {len(codes)} codes into icd10_vectors "
+          f"({time.perf_counter() - t0:.2f}s)")
+
+
+def has_vectors(conn) -> bool:
+    with conn.cursor() as cur:
+        cur.execute("SELECT EXISTS (SELECT 1 FROM icd10_vectors);")
+        return bool(cur.fetchone()[0])
+
+
+def bulk_load_icd10(conn, df, embeddings, rebuild_index=True,
+                    maintenance_work_mem="1GB", parallel_workers=4):
     """
-    meta_sql = """
-    INSERT INTO icd10_meta (code, embedding)
-    VALUES (%s, %s)
-    ON CONFLICT (code) DO UPDATE SET
-        embedding=EXCLUDED.embedding;
+    Loads codes and embeddings with COPY into temp staging tables, then merges
+    each into its target with a single INSERT ... ON CONFLICT. With
+    rebuild_index the HNSW index is dropped for the merge and rebuilt once
+    afterwards. Everything runs in one transaction.
     """
+    t0 = time.perf_counter()
+    dim = int(np.asarray(embeddings).shape[1])
+    synonyms = df["synonyms"] if "synonyms" in df else df.get("synonym")
+    cols = [df["code"], df["title"], df.get("description"), synonyms, df["search_text"]]
+    cols = [c.where(c.notna(), None).tolist() if c is not None else [None] * len(df) for c in cols]
+
     with conn.cursor() as cur:
-        for _, row in df.iterrows():
-            cur.execute(
-                insert_sql,
-                (
-                    row.get("code"),
-                    row.get("title"),
-                    row.get("description"),
-                    row.get("synonyms"),
-                    row.get("search_text"),
-                )
-            )
-            # Insert/update meta table if embedding is present
-            if "embedding" in row and row["embedding"] is not None:
-                cur.execute(
-                    meta_sql,
-                    (
-                        row.get("code"),
-                        row.get("embedding"),
-                    )
-                )
+        cur.execute("""
+            CREATE TEMP TABLE icd10_codes_stage (LIKE icd10_codes) ON COMMIT DROP;
+            CREATE TEMP TABLE icd10_meta_stage (code TEXT, embedding VECTOR(%s)) ON COMMIT DROP;
+        """, (dim,))
+        # CSV COPY reads unquoted empty fields as NULL; missing text is stored as ''
+        # (like the local catalog) and must not trip the NOT NULL columns
+        cur.copy_expert(
+            "COPY icd10_codes_stage (code, title, description, synonyms, search_text) FROM STDIN "
+            "WITH (FORMAT csv, FORCE_NOT_NULL (title, description, synonyms, search_text))",
+            _IterStream(_csv_chunks(zip(*cols))),
+        )
+        cur.copy_expert(
+            "COPY icd10_meta_stage (code, embedding) FROM STDIN WITH (FORMAT binary)",
+            _IterStream(_vector_copy_chunks(cols[0], embeddings)),
+        )
+        t_copy = time.perf_counter()
+
+        if rebuild_index:
+            cur.execute(f"DROP INDEX IF EXISTS {HNSW_INDEX_NAME};")
+        cur.execute("""
+            INSERT INTO icd10_codes (code, title, description, synonyms, search_text)
+            SELECT code, title, description, synonyms, search_text FROM icd10_codes_stage
+            ON CONFLICT (code) DO UPDATE SET
+                title=EXCLUDED.title,
+                description=EXCLUDED.description,
+                synonyms=EXCLUDED.synonyms,
+                search_text=EXCLUDED.search_text;
+            INSERT INTO icd10_meta (code, embedding)
+            SELECT code, embedding FROM icd10_meta_stage
+            ON CONFLICT (code) DO UPDATE SET
+                embedding=EXCLUDED.embedding;
+        """)
+        t_merge = time.perf_counter()
+
+        if rebuild_index:
+            cur.execute("SET LOCAL maintenance_work_mem = %s;", (maintenance_work_mem,))
+            cur.execute("SET LOCAL max_parallel_maintenance_workers = %s;", (parallel_workers,))
+            cur.execute(HNSW_INDEX_SQL)
         conn.commit()
-    print(f"Inserted/updated {len(df)} rows into icd10_codes and icd10_meta tables.")
+    t_end = time.perf_counter()
+    print(f"Bulk loaded {len(df)} rows into icd10_codes and icd10_meta "
+          f"(copy {t_copy - t0:.2f}s, merge {t_merge - t_copy:.2f}s"
+          + (f", hnsw rebuild {t_end - t_merge:.2f}s" if rebuild_index else "") + ")")
@@ -0,0 +1,155 @@
+# utils/preprocess.py
+"""
+Query-side clinical note preprocessing: aliases, negation, sentence chunks
+
+    prepare_note("Acute low back pain after lifting box, no radiculopathy")
+    -> PreparedNote(text="acute low back pain after lifting box",
+                    chunks=["acute low back pain after lifting box"],
+                    negated=["radiculopathy"])
+
+Each sentence is normalized with text_utils.normalize_text (the alias table
+the index build uses too), then NegEx-style scoping drops negated findings:
+a trigger ("no", "denies", "negative for", ...) negates up to
+NEGATION_WINDOW following tokens, stopping early at a terminator ("but",
+"however", "reports", ...), a comma or semicolon, or the end of the
+sentence. Post-triggers ("unlikely", "was ruled out") negate the tokens
+before them, back to the same boundaries, and pseudo-triggers ("no change",
+"gram negative") negate nothing.
+
+Notes longer than CHUNK_CHARS are packed into sentence chunks that are
+embedded separately; dense retrieval max-pools each code's score over the
+chunks, so one long note does not blur into a single averaged vector.
+
+Only queries go through here. Index texts are never negation-stripped:
+ICD titles like "... without complications" describe the code itself.
+"""
+import bisect
+import os
+import re
+from typing import List, NamedTuple
+
+from .text_utils import TokenTrie, normalize_text
+
+NEGATION = os.getenv("AUTOCODER_NEGATION", "strip")  # strip | off
+NEGATION_WINDOW = int(os.getenv("AUTOCODER_NEGATION_WINDOW", "5"))
+CHUNK_CHARS = int(os.getenv("AUTOCODER_CHUNK_CHARS", "300"))
+MAX_CHUNKS = int(os.getenv("AUTOCODER_MAX_CHUNKS", "16"))
+
+_SENTENCE_RE = re.compile(r"(?<=[.!?;])\s+|\s*\n+\s*")
+_CLAUSE_RE = re.compile(r"[,;]")
+# Token prepare_note puts between clauses; it ends a negation scope and is dropped
+CLAUSE_BREAK = ","
+
+# Phrases in normalized form (after alias expansion: "neg for" is "negative for").
+# "without" is left out: it is ICD title vocabulary ("without complications").
+PRE, POST, PSEUDO, TERM = "pre", "post", "pseudo", "term"
+NEGATION_PHRASES = {
+    **dict.fromkeys([
+        "no", "not", "nor", "neither", "never", "denies", "denied", "deny", "denying",
+        "negative for", "no evidence of", "no signs of", "no sign of", "no history of",
+        "no complaints of", "free of", "absence of", "rules out", "ruled out",
+        "resolution of", "fails to reveal", "not demonstrate", "not have",
+    ], PRE),
+    **dict.fromkeys([
+        "unlikely", "was ruled out", "is ruled out", "been ruled out", "are ruled out",
+        "was negative", "is negative", "were negative", "absent", "resolved",
+    ], POST),
+    **dict.fromkeys([
+        "no change", "no increase", "no decrease", "no further", "not only",
+        "not necessarily", "not certain", "no significant change", "gram negative",
+        "not ruled out", "not been ruled out",
+    ], PSEUDO),
+    **dict.fromkeys([
+        "but", "however", "although", "though", "except", "aside from", "apart from",
+        "yet", "still", "which", "secondary to", "due to", "cause of", "reports",
+        "endorses", "complains of", "presents with", "admits", "positive for",
+    ], TERM),
+}
+_NEGATION_TRIE = TokenTrie(NEGATION_PHRASES)
+
+
+class PreparedNote(NamedTuple):
+    text: str           # normalized note with negated spans removed
+    chunks: List[str]   # sentence chunks of `text` (one when the note is short)
+    negated: List[str]  # removed spans, for debugging
+
+
+def split_sentences(note: str) -> List[str]:
+    return [s for s in _SENTENCE_RE.split(note or "") if s.strip()]
+
+
+def strip_negated(tokens: List[str], window: int = NEGATION_WINDOW):
+    """
+    (kept tokens, negated spans) for one normalized sentence. CLAUSE_BREAK
+    tokens end a scope and are left out of the kept tokens.
+    """
+    matches = list(_NEGATION_TRIE.finditer(tokens))
+    breaks = [i for i, t in enumerate(tokens) if t == CLAUSE_BREAK]
+    drop = [False] * len(tokens)
+    spans = []
+    for n, (start, end, kind) in enumerate(matches):
+        if kind == PRE:
+            stop = min(len(tokens), end + window)
+            if n + 1 < len(matches):  # the next trigger / terminator ends the scope
+                stop = min(stop, matches[n + 1][0])
+            b = bisect.bisect_left(breaks, end)
+            if b < len(breaks):
+                stop = min(stop, breaks[b])
+            lo, hi = start, stop
+            scope = (end, stop)
+        elif kind == POST:
+            begin = max(0, start - window)
+            if n > 0:
+                begin = max(begin, matches[n - 1][1])
+            b = bisect.bisect_left(breaks, start)
+            if b > 0:
+                begin = max(begin, breaks[b - 1] + 1)
+            lo, hi = begin, end
+            scope = (begin, start)
+        else:
+            continue
+        if scope[1] > scope[0]:
+            spans.append(" ".join(tokens[scope[0]:scope[1]]))
+        for i in range(lo, hi):
+            drop[i] = True
+    return [t for t, d in zip(tokens, drop) if not d and t != CLAUSE_BREAK], spans
+
+
+def _pack(sentences: List[str], chunk_chars: int, max_chunks: int) -> List[str]:
+    """Greedily packs consecutive sentences into chunks of about chunk_chars."""
+    chunks = []
+    for s in sentences:
+        if chunks and len(chunks[-1]) + 1 + len(s) <= chunk_chars:
+            chunks[-1] += " " + s
+        else:
+            chunks.append(s)
+    if len(chunks) > max_chunks:
+        chunks = chunks[:max_chunks - 1] + [" ".join(chunks[max_chunks - 1:])]
+    return chunks
+
+
+def prepare_note(note: str, negation: str = NEGATION, chunk_chars: int = CHUNK_CHARS,
+                 max_chunks: int = MAX_CHUNKS) -> PreparedNote:
+    sentences, negated = [], []
+    for raw in split_sentences(note):
+        if negation == "strip":
+            tokens = []
+            for clause in _CLAUSE_RE.split(raw):
+                tokens += normalize_text(clause).split() + [CLAUSE_BREAK]
+            tokens, spans = strip_negated(tokens)
+            negated.extend(spans)
+        else:
+            tokens = normalize_text(raw).split()
+        if tokens:
+            sentences.append(" ".join(tokens))
+    text = " ".join(sentences)
+    if not text:
+        # Everything was negated ("denies chest pain"): search the note as written
+        text = normalize_text(note)
+        sentences = [text] if text else []
+    chunks = [text] if len(text) <= chunk_chars else _pack(sentences, chunk_chars, max_chunks)
+    return PreparedNote(text, chunks or [text], negated)
+
+
+def prepare_notes(notes: List[str], **kwargs) -> List[PreparedNote]:
+    return [prepare_note(n, **kwargs) for n in notes]
@@ -1,10 +1,21 @@
-import os, requests
+import os, requests, asyncio, hashlib
+import httpx
+
+from .cache import TTLCache
+from .text_utils import normalize_text
 
 LLM_URL   = os.getenv("LLM_BASE_URL", "http://localhost:11434")
 LLM_MODEL = os.getenv("LLM_MODEL", "llama3.2:3b-instruct")
 LLM_TEMP  = float(os.getenv("LLM_TEMP", "0.2"))
 LLM_MAX   = int(os.getenv("LLM_MAX_TOKENS", "96"))
 
+# Rationale engine tuning (concurrency cap, request-level deadline, cache)
+LLM_CONCURRENCY   = int(os.getenv("LLM_CONCURRENCY", "4"))
+LLM_DEADLINE_S    = float(os.getenv("LLM_DEADLINE_S", "8.0"))
+LLM_CALL_TIMEOUT  = float(os.getenv("LLM_CALL_TIMEOUT_S", "6.0"))
+LLM_CACHE_SIZE    = int(os.getenv("LLM_CACHE_SIZE", "4096"))
+LLM_CACHE_TTL     = float(os.getenv("LLM_CACHE_TTL_S", "86400"))
+
 PROMPT_TMPL = """You are assisting with ICD-10 code suggestions.
 Write ONE short sentence explaining why the ICD-10 code fits the note.
 Avoid clinical certainty; use hedged language if needed.
@@ -14,19 +25,133 @@ ICD-10: {code} — {title}
 
 One-sentence rationale:"""
 
+PROMPT_HASH = hashlib.sha1(PROMPT_TMPL.encode("utf-8")).hexdigest()[:12]
+
+
+def fallback_rationale(title: str) -> str:
+    return f"Presentation is consistent with {title.lower()} based on the note text."
+
+
+def _build_payload(note: str, code: str, title: str) -> dict:
+    return {
+        "model": LLM_MODEL,
+        "prompt": PROMPT_TMPL.format(note=note, code=code, title=title),
+        "options": {"temperature": LLM_TEMP, "num_predict": LLM_MAX},
+        "stream": False
+    }
+
+
+def _clean_response(text: str) -> str:
+    # Safety trims: 1 sentence, < 30 words
+    text = text.strip().split("\n")[0]
+    return text[:300]
+
+
 def llm_rationale(note: str, code: str, title: str, timeout=6.0) -> str:
     try:
-        payload = {
-            "model": LLM_MODEL,
-            "prompt": PROMPT_TMPL.format(note=note, code=code, title=title),
-            "options": {"temperature": LLM_TEMP, "num_predict": LLM_MAX}
-        }
+        payload = _build_payload(note, code, title)
         r = requests.post(f"{LLM_URL}/api/generate", json=payload, timeout=timeout)
         r.raise_for_status()
-        text = r.json().get("response", "").strip()
-        # Safety trims: 1 sentence, < 30 words
-        text = text.split("\n")[0]
-        return text[:300]
+        return _clean_response(r.json().get("response", ""))
     except Exception:
         # Fallback template
-        return f"Presentation is consistent with {title.lower()} based on the note text."
+        return fallback_rationale(title)
+
+
+class RationaleEngine:
+    """
+    Generates rationales for a whole result list at once.
+
+    All calls share one pooled httpx.AsyncClient, run concurrently under a
+    semaphore, and must finish within a single request-level deadline; calls
+    still pending at the deadline get the templated fallback. Successful LLM
+    answers are cached on (normalized note, code, model, temperature, prompt).
+    """
+
+    def __init__(self, concurrency: int = LLM_CONCURRENCY, deadline_s: float = LLM_DEADLINE_S,
+                 call_timeout_s: float = LLM_CALL_TIMEOUT, cache_size: int = LLM_CACHE_SIZE,
+                 cache_ttl_s: float = LLM_CACHE_TTL):
+        self.concurrency = concurrency
+        self.deadline_s = deadline_s
+        self.call_timeout_s = call_timeout_s
+        self.cache = TTLCache(maxsize=cache_size, ttl=cache_ttl_s)
+        self.timeouts = 0
+        self.errors = 0
+        self._client = None
+        self._sem = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=LLM_URL,
+                timeout=self.call_timeout_s,
+                limits=httpx.Limits(max_connections=self.concurrency,
+                                    max_keepalive_connections=self.concurrency),
+            )
+            self._sem = asyncio.Semaphore(self.concurrency)
+        return self._client
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    @staticmethod
+    def cache_key(note: str, code: str):
+        return (normalize_text(note), code, LLM_MODEL, LLM_TEMP, PROMPT_HASH)
+
+    async def _generate(self, note: str, code: str, title: str) -> str:
+        key = self.cache_key(note, code)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+        client = self.client
+        async with self._sem:
+            try:
+                r = await client.post("/api/generate", json=_build_payload(note, code, title))
+                r.raise_for_status()
+                text = _clean_response(r.json().get("response", ""))
+            except Exception as e:
+                self.errors += 1
+                print(f"LLM rationale failed for {code}: {e}")
+                return fallback_rationale(title)
+        if not text:
+            return fallback_rationale(title)
+        self.cache.set(key, text)
+        return text
+
+    async def annotate_iter(self, note: str, results: list, deadline_s: float = None):
+        """
+        Yields (index, rationale) for every result as its call completes,
+        within one deadline; calls still pending then yield the fallback.
+        """
+        if not results:
+            return
+        deadline_s = self.deadline_s if deadline_s is None else deadline_s
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + deadline_s
+        tasks = {asyncio.ensure_future(self._generate(note, r["code"], r["title"])): i
+                 for i, r in enumerate(results)}
+        pending = set(tasks)
+        try:
+            while pending and loop.time() < deadline:
+                done, pending = await asyncio.wait(pending, timeout=deadline - loop.time(),
+                                                   return_when=asyncio.FIRST_COMPLETED)
+                for task in sorted(done, key=tasks.get):
+                    yield tasks[task], task.result()
+        finally:
+            # Also runs when the consumer stops early (e.g. client disconnect)
+            for task in pending:
+                task.cancel()
+        self.timeouts += len(pending)
+        for task in sorted(pending, key=tasks.get):
+            yield tasks[task], fallback_rationale(results[tasks[task]]["title"])
+
+    async def annotate(self, note: str, results: list, deadline_s: float = None) -> list:
+        """
+        Fills r["rationale"] for every result in place, within one deadline.
+        """
+        async for i, text in self.annotate_iter(note, results, deadline_s):
+            results[i]["rationale"] = text
+        return results
@@ -0,0 +1,63 @@
+# utils/rerank.py
+"""
+Cross-encoder reranking of first-stage candidates (CPU)
+"""
+import os
+import time
+import numpy as np
+
+RERANK_MODEL = os.getenv("AUTOCODER_RERANK_MODEL", "")  # e.g. cross-encoder/ms-marco-MiniLM-L-6-v2
+RERANK_MAX_LENGTH = int(os.getenv("AUTOCODER_RERANK_MAX_LENGTH", "256"))
+# Pairs per forward pass; the rerank deadline is checked between batches
+RERANK_BATCH = int(os.getenv("AUTOCODER_RERANK_BATCH", "16"))
+
+
+class RerankTimeout(TimeoutError):
+    """The deadline passed between cross-encoder batches."""
+
+
+class CrossEncoderReranker:
+    def __init__(self, model_name: str = RERANK_MODEL, max_length: int = RERANK_MAX_LENGTH,
+                 batch_size: int = RERANK_BATCH):
+        from sentence_transformers import CrossEncoder
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.model = CrossEncoder(model_name, max_length=max_length, device="cpu")
+
+    def score_pairs(self, pairs, deadline: float = None) -> np.ndarray:
+        """
+        Scores pairs batch_size at a time. With a deadline (time.monotonic()),
+        raises RerankTimeout before starting a batch once it has passed, so a
+        caller that gave up does not keep the worker thread busy.
+        """
+        scores = []
+        for lo in range(0, len(pairs), self.batch_size):
+            if deadline is not None and time.monotonic() >= deadline:
+                raise RerankTimeout(f"rerank deadline passed after {lo}/{len(pairs)} pairs")
+            batch = pairs[lo:lo + self.batch_size]
+            scores.append(np.asarray(self.model.predict(batch, batch_size=self.batch_size, show_progress_bar=False),
+                                     dtype=np.float32).reshape(-1))
+        return np.concatenate(scores) if scores else np.empty(0, dtype=np.float32)
+
+    def rerank_many(self, notes, candidate_lists, texts_for, deadline: float = None):
+        """
+        Scores every (note, candidate text) pair of every note in shared
+        batches and returns each candidate list re-sorted by that score.
+        `texts_for(results)` returns the search_text of each result.
+        """
+        pairs, bounds = [], [0]
+        for note, results in zip(notes, candidate_lists):
+            pairs.extend((note, t) for t in texts_for(results))
+            bounds.append(len(pairs))
+        scores = self.score_pairs(pairs, deadline)
+        out = []
+        for n, results in enumerate(candidate_lists):
+            s = scores[bounds[n]:bounds[n + 1]]
+            reranked = []
+            for j in np.argsort(-s, kind="stable"):
+                r = dict(results[j])
+                r["retrieval_confidence"] = r["confidence"]
+                r["confidence"] = float(s[j])
+                reranked.append(r)
+            out.append(reranked)
+        return out
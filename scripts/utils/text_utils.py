@@ -1,23 +1,89 @@
 # utils/text_utils.py
 # Utility functions for text normalization and search text building
+import re
+
+from .clinical_aliases import CLINICAL_ALIASES
 
 ALIASES = {
-    # Add your custom token aliases here, e.g.:
-    'htn': 'hypertension',
+    **CLINICAL_ALIASES,
+    # Add your custom aliases here, in normalized form ("s p" for "s/p"), e.g.:
+    # 'htn': 'hypertension',
 }
 
+# Compiled once: normalize_text runs on every note and every index row
+_PUNCT_RUN_RE = re.compile(r"[^\w\s]+")
+
+
+class TokenTrie:
+    """
+    Trie over token sequences ({"multi token phrase": value}). Matching is
+    greedy, longest phrase first, left to right: one pass over the tokens
+    with at most `depth` dict lookups per position.
+    """
+
+    def __init__(self, phrases: dict):
+        self.root = {}
+        self.depth = 0
+        for phrase, value in phrases.items():
+            node = self.root
+            toks = phrase.split()
+            for tok in toks:
+                node = node.setdefault(tok, {})
+            node[None] = value  # end of phrase
+            self.depth = max(self.depth, len(toks))
+
+    def match_at(self, tokens, i):
+        """(end, value) of the longest phrase starting at tokens[i], or None."""
+        node, best = self.root, None
+        for j in range(i, min(len(tokens), i + self.depth)):
+            node = node.get(tokens[j])
+            if node is None:
+                break
+            if None in node:
+                best = (j + 1, node[None])
+        return best
+
+    def finditer(self, tokens):
+        """Non-overlapping (start, end, value) matches, left to right."""
+        i = 0
+        while i < len(tokens):
+            m = self.match_at(tokens, i)
+            if m is None:
+                i += 1
+                continue
+            yield i, m[0], m[1]
+            i = m[0]
+
+    def replace(self, tokens):
+        """tokens with every match replaced by its value."""
+        out, i = [], 0
+        while i < len(tokens):
+            m = self.match_at(tokens, i)
+            if m is None:
+                out.append(tokens[i])
+                i += 1
+            else:
+                out.append(m[1])
+                i = m[0]
+        return out
+
+
+_ALIAS_TRIE = TokenTrie(ALIASES)
+
 def normalize_text(s: str) -> str:
-    import re
     if not s:
         return ""
-    s = s.lower()
-    s = re.sub(r"[^\w\s]", " ", s)  # drop punctuation
-    s = re.sub(r"\s+", " ", s).strip()
-    tokens = []
-    for tok in s.split():
-        tok = ALIASES.get(tok, tok)
-        tokens.append(tok)
-    return " ".join(tokens)
+    # Lowercase, punctuation to spaces, collapse whitespace, expand aliases
+    return " ".join(_ALIAS_TRIE.replace(_PUNCT_RUN_RE.sub(" ", s.lower()).split()))
+
+_SYN_PREFIX_RE = re.compile(r"^here (?:are|is)[^:]*:", re.IGNORECASE)
+
+def split_synonyms(text) -> list:
+    """Synonym phrases from a ';'-separated cell (LLM-written cells may start with 'here are ...:')."""
+    if not isinstance(text, str):
+        return []
+    body = _SYN_PREFIX_RE.sub("", text.strip()).split("\n\nnote:")[0]
+    return [s.strip(" .\n") for s in body.split(";") if 2 < len(s.strip(" .\n")) < 80]
 
 def build_search_text(row):
     parts = [
@@ -26,3 +92,41 @@ def build_search_text(row):
         normalize_text(row.get("synonyms", "").replace(";", " "))
     ]
     return " \n ".join([p for p in parts if p])
+
+
+# -----------------------------------------------------------------------------
+# Column-wise variants (pandas Series in, Series out) for index builds
+# -----------------------------------------------------------------------------
+SEP = " \n "
+
+_WS_RUN_RE = re.compile(r"\s+")
+# Every alias key as one alternation, longest first, matched on whole tokens:
+# the leftmost-longest matches _ALIAS_TRIE.replace makes
+_ALIAS_RE = re.compile(r"(?<![^ ])(?:" + "|".join(
+    re.escape(k) for k in sorted(ALIASES, key=len, reverse=True)) + r")(?![^ ])") if ALIASES else None
+
+def normalize_series(s):
+    """Same result as normalize_text, applied a whole pandas Series at a time."""
+    # Object dtype keeps Python re semantics; pyarrow-backed strings use RE2,
+    # whose \s does not match Unicode spaces the way str.split() does
+    out = (s.fillna("").astype(str).astype(object).str.lower()
+           .str.replace(_PUNCT_RUN_RE, " ", regex=True)
+           .str.replace(_WS_RUN_RE, " ", regex=True)
+           .str.strip())
+    if _ALIAS_RE is not None:
+        out = out.str.replace(_ALIAS_RE, lambda m: ALIASES[m.group(0)], regex=True)
+    return out
+
+def build_search_text_series(df):
+    """Same result as df.apply(build_search_text, axis=1), without the row loop."""
+    import pandas as pd
+    def col(name):
+        return df[name] if name in df else pd.Series("", index=df.index)
+    # Some CSVs call the column "synonym"
+    synonyms = col("synonyms") if "synonyms" in df else col("synonym")
+    parts = zip(
+        normalize_series(col("title")),
+        normalize_series(col("description")),
+        normalize_series(synonyms.fillna("").astype(str).str.replace(";", " ", regex=False)),
+    )
+    return pd.Series([SEP.join(p for p in row if p) for row in parts], index=df.index)
@@ -0,0 +1,98 @@
+# utils/tfidf.py
+"""
+TF-IDF engine over L2-normalized postings
+
+Because both the code rows and the transformed query are unit-norm, cosine
+similarity is a single sparse dot product; top-k uses argpartition.
+
+The fitted model is stored as flat arrays (see index_store): term x code
+postings, the sorted vocabulary and idf_. Queries are vectorized here with
+the same analyzer TfidfVectorizer uses (lowercase, (?u)\\b\\w\\w+\\b tokens,
+uni+bigrams), so nothing is unpickled at load time.
+"""
+import os
+import re
+import numpy as np
+from scipy import sparse
+
+from .index_store import load_csr, load_npy, save_csr, save_npy, TermIndex
+from .vector_index import top_k
+
+NGRAM_RANGE = (1, 2)
+IDF_FILE = "tfidf_idf.npy"
+_TOKEN_RE = re.compile(r"(?u)\b\w\w+\b")
+
+
+def _analyze(text: str):
+    tokens = _TOKEN_RE.findall(text.lower())
+    lo, hi = NGRAM_RANGE
+    out = list(tokens) if lo == 1 else []
+    for n in range(max(lo, 2), hi + 1):
+        out.extend(" ".join(tokens[i:i + n]) for i in range(len(tokens) - n + 1))
+    return out
+
+
+class TfidfIndex:
+    def __init__(self, postings: sparse.csr_matrix, terms: TermIndex, idf: np.ndarray, batch_rows: int = 256):
+        self.postings = postings  # (n_terms, n_codes), code columns L2-normalized
+        self.terms = terms
+        self.idf = idf
+        self.batch_rows = batch_rows
+
+    @classmethod
+    def build(cls, docs):
+        from sklearn.feature_extraction.text import TfidfVectorizer
+        vec = TfidfVectorizer(ngram_range=NGRAM_RANGE, min_df=1, dtype=np.float32)
+        X = vec.fit_transform(docs)  # rows already L2-normalized
+        # vocabulary_ ids follow sorted term order, which TermIndex relies on
+        return cls(X.T.tocsr(), TermIndex.from_terms(vec.get_feature_names_out()), vec.idf_.astype(np.float32))
+
+    def save(self, out_dir: str):
+        save_csr(out_dir, "tfidf", self.postings)
+        self.terms.save(out_dir, "tfidf")
+        save_npy(os.path.join(out_dir, IDF_FILE), self.idf)
+
+    @classmethod
+    def load(cls, index_dir: str):
+        return cls(load_csr(index_dir, "tfidf"), TermIndex.load(index_dir, "tfidf"),
+                   load_npy(os.path.join(index_dir, IDF_FILE)))
+
+    def __len__(self):
+        return self.postings.shape[1]
+
+    def _transform(self, notes) -> sparse.csr_matrix:
+        indptr, indices, data = [0], [], []
+        for note in notes:
+            ids, counts = np.unique(self.terms.lookup(_analyze(note)), return_counts=True)
+            w = counts * self.idf[ids]
+            norm = np.sqrt(np.dot(w, w))
+            indices.append(ids)
+            data.append(w / norm if norm else w)
+            indptr.append(indptr[-1] + len(ids))
+        n_terms = self.postings.shape[0]
+        if not indices:
+            return sparse.csr_matrix((0, n_terms), dtype=np.float32)
+        return sparse.csr_matrix((np.concatenate(data).astype(np.float32), np.concatenate(indices), indptr),
+                                 shape=(len(notes), n_terms))
+
+    def search(self, note: str, k: int):
+        q = self._transform([note])  # 1 x terms
+        scores = (q @ self.postings).toarray().ravel()
+        s, i = top_k(scores[None, :], k)
+        return s[0], i[0]
+
+    def search_batch(self, notes, k: int):
+        """
+        Scores N queries with one sparse matrix product per chunk of
+        `batch_rows` queries (bounds the dense score block).
+        """
+        q = self._transform(list(notes))
+        all_scores, all_idx = [], []
+        for start in range(0, q.shape[0], self.batch_rows):
+            scores = (q[start:start + self.batch_rows] @ self.postings).toarray()
+            s, i = top_k(scores, k)
+            all_scores.append(s)
+            all_idx.append(i)
+        if not all_scores:
+            return np.empty((0, k)), np.empty((0, k), dtype=np.int64)
+        return np.vstack(all_scores), np.vstack(all_idx)
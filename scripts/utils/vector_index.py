@@ -0,0 +1,286 @@
+# utils/vector_index.py
+"""
+In-process vector search engines (FAISS and brute-force NumPy)
+
+Both engines work on unit-norm float32 embeddings, so inner product equals
+cosine similarity. Artifacts written by build_index.py:
+    embeddings.npy   (n_codes, dim) float32, row i aligned with code_ids[i]
+    code_ids.npy     (n_codes,) codes
+    faiss.index      optional FAISS index over the same rows
+    category_*.npy   3-character category centroids for the two-stage engine
+"""
+import os
+import numpy as np
+
+try:
+    import faiss
+except ImportError:  # faiss-cpu is optional
+    faiss = None
+
+from .index_store import save_npy
+
+EMBEDDINGS_FILE = "embeddings.npy"
+CODE_IDS_FILE = "code_ids.npy"
+FAISS_FILE = "faiss.index"
+CATEGORY_IDS_FILE = "category_ids.npy"
+CATEGORY_CENTROIDS_FILE = "category_centroids.npy"
+CATEGORY_INDPTR_FILE = "category_indptr.npy"
+CATEGORY_ROWS_FILE = "category_rows.npy"
+
+# Build parameters per FAISS index type (see build_faiss_index)
+FAISS_PARAMS = {"hnsw": {"hnsw_m": 32, "ef_construction": 200}, "ivfpq": {"pq_m": 48}}
+FAISS_EF_SEARCH = int(os.getenv("AUTOCODER_FAISS_EF_SEARCH", "100"))
+FAISS_NPROBE = int(os.getenv("AUTOCODER_FAISS_NPROBE", "16"))
+# Two-stage engine: categories searched exactly per query, and the minimum
+# gap between the best category and the first one left out; below it the
+# query falls back to flat search
+CATEGORY_PROBE = int(os.getenv("AUTOCODER_CATEGORY_PROBE", "8"))
+CATEGORY_MARGIN = float(os.getenv("AUTOCODER_CATEGORY_MARGIN", "0.02"))
+
+
+def category_of(code) -> str:
+    """ICD-10 3-character category: A00 for A000 / A00.0."""
+    return str(code).replace(".", "").strip().upper()[:3]
+
+
+def top_k(scores: np.ndarray, k: int):
+    """
+    Row-wise top-k of a (n_queries, n_items) score matrix using argpartition.
+    Returns (scores, indices), both (n_queries, k) and sorted best-first.
+    """
+    scores = np.atleast_2d(scores)
+    k = min(k, scores.shape[1])
+    if k <= 0:
+        empty = np.empty((scores.shape[0], 0))
+        return empty, empty.astype(np.int64)
+    if k < scores.shape[1]:
+        part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        part = np.tile(np.arange(scores.shape[1]), (scores.shape[0], 1))
+    part_scores = np.take_along_axis(scores, part, axis=1)
+    order = np.argsort(-part_scores, axis=1)
+    idx = np.take_along_axis(part, order, axis=1)
+    return np.take_along_axis(part_scores, order, axis=1), idx
+
+
+class NumpyIndex:
+    """Exact search as one matmul over the (memory-mapped) embedding matrix."""
+
+    name = "numpy"
+
+    def __init__(self, embeddings: np.ndarray):
+        self.embeddings = embeddings
+
+    @classmethod
+    def load(cls, index_dir: str):
+        return cls(np.load(os.path.join(index_dir, EMBEDDINGS_FILE), mmap_mode="r"))
+
+    def __len__(self):
+        return self.embeddings.shape[0]
+
+    def search(self, q_vecs: np.ndarray, k: int):
+        q = np.atleast_2d(np.asarray(q_vecs, dtype=np.float32))
+        return top_k(q @ self.embeddings.T, k)
+
+
+class FaissIndex:
+    """Approximate search over a FAISS HNSW or IVF-PQ index."""
+
+    name = "faiss"
+
+    def __init__(self, index):
+        self.index = index
+
+    @classmethod
+    def load(cls, index_dir: str):
+        if faiss is None:
+            raise RuntimeError("faiss is not installed")
+        path = os.path.join(index_dir, FAISS_FILE)
+        try:
+            index = faiss.read_index(path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+        except RuntimeError:
+            # Not every index type supports mmap; fall back to a regular read
+            index = faiss.read_index(path)
+        if hasattr(index, "hnsw"):
+            index.hnsw.efSearch = FAISS_EF_SEARCH
+        if hasattr(index, "nprobe"):
+            index.nprobe = FAISS_NPROBE
+        return cls(index)
+
+    def __len__(self):
+        return self.index.ntotal
+
+    def search(self, q_vecs: np.ndarray, k: int):
+        q = np.ascontiguousarray(np.atleast_2d(q_vecs), dtype=np.float32)
+        scores, idx = self.index.search(q, k)
+        return scores, idx
+
+
+class CategoryIndex:
+    """
+    Two-stage exact search: score the query against one centroid per
+    3-character category, then search only the codes of the top `probe`
+    categories. Falls back to flat search when the categories do not
+    separate (best centroid within `margin` of the first one not probed)
+    or the probed categories hold fewer than k codes.
+    """
+
+    name = "category"
+
+    def __init__(self, embeddings: np.ndarray, category_ids, centroids: np.ndarray, indptr: np.ndarray,
+                 rows: np.ndarray, probe: int = CATEGORY_PROBE, margin: float = CATEGORY_MARGIN):
+        self.embeddings = embeddings
+        self.category_ids = category_ids
+        self.centroids = centroids
+        self.indptr = indptr
+        self.rows = rows
+        self.probe = probe
+        self.margin = margin
+        self.queries = 0
+        self.fallbacks = 0
+
+    @classmethod
+    def load(cls, index_dir: str):
+        emb = np.load(os.path.join(index_dir, EMBEDDINGS_FILE), mmap_mode="r")
+        if not os.path.exists(os.path.join(index_dir, CATEGORY_CENTROIDS_FILE)):
+            print(f"No category centroids in {index_dir}; computing them in memory (rebuild to persist).")
+            code_ids = np.load(os.path.join(index_dir, CODE_IDS_FILE))
+            return cls(emb, *build_categories(emb, code_ids))
+        parts = [np.load(os.path.join(index_dir, f), mmap_mode="r") for f in
+                 (CATEGORY_IDS_FILE, CATEGORY_CENTROIDS_FILE, CATEGORY_INDPTR_FILE, CATEGORY_ROWS_FILE)]
+        return cls(emb, *parts)
+
+    def __len__(self):
+        return self.embeddings.shape[0]
+
+    def search(self, q_vecs: np.ndarray, k: int):
+        q = np.atleast_2d(np.asarray(q_vecs, dtype=np.float32))
+        k = min(k, len(self))
+        self.queries += len(q)
+        if len(self.centroids) <= self.probe:
+            self.fallbacks += len(q)
+            return top_k(q @ self.embeddings.T, k)
+        cat_scores, cat_idx = top_k(q @ self.centroids.T, self.probe + 1)
+        scores = np.full((len(q), k), -np.inf, dtype=np.float32)
+        idx = np.full((len(q), k), -1, dtype=np.int64)
+        flat = []
+        for j in range(len(q)):
+            if cat_scores[j, 0] - cat_scores[j, self.probe] < self.margin:
+                flat.append(j)
+                continue
+            # Sorted, so the gather reads the memory-mapped matrix in order
+            rows = np.sort(np.concatenate([self.rows[self.indptr[c]:self.indptr[c + 1]] for c in cat_idx[j, :self.probe]]))
+            if len(rows) < k:
+                flat.append(j)
+                continue
+            s, i = top_k(self.embeddings[rows] @ q[j], k)
+            scores[j], idx[j] = s[0], rows[i[0]]
+        if flat:
+            self.fallbacks += len(flat)
+            scores[flat], idx[flat] = top_k(q[flat] @ self.embeddings.T, k)
+        return scores, idx
+
+
+def build_categories(embeddings: np.ndarray, code_ids):
+    """
+    (category_ids, centroids, indptr, rows): rows[indptr[c]:indptr[c + 1]]
+    are the embedding rows of category_ids[c]; centroids are unit-norm means.
+    """
+    cats = np.array([category_of(c) for c in code_ids])
+    rows = np.argsort(cats, kind="stable")
+    category_ids, starts = np.unique(cats[rows], return_index=True)
+    indptr = np.append(starts, len(rows)).astype(np.int64)
+    centroids = np.add.reduceat(np.asarray(embeddings, dtype=np.float32)[rows], starts, axis=0)
+    norms = np.linalg.norm(centroids, axis=1, keepdims=True)
+    centroids /= np.where(norms > 0, norms, 1.0)
+    return category_ids, centroids.astype(np.float32), indptr, rows.astype(np.int64)
+
+
+def build_faiss_index(embeddings: np.ndarray, kind: str = "hnsw", hnsw_m: int = 32,
+                      ef_construction: int = 200, pq_m: int = 48):
+    """
+    Builds an inner-product FAISS index ("hnsw" or "ivfpq") over embeddings.
+    """
+    if faiss is None:
+        raise RuntimeError("faiss is not installed")
+    x = np.ascontiguousarray(embeddings, dtype=np.float32)
+    n, dim = x.shape
+    if kind == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, hnsw_m, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = ef_construction
+    elif kind == "ivfpq":
+        # ~39 training points per centroid is FAISS' lower bound
+        nlist = int(max(1, min(4 * np.sqrt(n), n // 39)))
+        if dim % pq_m:
+            pq_m = next(m for m in range(min(pq_m, dim), 0, -1) if dim % m == 0)
+        # 8-bit PQ codebooks need ~10k training points; small catalogs get fewer bits
+        nbits = int(min(8, max(4, np.floor(np.log2(max(n, 1) / 39)))))
+        quantizer = faiss.IndexFlatIP(dim)
+        index = faiss.IndexIVFPQ(quantizer, dim, nlist, pq_m, nbits, faiss.METRIC_INNER_PRODUCT)
+        index.train(x)
+    else:
+        raise ValueError(f"Unknown FAISS index type: {kind}")
+    index.add(x)
+    return index
+
+
+def faiss_config(kind: str):
+    """
+    The FAISS index type and build parameters, recorded in manifest.json so
+    an incremental build notices a changed --faiss-index. None when no FAISS
+    index is written.
+    """
+    if not kind or kind == "none" or faiss is None:
+        return None
+    if kind not in FAISS_PARAMS:
+        raise ValueError(f"Unknown FAISS index type: {kind}")
+    return {"kind": kind, **FAISS_PARAMS[kind]}
+
+
+def write_faiss_index(out_dir: str, embeddings: np.ndarray, kind: str = "hnsw"):
+    """Writes faiss.index, or removes a stale one when kind is "none"."""
+    path = os.path.join(out_dir, FAISS_FILE)
+    if not kind or kind == "none":
+        if os.path.exists(path):
+            os.remove(path)
+        return
+    if faiss is None:
+        print("faiss not installed; skipping FAISS index.")
+        return
+    index = build_faiss_index(embeddings, **faiss_config(kind))
+    faiss.write_index(index, path)
+    print(f"FAISS {kind} index written ({index.ntotal} vectors).")
+
+
+def write_vector_index(out_dir: str, embeddings: np.ndarray, code_ids, faiss_kind: str = "hnsw"):
+    """
+    Writes embeddings.npy, code_ids.npy, the category centroids and (if faiss
+    is available) faiss.index.
+    """
+    emb = np.ascontiguousarray(embeddings, dtype=np.float32)
+    save_npy(os.path.join(out_dir, EMBEDDINGS_FILE), emb)
+    save_npy(os.path.join(out_dir, CODE_IDS_FILE), np.asarray(code_ids, dtype=str))
+    category_ids, centroids, indptr, rows = build_categories(emb, code_ids)
+    for name, arr in ((CATEGORY_IDS_FILE, category_ids), (CATEGORY_CENTROIDS_FILE, centroids),
+                      (CATEGORY_INDPTR_FILE, indptr), (CATEGORY_ROWS_FILE, rows)):
+        save_npy(os.path.join(out_dir, name), arr)
+    print(f"Category centroids written ({len(category_ids)} categories).")
+    write_faiss_index(out_dir, emb, faiss_kind)
+
+
+def load_vector_index(kind: str, index_dir: str):
+    """
+    Loads the in-process engine named by AUTOCODER_VECTOR_BACKEND.
+    Returns (engine, code_ids); code_ids are aligned with engine row ids.
+    """
+    code_ids = np.load(os.path.join(index_dir, CODE_IDS_FILE))
+    if kind == "faiss":
+        return FaissIndex.load(index_dir), code_ids
+    if kind == "numpy":
+        return NumpyIndex.load(index_dir), code_ids
+    if kind == "category":
+        return CategoryIndex.load(index_dir), code_ids
+    if kind == "multi":
+        from .multi_vector import MultiVectorIndex  # imports this module
+        return MultiVectorIndex.load(index_dir, len(code_ids)), code_ids
+    raise ValueError(f"Unknown vector backend: {kind}")
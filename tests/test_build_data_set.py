@@ -0,0 +1,229 @@
+"""
+build_data_set.py description fetcher against a local stub MediaWiki API
+
+Each test starts an http.server stub on a free port and points
+fetch_descriptions at it (what --api-url does on the command line).
+"""
+import asyncio
+import csv
+import functools
+import json
+import os
+import sys
+import threading
+import time
+from email.utils import format_datetime
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts"))
+import build_data_set as bds  # noqa: E402
+from utils.checkpoint import SqliteKV  # noqa: E402
+
+
+def pages(titles):
+    return {"query": {"pages": {str(i): {"title": t, "extract": f"About {t}."} for i, t in enumerate(titles)}}}
+
+
+class StubWiki:
+    """
+    Serves the MediaWiki extracts API. `respond(n, titles)` returns
+    (status, headers, body) for the n-th request; the default answers
+    every title. Logs (start, end, titles) per request and the peak number
+    of requests in flight.
+    """
+
+    def __init__(self, respond=None, delay=0.0):
+        self.respond = respond or (lambda n, titles: (200, {}, pages(titles)))
+        self.delay = delay
+        self.log = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                start = time.monotonic()
+                titles = parse_qs(urlparse(self.path).query)["titles"][0].split("|")
+                with stub.lock:
+                    n = len(stub.log)
+                    stub.log.append([start, None, titles])
+                    stub.in_flight += 1
+                    stub.max_in_flight = max(stub.max_in_flight, stub.in_flight)
+                try:
+                    time.sleep(stub.delay)
+                    status, headers, body = stub.respond(n, titles)
+                    data = body if isinstance(body, bytes) else json.dumps(body).encode()
+                    self.send_response(status)
+                    for k, v in headers.items():
+                        self.send_header(k, v)
+                    self.send_header("Content-Length", str(len(data)))
+                    self.end_headers()
+                    self.wfile.write(data)
+                finally:
+                    with stub.lock:
+                        stub.in_flight -= 1
+                        stub.log[n][1] = time.monotonic()
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_port}/w/api.php"
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def cache(tmp_path):
+    kv = SqliteKV(str(tmp_path / "wiki_cache.sqlite"), table="wiki_extracts")
+    yield kv
+    kv.close()
+
+
+def fetch(stub, titles, cache, **kwargs):
+    kwargs = {"batch_size": 2, "concurrency": 2, "rate": 100.0, **kwargs}
+    return asyncio.run(bds.fetch_descriptions(titles, cache, api_url=stub.url, **kwargs))
+
+
+def titles(n):
+    return [f"Title {i}" for i in range(n)]
+
+
+def test_concurrency_cap(cache):
+    with StubWiki(delay=0.1) as stub:
+        assert fetch(stub, titles(16), cache, concurrency=3) == 0
+    assert len(stub.log) == 8
+    assert stub.max_in_flight == 3
+    assert cache.get_many(titles(16)) == {t: f"About {t}." for t in titles(16)}
+
+
+def http_date(seconds):
+    return format_datetime(datetime.now(timezone.utc) + timedelta(seconds=seconds), usegmt=True)
+
+
+@pytest.mark.parametrize("retry_after", ["1", "date"])
+def test_429_pauses_every_batch(cache, retry_after):
+    def respond(n, batch):
+        # The first burst arrives before the 429 is sent, and no slot frees
+        # up before the client has seen it
+        if n == 0:
+            time.sleep(0.1)
+            # HTTP dates have 1 s resolution: 2 s ahead of sending waits 1 to 2 s
+            header = http_date(2) if retry_after == "date" else retry_after
+            return 429, {"Retry-After": header}, {"error": "too many requests"}
+        time.sleep(0.3)
+        return 200, {}, pages(batch)
+
+    with StubWiki(respond) as stub:
+        assert fetch(stub, titles(12), cache, concurrency=3) == 0
+    throttled_at = stub.log[0][1]
+    later = [start for start, _, _ in stub.log if start > throttled_at]
+    # Every batch (not just the throttled one) waits out Retry-After
+    assert later and min(later) - throttled_at >= 0.9
+    assert len(cache.get_many(titles(12))) == 12
+
+
+def test_maxlag_backs_off_then_succeeds(cache):
+    def respond(n, batch):
+        if n == 0:
+            return 200, {"Retry-After": "1"}, {"error": {"code": "maxlag", "info": "Waiting for a replica"}}
+        return 200, {}, pages(batch)
+
+    with StubWiki(respond) as stub:
+        assert fetch(stub, titles(2), cache, concurrency=1) == 0
+    assert len(stub.log) == 2
+    assert stub.log[1][0] - stub.log[0][1] >= 0.9
+    assert cache.get("Title 0") == "About Title 0."
+
+
+def test_non_json_200_is_retried(cache):
+    def respond(n, batch):
+        if n == 0:
+            return 200, {"Content-Type": "text/html"}, b"<html>proxy error</html>"
+        return 200, {}, pages(batch)
+
+    with StubWiki(respond) as stub:
+        assert fetch(stub, titles(2), cache, concurrency=1) == 0
+    assert len(stub.log) == 2
+    assert cache.get("Title 1") == "About Title 1."
+
+
+def test_retry_after_parsing():
+    class R:
+        def __init__(self, value):
+            self.headers = {} if value is None else {"Retry-After": value}
+
+    assert bds.retry_after(R("7")) == 7
+    assert bds.retry_after(R(None)) == 5
+    assert bds.retry_after(R("soon")) == 5
+    assert bds.retry_after(R("600")) == 60
+    assert 8 <= bds.retry_after(R(http_date(10))) <= 10
+    assert bds.retry_after(R(http_date(-30))) == 0
+
+
+def test_failed_batches_resume_from_checkpoint(cache, monkeypatch):
+    # One attempt per batch, so the failing run gives up quickly
+    monkeypatch.setattr(bds, "wiki_summary_batch", functools.partial(bds.wiki_summary_batch, max_retries=1))
+    names = titles(6)
+    broken = {"Title 2", "Title 3"}
+
+    def flaky(n, batch):
+        if broken & set(batch):
+            return 500, {}, {"error": "internal"}
+        return 200, {}, pages(batch)
+
+    with StubWiki(flaky) as stub:
+        assert fetch(stub, names, cache) == 2
+    assert set(cache.get_many(names)) == set(names) - broken
+
+    # Second run: only the failed batch is requested again
+    with StubWiki() as stub:
+        assert fetch(stub, names, cache) == 0
+    assert [sorted(b) for _, _, b in stub.log] == [sorted(broken)]
+    assert cache.get_many(names) == {t: f"About {t}." for t in names}
+
+
+ROWS = [["code", "title", "description", "synonym"],
+        ["A000", "Cholera", "Cholera is an infection", "diarrhea; vomiting"],
+        ["A001", "Typhoid", "Spread by\nfood, water", "fever;\n\nnote: multi-line"]]
+
+
+@pytest.mark.parametrize("cut", [
+    b"A002,Paraty",                  # mid-row, no newline yet
+    b"A002,Paratyphoid,",            # right after a separator
+    b'A002,Paratyphoid,"Salmon\n',   # inside a quoted multi-line field
+    b"A002,Parat\xc3",               # inside a UTF-8 sequence
+])
+def test_resume_drops_partial_last_row(tmp_path, cut):
+    path = tmp_path / "synonyms.csv"
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        csv.writer(f).writerows(ROWS)
+    complete = path.read_bytes()
+    with open(path, "ab") as f:
+        f.write(cut)
+
+    assert bds._read_done_codes(str(path)) == {"A000", "A001"}
+    assert path.read_bytes() == complete
+    assert bds._read_done_codes(str(path)) == {"A000", "A001"}
+
+
+def test_resume_keeps_complete_file(tmp_path):
+    path = tmp_path / "synonyms.csv"
+    assert bds._read_done_codes(str(path)) == set()
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        csv.writer(f).writerows(ROWS)
+    complete = path.read_bytes()
+    assert bds._read_done_codes(str(path)) == {"A000", "A001"}
+    assert path.read_bytes() == complete
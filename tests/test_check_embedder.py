@@ -0,0 +1,44 @@
+"""
+Top-k overlap of the ONNX / int8 query embedders with the fp32 torch baseline
+
+The same check as scripts/check_embedder.py, against AUTOCODER_INDEX_DIR
+(default data/index) and AUTOCODER_MODEL_NAME. Skipped when the index, its
+ONNX export (build_index.py --export-onnx) or the model is not available.
+"""
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "scripts"))
+from check_embedder import query_notes, topk_overlap  # noqa: E402
+from utils.embedder import ONNX_FILE, ONNX_INT8_FILE, default_onnx_dir, load_embedder  # noqa: E402
+from utils.vector_index import NumpyIndex  # noqa: E402
+
+INDEX_DIR = os.getenv("AUTOCODER_INDEX_DIR", os.path.join(ROOT, "data", "index"))
+MODEL_NAME = os.getenv("AUTOCODER_MODEL_NAME", "sentence-transformers/all-MiniLM-L6-v2")
+SEEDS = os.path.join(ROOT, "evals", "seeds.jsonl")
+K = 10
+MIN_OVERLAP = 0.9
+
+
+@pytest.fixture(scope="module")
+def baseline():
+    if not os.path.exists(os.path.join(INDEX_DIR, "embeddings.npy")):
+        pytest.skip(f"no index in {INDEX_DIR}")
+    try:
+        return load_embedder(MODEL_NAME, "torch")
+    except Exception as e:  # not installed, not downloaded, offline
+        pytest.skip(f"cannot load {MODEL_NAME}: {e}")
+
+
+@pytest.mark.parametrize("backend, onnx_file", [("onnx", ONNX_FILE), ("onnx-int8", ONNX_INT8_FILE)])
+def test_onnx_topk_overlap(baseline, backend, onnx_file):
+    onnx_dir = default_onnx_dir(INDEX_DIR)
+    if not os.path.exists(os.path.join(onnx_dir, onnx_file)):
+        pytest.skip(f"no {onnx_file} in {onnx_dir}")
+    candidate = load_embedder(MODEL_NAME, backend, onnx_dir)
+    notes = query_notes(INDEX_DIR, SEEDS, sample=200)
+    report = topk_overlap(NumpyIndex.load(INDEX_DIR), baseline, candidate, notes, K)
+    assert report["mean_overlap"] >= MIN_OVERLAP, report
@@ -0,0 +1,31 @@
+"""
+Query-side note preprocessing: alias expansion and negation scoping
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "scripts"))
+from utils.preprocess import prepare_note  # noqa: E402
+
+
+@pytest.mark.parametrize("note, text, negated", [
+    ("Acute low back pain after lifting box, no radiculopathy", "acute low back pain after lifting box", ["radiculopathy"]),
+    # A comma or semicolon ends the scope of a trigger before it ...
+    ("No fever, chest pain and cough", "chest pain and cough", ["fever"]),
+    ("Denies nausea; abdominal pain", "abdominal pain", ["nausea"]),
+    # ... and of a post-trigger after it
+    ("Productive cough, pneumonia unlikely", "productive cough", ["pneumonia"]),
+    ("Cough and no fever", "cough and", ["fever"]),
+])
+def test_negation_scope(note, text, negated):
+    prepared = prepare_note(note)
+    assert prepared.text == text
+    assert prepared.negated == negated
+
+
+def test_aliases_do_not_add_negation_triggers():
+    prepared = prepare_note("NAD, chest pain radiating to arm")
+    assert prepared.negated == []
+    assert "chest pain radiating" in prepared.text
@@ -0,0 +1,22 @@
+"""
+Result-cache keys in backend/query_cache.py
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from backend.query_cache import QueryCache  # noqa: E402
+from scripts.utils.preprocess import prepare_note  # noqa: E402
+
+
+def key(cache, note, **params):
+    return cache.result_key(prepare_note(note).chunks, {"top_k": 5, **params})
+
+
+def test_result_key_follows_negation_scope():
+    cache = QueryCache("v1", "model", url="")
+    # Same normalize_text, different negated spans, so different results
+    assert key(cache, "No fever chest pain and cough") != key(cache, "No fever. Chest pain and cough")
+    assert key(cache, "No fever. Chest pain and cough") == key(cache, "no fever.  chest pain and cough")
+    assert key(cache, "chest pain") != key(cache, "chest pain", top_k=3)
+    assert key(cache, "chest pain") != key(QueryCache("v2", "model", url=""), "chest pain")
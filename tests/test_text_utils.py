@@ -0,0 +1,35 @@
+"""
+Column-wise text normalization in scripts/utils/text_utils.py
+"""
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "scripts"))
+from utils.text_utils import normalize_series, normalize_text  # noqa: E402
+
+CASES = [
+    "", "   ", "HTN f/u", "htn f/u.", "Pt c/o SOB & CP x2 days", "s/p MVC, LLE pain",
+    "N/V/D since yesterday", "n v d", "hx of T2DM; PMH HTN", "temp 38.5C\tHR 110\nRR 22",
+    "lit. 'to scratch'", "Ménière's disease — vertigo", "under_score and 12/05/2024",
+    "c o chest pain r o MI", "ccp", "f u in 2 wks",
+]
+
+
+def test_normalize_series_matches_normalize_text():
+    s = pd.Series(CASES + [None, float("nan")])
+    expected = [normalize_text(v) for v in CASES] + ["", ""]
+    assert normalize_series(s).tolist() == expected
+
+
+@pytest.mark.parametrize("column", ["title", "description", "synonym"])
+def test_normalize_series_matches_on_catalog(column):
+    path = os.path.join(ROOT, "data", "icd10_with_synonmym.csv")
+    if not os.path.exists(path):
+        pytest.skip(f"no {path}")
+    s = pd.read_csv(path, usecols=[column])[column]
+    expected = [normalize_text(v) for v in s.fillna("").astype(str)]
+    assert normalize_series(s).tolist() == expected